@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+
+# Benchmarks whose regressions fail the gate. A hot path matches a benchmark name
+# exactly or as a prefix followed by an "[...]" variant, e.g. run_extraction[naive].
+DEFAULT_HOT_PATHS = ['run_extraction', 'load_and_prepare_data', 'extract_entities']
+DEFAULT_THRESHOLD_PCT = 10.0
+
+def load_results(path):
+    """
+    Load a benchmark results file written by run_benchmarks.py.
+
+    Returns:
+        tuple: (meta, results_by_key)
+    """
+    with open(path, 'r') as f:
+        report = json.load(f)
+    return report.get('meta', {}), {result['key']: result for result in report.get('results', [])}
+
+def is_hot_path(name, hot_paths):
+    """Check whether a benchmark name belongs to one of the hot paths."""
+    return any(name == hot or name.startswith(hot + '[') for hot in hot_paths)
+
+def per_item_stats(result):
+    """
+    Compute the median and interquartile range of the per-item time across repeats.
+
+    Normalising by the number of items keeps runs comparable when, for example,
+    the custom extractor note cap differs between the two runs.
+
+    Returns:
+        tuple: (median_s, iqr_s, repeats)
+    """
+    times = np.array(result['repeat_times_s'], dtype=float) / max(result['items'], 1)
+    q1, median, q3 = np.percentile(times, [25, 50, 75])
+    return float(median), float(q3 - q1), len(times)
+
+def compare_results(baseline, current, threshold_pct, noise_factor, hot_paths):
+    """
+    Compare two sets of benchmark results.
+
+    A benchmark is flagged as a regression only if its median per-item time grew by
+    more than `threshold_pct` percent AND the absolute change exceeds the run-to-run
+    noise, taken as `noise_factor` times the larger of the two IQRs.
+
+    Args:
+        baseline (dict): Baseline results keyed by benchmark key.
+        current (dict): Current results keyed by benchmark key.
+        threshold_pct (float): Allowed slowdown in percent.
+        noise_factor (float): Multiplier on the IQR used as the noise floor.
+        hot_paths (list): Benchmark names that gate the exit status.
+
+    Returns:
+        list: One comparison dict per benchmark key.
+    """
+    comparisons = []
+    for key in sorted(set(baseline) | set(current)):
+        base = baseline.get(key)
+        cur = current.get(key)
+        name = (base or cur)['name']
+        entry = {'key': key, 'name': name, 'hot_path': is_hot_path(name, hot_paths)}
+
+        if base is None or cur is None:
+            entry['status'] = 'missing_in_baseline' if base is None else 'missing_in_current'
+            comparisons.append(entry)
+            continue
+
+        base_median, base_iqr, base_repeats = per_item_stats(base)
+        cur_median, cur_iqr, cur_repeats = per_item_stats(cur)
+        change_pct = (cur_median - base_median) / base_median * 100 if base_median > 0 else 0.0
+        noise = noise_factor * max(base_iqr, cur_iqr)
+        delta = cur_median - base_median
+
+        if change_pct > threshold_pct and delta > noise:
+            status = 'regression'
+        elif change_pct < -threshold_pct and -delta > noise:
+            status = 'improvement'
+        elif abs(change_pct) > threshold_pct:
+            status = 'within_noise'
+        else:
+            status = 'unchanged'
+
+        entry.update({
+            'status': status,
+            'baseline_median_ms': base_median * 1000,
+            'current_median_ms': cur_median * 1000,
+            'baseline_iqr_ms': base_iqr * 1000,
+            'current_iqr_ms': cur_iqr * 1000,
+            'baseline_repeats': base_repeats,
+            'current_repeats': cur_repeats,
+            'change_pct': change_pct,
+            'speedup': base_median / cur_median if cur_median > 0 else None
+        })
+        comparisons.append(entry)
+    return comparisons
+
+def print_comparison(comparisons, threshold_pct):
+    """Print a per-benchmark comparison table."""
+    print(f"\nPer-item median time (threshold: {threshold_pct:.1f}%, * = hot path)")
+    print(f"  {'Benchmark':<42} {'Base (ms)':>11} {'Curr (ms)':>11} {'Change':>9} {'Speedup':>8}  Status")
+    for entry in comparisons:
+        marker = '*' if entry['hot_path'] else ' '
+        if 'change_pct' not in entry:
+            print(f"{marker} {entry['key']:<42} {'-':>11} {'-':>11} {'-':>9} {'-':>8}  {entry['status']}")
+            continue
+        speedup = f"{entry['speedup']:.2f}x" if entry['speedup'] else '-'
+        print(f"{marker} {entry['key']:<42} {entry['baseline_median_ms']:>11.4f} {entry['current_median_ms']:>11.4f} "
+              f"{entry['change_pct']:>+8.1f}% {speedup:>8}  {entry['status']}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare two benchmark result files and fail on hot-path regressions."
+    )
+    parser.add_argument('baseline', help="Baseline results JSON (e.g. from the last release).")
+    parser.add_argument('current', help="Current results JSON.")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD_PCT,
+                        help="Allowed slowdown in percent before a hot path fails the gate.")
+    parser.add_argument('--noise-factor', type=float, default=1.0,
+                        help="Multiple of the repeat IQR a change must exceed to count.")
+    parser.add_argument('--hot-paths', default=','.join(DEFAULT_HOT_PATHS),
+                        help="Comma-separated benchmark names that gate the exit status.")
+    parser.add_argument('--min-repeats', type=int, default=3,
+                        help="Warn when either run has fewer repeats than this (IQR is unreliable).")
+    parser.add_argument('--output', default=None, help="Optional path to save the comparison as JSON.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    hot_paths = [h.strip() for h in args.hot_paths.split(',') if h.strip()]
+
+    baseline_meta, baseline = load_results(args.baseline)
+    current_meta, current = load_results(args.current)
+    print(f"Baseline: {args.baseline} (commit {str(baseline_meta.get('git_commit'))[:8]})")
+    print(f"Current:  {args.current} (commit {str(current_meta.get('git_commit'))[:8]})")
+
+    comparisons = compare_results(baseline, current, args.threshold, args.noise_factor, hot_paths)
+    print_comparison(comparisons, args.threshold)
+
+    few_repeats = [c['key'] for c in comparisons
+                   if 'change_pct' in c and min(c['baseline_repeats'], c['current_repeats']) < args.min_repeats]
+    if few_repeats:
+        print(f"\nWarning: fewer than {args.min_repeats} repeats for {len(few_repeats)} benchmark(s); "
+              f"noise estimates may be unreliable.")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'baseline': args.baseline, 'current': args.current, 'threshold_pct': args.threshold,
+                       'comparisons': comparisons}, f, indent=2)
+
+    regressions = [c for c in comparisons if c['hot_path'] and c['status'] == 'regression']
+    if regressions:
+        print(f"\nFAILED: {len(regressions)} hot-path regression(s) beyond {args.threshold:.1f}%:")
+        for c in regressions:
+            print(f"  {c['key']}: {c['change_pct']:+.1f}%")
+        return 1
+
+    print("\nPASSED: no hot-path regressions.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,409 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+
+import numpy as np
+
+# Silence tqdm progress bars inside the benchmarked functions
+# (must be set before tqdm is imported by the project modules)
+os.environ.setdefault('TQDM_DISABLE', '1')
+
+# Adjust relative paths for imports since run_benchmarks.py is in benchmarks/
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+import config
+from utils.settings import load_settings
+from data.synthetic_data_generator import generate_dataset
+from utils.extraction_utils import (
+    extract_entities,
+    parse_date_string,
+    load_and_prepare_data,
+    load_real_data,
+    run_extraction,
+    calculate_and_report_metrics
+)
+from extractors.naive_extractor import NaiveExtractor
+
+DEFAULT_SIZES = [100, 10000, 100000]
+DEFAULT_OUTPUT_DIR = os.path.join(project_root, 'benchmarks', 'results')
+ALL_BENCHMARKS = [
+    'extract_entities',
+    'parse_date_string',
+    'naive_extractor',
+    'custom_extractor',
+    'load_real_data',
+    'calculate_and_report_metrics',
+    'run_extraction',
+    'load_and_prepare_data'
+]
+
+@contextmanager
+def quiet():
+    """Context manager that discards stdout from the benchmarked code."""
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        yield
+
+def make_settings(**overrides):
+    """
+    Resolve the run settings (config.py, PITUITARY_* environment variables) and apply
+    overrides, so benchmarks never mutate the shared config module.
+    """
+    return load_settings().replace(**overrides)
+
+def get_git_info():
+    """
+    Get the current git commit and whether the working tree has local changes.
+
+    Returns:
+        dict: {'commit': str or None, 'dirty': bool or None}
+    """
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=project_root, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+        status = subprocess.check_output(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=project_root,
+            stderr=subprocess.DEVNULL, text=True
+        )
+        return {'commit': commit, 'dirty': bool(status.strip())}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+def build_corpus(size, seed, min_sections, max_sections):
+    """
+    Build a synthetic corpus with the project's data generator.
+
+    Returns:
+        list: Dataset entries as produced by generate_dataset().
+    """
+    random.seed(seed)
+    return generate_dataset(num_notes=size, min_sections=min_sections, max_sections=max_sections)
+
+def time_items(func, items, repeats, warmup):
+    """
+    Call func once per item, `repeats` times over the whole list.
+
+    Args:
+        func (callable): Function taking a single item.
+        items (list): Inputs to benchmark.
+        repeats (int): Number of timed passes over the items.
+        warmup (int): Number of items to run untimed before the first pass.
+
+    Returns:
+        tuple: (repeat_times, latencies) - total seconds per pass and per-call seconds.
+    """
+    with quiet():
+        for item in items[:warmup]:
+            func(item)
+
+    repeat_times = []
+    latencies = []
+    with quiet():
+        for _ in range(repeats):
+            pass_start = time.perf_counter()
+            for item in items:
+                start = time.perf_counter()
+                func(item)
+                latencies.append(time.perf_counter() - start)
+            repeat_times.append(time.perf_counter() - pass_start)
+    return repeat_times, latencies
+
+def time_calls(func, repeats, warmup):
+    """
+    Time a whole-dataset call `repeats` times.
+
+    Returns:
+        tuple: (repeat_times, latencies) - identical lists of per-call seconds.
+    """
+    with quiet():
+        for _ in range(warmup):
+            func()
+
+    repeat_times = []
+    with quiet():
+        for _ in range(repeats):
+            start = time.perf_counter()
+            func()
+            repeat_times.append(time.perf_counter() - start)
+    return repeat_times, list(repeat_times)
+
+def summarize(name, size, unit, num_items, repeat_times, latencies):
+    """
+    Summarize raw timings into throughput and latency percentiles.
+
+    Returns:
+        dict: JSON-serializable benchmark result.
+    """
+    latencies_ms = np.array(latencies) * 1000.0
+    median_time = float(np.median(repeat_times))
+    return {
+        'name': name,
+        'size': size,
+        'key': f"{name}@{size}",
+        'unit': unit,
+        'items': num_items,
+        'repeat_times_s': [float(t) for t in repeat_times],
+        'median_time_s': median_time,
+        'throughput_per_s': num_items / median_time if median_time > 0 else None,
+        'latency_ms': {
+            'mean': float(latencies_ms.mean()),
+            'p50': float(np.percentile(latencies_ms, 50)),
+            'p90': float(np.percentile(latencies_ms, 90)),
+            'p99': float(np.percentile(latencies_ms, 99)),
+            'max': float(latencies_ms.max())
+        }
+    }
+
+def write_real_data_csv(corpus, csv_path):
+    """
+    Write a synthetic corpus to a CSV in the real-data layout expected by load_real_data
+    (pre-annotated disorders and dates plus a JSON gold standard column).
+    """
+    import pandas as pd
+
+    rows = []
+    with quiet():
+        for entry in corpus:
+            text = entry['clinical_note']
+            diagnoses, dates = extract_entities(text)
+            rows.append({
+                config.REAL_DATA_TEXT_COLUMN: text,
+                config.REAL_DATA_DIAGNOSES_COLUMN: repr([{'label': d, 'start': pos} for d, pos in diagnoses]),
+                config.REAL_DATA_DATES_COLUMN: repr([{'parsed': p, 'original': raw, 'start': pos} for p, raw, pos in dates]),
+                config.REAL_DATA_GOLD_COLUMN: json.dumps([
+                    {'date': section['date'], 'diagnoses': section['diagnoses']}
+                    for section in entry['ground_truth']
+                ]),
+                config.REAL_DATA_TIMESTAMP_COLUMN: datetime(2025, 1, 1).strftime('%Y-%m-%d')
+            })
+    pd.DataFrame(rows).to_csv(csv_path, index=False)
+
+def load_custom_extractor():
+    """
+    Create a CPU CustomExtractor. Uses the trained weights when available, otherwise
+    random weights of the same architecture (throughput does not depend on the weights).
+
+    Returns:
+        tuple: (extractor, weights) where weights is 'trained' or 'random', or (None, None).
+    """
+    import torch
+    from extractors.custom_extractor import CustomExtractor
+    from model_training.DiagnosisDateRelationModel import DiagnosisDateRelationModel
+    from model_training.Vocabulary import Vocabulary
+    from model_training.training_config import EMBEDDING_DIM, HIDDEN_DIM
+
+    settings = make_settings(
+        DEVICE=torch.device('cpu'),
+        MODEL_PATH=os.path.join(project_root, config.MODEL_PATH),
+        VOCAB_PATH=os.path.join(project_root, config.VOCAB_PATH)
+    )
+    extractor = CustomExtractor(settings)
+    if os.path.exists(settings.MODEL_PATH):
+        with quiet():
+            loaded = extractor.load()
+        return (extractor, 'trained') if loaded else (None, None)
+
+    if not os.path.exists(settings.VOCAB_PATH):
+        return None, None
+    with torch.serialization.safe_globals([Vocabulary]):
+        extractor.vocab = torch.load(settings.VOCAB_PATH, weights_only=False)
+    extractor.model = DiagnosisDateRelationModel(
+        vocab_size=extractor.vocab.n_words,
+        embedding_dim=EMBEDDING_DIM,
+        hidden_dim=HIDDEN_DIM
+    )
+    extractor.model.eval()
+    return extractor, 'random'
+
+def run_benchmarks_for_size(corpus, size, selected, args, work_dir):
+    """
+    Run the selected benchmarks on one corpus.
+
+    Returns:
+        list: Benchmark result dicts.
+    """
+    results = []
+    notes = [entry['clinical_note'] for entry in corpus]
+    with quiet():
+        entities = [extract_entities(note) for note in notes]
+    prepared = [{'note': note, 'entities': ents} for note, ents in zip(notes, entities)]
+
+    if 'extract_entities' in selected:
+        print(f"  extract_entities ({len(notes)} notes)")
+        repeat_times, latencies = time_items(extract_entities, notes, args.repeats, args.warmup)
+        results.append(summarize('extract_entities', size, 'note', len(notes), repeat_times, latencies))
+
+    if 'parse_date_string' in selected:
+        raw_dates = [raw for _, dates in entities for _, raw, _ in dates]
+        print(f"  parse_date_string ({len(raw_dates)} date strings)")
+        repeat_times, latencies = time_items(parse_date_string, raw_dates, args.repeats, args.warmup)
+        results.append(summarize('parse_date_string', size, 'date', len(raw_dates), repeat_times, latencies))
+
+    if 'naive_extractor' in selected:
+        extractor = NaiveExtractor(config)
+        print(f"  naive_extractor ({len(prepared)} notes)")
+        repeat_times, latencies = time_items(
+            lambda entry: extractor.extract(entry['note'], entities=entry['entities']),
+            prepared, args.repeats, args.warmup
+        )
+        results.append(summarize('naive_extractor', size, 'note', len(prepared), repeat_times, latencies))
+
+    if 'custom_extractor' in selected:
+        extractor, weights = load_custom_extractor()
+        if extractor is None:
+            print("  custom_extractor skipped: model or vocabulary not available")
+        else:
+            subset = prepared[:args.custom_max_notes]
+            print(f"  custom_extractor ({len(subset)} notes, {weights} weights, CPU)")
+            repeat_times, latencies = time_items(
+                lambda entry: extractor.extract(entry['note'], entities=entry['entities']),
+                subset, args.repeats, args.warmup
+            )
+            result = summarize('custom_extractor', size, 'note', len(subset), repeat_times, latencies)
+            result['weights'] = weights
+            results.append(result)
+
+    if 'load_real_data' in selected:
+        csv_path = os.path.join(work_dir, f"real_data_{size}.csv")
+        write_real_data_csv(corpus, csv_path)
+        settings = make_settings(
+            DATA_SOURCE='sample',
+            SAMPLE_DATA_PATH=csv_path,
+            ENABLE_RELATIVE_DATE_EXTRACTION=False
+        )
+        print(f"  load_real_data ({len(corpus)} rows)")
+        repeat_times, latencies = time_calls(lambda: load_real_data(settings, None), args.repeats, 0)
+        results.append(summarize('load_real_data', size, 'note', len(corpus), repeat_times, latencies))
+
+    if 'calculate_and_report_metrics' in selected:
+        gold_standard = [
+            {'note_id': i, 'diagnosis': diag['diagnosis'].lower(), 'date': section['date']}
+            for i, entry in enumerate(corpus)
+            for section in entry['ground_truth']
+            for diag in section['diagnoses']
+        ]
+        with quiet():
+            predictions = run_extraction(NaiveExtractor(config), prepared)
+        metrics_dir = os.path.join(work_dir, 'metrics')
+        print(f"  calculate_and_report_metrics ({len(predictions)} predictions, {len(gold_standard)} gold)")
+        repeat_times, latencies = time_calls(
+            lambda: calculate_and_report_metrics(predictions, gold_standard, 'benchmark', metrics_dir, len(prepared)),
+            args.repeats, 0
+        )
+        result = summarize('calculate_and_report_metrics', size, 'note', len(prepared), repeat_times, latencies)
+        result['predictions'] = len(predictions)
+        result['gold_relationships'] = len(gold_standard)
+        results.append(result)
+
+    if 'run_extraction' in selected:
+        # End-to-end prediction loop (including date parsing/normalisation) per extractor
+        print(f"  run_extraction[naive] ({len(prepared)} notes)")
+        naive = NaiveExtractor(config)
+        repeat_times, latencies = time_calls(lambda: run_extraction(naive, prepared), args.repeats, 0)
+        results.append(summarize('run_extraction[naive]', size, 'note', len(prepared), repeat_times, latencies))
+
+        extractor, weights = load_custom_extractor()
+        if extractor is None:
+            print("  run_extraction[custom] skipped: model or vocabulary not available")
+        else:
+            subset = prepared[:args.custom_max_notes]
+            print(f"  run_extraction[custom] ({len(subset)} notes, {weights} weights, CPU)")
+            repeat_times, latencies = time_calls(lambda: run_extraction(extractor, subset), args.repeats, 0)
+            result = summarize('run_extraction[custom]', size, 'note', len(subset), repeat_times, latencies)
+            result['weights'] = weights
+            results.append(result)
+
+    if 'load_and_prepare_data' in selected:
+        json_path = os.path.join(work_dir, f"synthetic_{size}.json")
+        with open(json_path, 'w') as f:
+            json.dump(corpus, f)
+        settings = make_settings(DATA_SOURCE='synthetic', SYNTHETIC_DATASET_PATH=json_path)
+        print(f"  load_and_prepare_data[synthetic] ({len(corpus)} notes)")
+        repeat_times, latencies = time_calls(
+            lambda: load_and_prepare_data(json_path, None, settings), args.repeats, 0
+        )
+        results.append(summarize('load_and_prepare_data[synthetic]', size, 'note', len(corpus), repeat_times, latencies))
+
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark extractors and utilities on synthetic corpora.")
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help="Comma-separated corpus sizes (number of notes).")
+    parser.add_argument('--benchmarks', default=','.join(ALL_BENCHMARKS),
+                        help=f"Comma-separated benchmarks to run. Options: {', '.join(ALL_BENCHMARKS)}")
+    parser.add_argument('--repeats', type=int, default=3, help="Timed passes per benchmark.")
+    parser.add_argument('--warmup', type=int, default=20, help="Untimed warm-up calls per benchmark.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for corpus generation.")
+    parser.add_argument('--min-sections', type=int, default=3, help="Minimum sections per note.")
+    parser.add_argument('--max-sections', type=int, default=8, help="Maximum sections per note.")
+    parser.add_argument('--custom-max-notes', type=int, default=1000,
+                        help="Cap on notes used for the CustomExtractor benchmark.")
+    parser.add_argument('--output', default=None,
+                        help="Path of the JSON results file (default: benchmarks/results/<timestamp>_<commit>.json).")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    selected = [b.strip() for b in args.benchmarks.split(',') if b.strip()]
+    unknown = [b for b in selected if b not in ALL_BENCHMARKS]
+    if unknown:
+        print(f"Error: Unknown benchmarks: {', '.join(unknown)}. Options are: {', '.join(ALL_BENCHMARKS)}")
+        return 2
+
+    git_info = get_git_info()
+    started_at = datetime.now()
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in sizes:
+            print(f"\nGenerating corpus of {size} notes ({args.min_sections}-{args.max_sections} sections per note)...")
+            corpus = build_corpus(size, args.seed, args.min_sections, args.max_sections)
+            results.extend(run_benchmarks_for_size(corpus, size, selected, args, work_dir))
+
+    report = {
+        'meta': {
+            'started_at': started_at.isoformat(timespec='seconds'),
+            'git_commit': git_info['commit'],
+            'git_dirty': git_info['dirty'],
+            'python_version': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'sizes': sizes,
+            'repeats': args.repeats,
+            'warmup': args.warmup,
+            'seed': args.seed,
+            'min_sections': args.min_sections,
+            'max_sections': args.max_sections
+        },
+        'results': results
+    }
+
+    output_path = args.output
+    if output_path is None:
+        commit = (git_info['commit'] or 'nogit')[:8]
+        output_path = os.path.join(DEFAULT_OUTPUT_DIR, f"{started_at.strftime('%Y%m%d_%H%M%S')}_{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print("\nBenchmark results:")
+    print(f"  {'Benchmark':<40} {'Items':>8} {'Items/s':>12} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for result in results:
+        throughput = f"{result['throughput_per_s']:.1f}" if result['throughput_per_s'] else '-'
+        print(f"  {result['key']:<40} {result['items']:>8} {throughput:>12} "
+              f"{result['latency_ms']['p50']:>10.3f} {result['latency_ms']['p99']:>10.3f}")
+    print(f"\nSaved benchmark results to {output_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
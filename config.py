@@ -1,8 +1,10 @@
 import torch
 
 # --- Execution Settings --- #
-# Mode to run when main.py is executed.
-# Valid options: 'single', 'evaluate', 'compare'
+# Mode to run when main.py is executed without a subcommand.
+# Valid options: 'single', 'evaluate', 'compare', 'relative-dates', 'train', 'bench', 'serve'
+# Any setting in this file can be overridden per run with a PITUITARY_<NAME> environment
+# variable or main.py command-line flags (see `python main.py --help`).
 RUN_MODE = 'evaluate'
 
 # Extraction method to use (relevant for 'single' and 'evaluate' modes).
@@ -16,10 +18,35 @@ COMPARISON_METHODS = ['naive']
 # Specifies the source of the data to be used.
 # Valid options: 'synthetic', 'imaging', 'notes', 'letters', 'sample'
 DATA_SOURCE = 'sample'  # Example: 'imaging', 'notes', 'letters', 'synthetic', or 'sample'
+# Optional explicit dataset path; when set it takes precedence over the DATA_SOURCE path below
+DATASET_PATH = None
+
+# --- Output Settings --- #
+EXPERIMENT_OUTPUT_DIR = 'experiment_outputs'  # Metrics, plots and profiling reports (relative to the project root)
+WRITE_PREDICTIONS_TO_CSV = True               # Write predictions and extracted relative dates back into the source CSV (disable for concurrent jobs)
 
 # --- Debug Settings --- #
 DEBUG_MODE = False  # Set to True for verbose logging during API calls and data processing
 
+# --- Profiling Settings --- #
+# Record wall time, CPU time, notes/sec and peak RSS per pipeline stage and write
+# a JSON report to experiment_outputs/ (<DATA_SOURCE>_<RUN_MODE>_profile.json)
+ENABLE_PROFILING = True
+
+# --- Evaluation Settings --- #
+# Note-level bootstrap confidence intervals for precision/recall/F1 (0 disables them)
+BOOTSTRAP_RESAMPLES = 1000
+BOOTSTRAP_CONFIDENCE = 0.95
+BOOTSTRAP_WORKERS = 1   # Worker processes for resampling (results are identical for any value)
+BOOTSTRAP_SEED = 42
+# Sweep the prediction confidence threshold after inference and save precision-recall
+# curves (average precision, best-F1 threshold) next to the confusion matrices
+ENABLE_PR_CURVES = True
+# How queued plots are rendered (figures are never drawn on the critical path):
+# 'background' - detached Agg renderer process, 'inline' - before the run returns,
+# 'deferred' - only write plot specs; render later with `python -m utils.reporting_utils`
+PLOT_MODE = 'background'
+
 # --- Real Data File Paths (used if DATA_SOURCE is not 'synthetic') --- #
 IMAGING_DATA_PATH = 'data/processed_notes_with_dates_and_disorders_imaging.csv'
 NOTES_DATA_PATH = 'data/processed_notes_with_dates_and_disorders_notes.csv'
@@ -38,32 +65,121 @@ REAL_DATA_TIMESTAMP_COLUMN = 'document_timestamp'   # Column containing document
 PREDICTION_MAX_DISTANCE = 500 
 # Max sequence length used by custom_extractor when creating input tensors
 PREDICTION_MAX_CONTEXT_LEN = 512
+# Minimum confidence for custom_extractor to keep a diagnosis' best date (0.0 keeps all).
+# Pick a value from the best-F1 threshold reported by the PR curve sweep.
+PREDICTION_CONFIDENCE_THRESHOLD = 0.0
+# Number of candidate diagnosis-date pairs scored per forward pass by custom_extractor
+PREDICTION_BATCH_SIZE = 256
+
+# --- Section Segmentation Settings --- #
+# Notes are split into sections at blank lines and header cues (e.g. "F/U (12/03/24):"), see
+# utils/segmentation_utils.py. Restrict the candidate diagnosis-date pairs of the naive, custom and
+# LLM extractors to the same section ('same'), the same or adjacent sections ('adjacent'), or not at all ('off').
+SECTION_RESTRICTION = 'off'
 
 # --- Naive (proximity) Extractor Parameters --- #
 PROXIMITY_MAX_DISTANCE = 200  
 
 # --- LLM (OpenAI) Extractor Parameters --- #
 OPENAI_MODEL = 'gpt-4o'
+# Request a strict JSON schema (response_format) restricted to each note's diagnoses and raw dates.
+# Needs a model with structured output support (e.g. gpt-4o, gpt-4o-mini).
+LLM_STRUCTURED_OUTPUT = True
+# Send only the text windows around entity mentions, with short IDs ([D1], [T1]) marking the
+# mentions, instead of the whole note plus entity lists. Token savings are reported per run.
+# Off by default: results with the full-note prompt stay comparable with earlier runs until
+# the compact prompt's accuracy has been checked on the same notes.
+LLM_COMPACT_PROMPT = False
+LLM_PROMPT_WINDOW_CHARS = 150   # Characters of context kept on each side of a mention
+# Pack several short notes into one request (up to a prompt token budget / note count), with
+# results returned per note number. Only applies when notes are batched (MICRO_BATCH_MAX_SIZE > 1).
+LLM_PACK_NOTES = False
+LLM_PACK_MAX_PROMPT_TOKENS = 4000
+LLM_PACK_MAX_NOTES = 8
+LLM_PACK_MAX_OUTPUT_TOKENS = 4000  # Estimated response token budget per packed request
+# Shared HTTP connection pool for all OpenAI calls (LLM extractor, relative dates, batch jobs).
+# HTTP/2 is used when the optional h2 package is installed (pip install 'httpx[http2]').
+OPENAI_HTTP_MAX_CONNECTIONS = 20
+OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+OPENAI_HTTP_KEEPALIVE_EXPIRY_SECONDS = 30.0
+OPENAI_HTTP_TIMEOUT_SECONDS = 60.0
+OPENAI_HTTP_CONNECT_TIMEOUT_SECONDS = 10.0
+OPENAI_HTTP2 = True
+OPENAI_MAX_RETRIES = 2
+# Estimated cost in the LLM usage report: USD per million (prompt, completion) tokens, overriding the
+# defaults in utils/llm_usage_utils.py, e.g. {'gpt-4o': (2.50, 10.00)}. Batch jobs are charged at half price.
+LLM_PRICING = {}
 
 # --- Llama Extractor Parameters --- #
 LLAMA_MODEL_PATH = './Llama-3.2-3B-Instruct'
+LLAMA_BATCH_SIZE = 4               # Notes generated together per model.generate() call (left-padded)
+# Output budget per note: LLAMA_BASE_NEW_TOKENS + LLAMA_TOKENS_PER_DIAGNOSIS * diagnoses, capped at LLAMA_MAX_NEW_TOKENS
+LLAMA_TOKENS_PER_DIAGNOSIS = 48
+LLAMA_BASE_NEW_TOKENS = 32
+LLAMA_MAX_NEW_TOKENS = 2000
+# Reuse the key/value cache of the fixed system prompt + instructions across notes, so only
+# the note-specific part of each prompt is prefilled (extractor and relative date extraction)
+LLAMA_PREFIX_CACHE = True
+# Constrain decoding to a JSON array of {diagnosis, date, confidence} objects using only the
+# note's diagnoses and raw dates (each diagnosis at most once); generation stops when the array closes
+LLAMA_STRUCTURED_OUTPUT = True
 
 # --- Relative Date Extraction LLM Settings --- #
 ENABLE_RELATIVE_DATE_EXTRACTION = True      # Whether to extract relative dates
 RELATIVE_DATE_LLM_MODEL = 'openai'          # Which LLM to use: 'openai' or 'llama'
 RELATIVE_DATE_OPENAI_MODEL = 'gpt-3.5-turbo' # OpenAI model for relative date extraction (cheaper than gpt-4o)
 RELATIVE_DATE_CONTEXT_WINDOW = 1000         # Maximum context window to send to LLM for date extraction
+# Extracted relative dates are stored by note text hash, document timestamp and model, and merged into
+# the note entities when the data is loaded. Only notes without a stored result are sent to the LLM
+# (`python main.py relative-dates`). Parquet needs pyarrow; a .csv file is used without it.
+RELATIVE_DATE_STORE_PATH = 'data/relative_dates.parquet'
+RELATIVE_DATE_AUTO_STAGE = True             # Extract missing relative dates when loading data (False: use stored results only)
+RELATIVE_DATE_CONCURRENCY = 8               # OpenAI requests in flight at once (1 = one note at a time)
+RELATIVE_DATE_LLAMA_BATCH_SIZE = 8          # Notes generated together by Llama (1 = one note at a time)
+# Extract relative dates and relationships with one request per note in the LLM extractor, instead of a
+# separate relative date request while loading the data. Only used when 'llm' is the only method run.
+LLM_COMBINED_RELATIVE_DATES = False
+
+# --- OpenAI Batch Job Settings --- #
+# Offline batch mode: requests are written to a Batch API JSONL file, submitted in one job
+# and polled until done (cheaper, but results can take up to the 24h completion window).
+# Interrupted jobs are resumed when the same requests are run again.
+LLM_BATCH_MODE = False             # Relationship extraction with the LLM extractor
+RELATIVE_DATE_BATCH_MODE = False   # Relative date extraction (RELATIVE_DATE_LLM_MODEL = 'openai')
+OPENAI_BATCH_BACKEND = 'openai'    # 'openai' (Batch API) or 'local' (offline stand-in returning empty answers)
+OPENAI_BATCH_DIR = 'batch_jobs'    # Request, status and result files of each job
+OPENAI_BATCH_POLL_SECONDS = 30
+OPENAI_BATCH_TIMEOUT_HOURS = 24    # Stop waiting after this long (rerun to resume)
 
 # --- File Paths (Synthetic Data) --- #
-SYNTHETIC_DATASET_PATH = 'data/synthetic_data.json' # Path to synthetic data JSON file
+SYNTHETIC_DATASET_PATH = 'data/synthetic_data.json' # Path to synthetic data JSON file (or a .jsonl file for large, indexed datasets)
 MODEL_PATH = 'model_training/best_model.pt'  
 VOCAB_PATH = 'model_training/vocab.pt'      
+# Full training checkpoint (model, optimizer, epoch, RNG states) saved after every epoch. With
+# TRAINING_RESUME an interrupted `python main.py train` continues from it. Finished runs and
+# checkpoints made with different training_config hyperparameters are not resumed.
+TRAINING_CHECKPOINT_PATH = 'model_training/checkpoint.pt'
+TRAINING_RESUME = True
 
 # --- RelCAT Extractor Parameters --- #
 # Ensure these paths are correct for your setup
 MEDCAT_MODEL_PATH = 'extractors/relcat/relcat_model.pt'  # Example Path
 MEDCAT_CDB_PATH = 'extractors/relcat/cdb.dat'        # Example Path
 
+# --- Micro-batching Settings --- #
+# Notes are coalesced into batches of up to MICRO_BATCH_MAX_SIZE (waiting at most
+# MICRO_BATCH_MAX_WAIT_MS for a partial batch) before calling an extractor's extract_batch().
+# Used by run_extraction and the extraction service; 1 disables batching in run_extraction.
+MICRO_BATCH_MAX_SIZE = 32
+MICRO_BATCH_MAX_WAIT_MS = 5.0
+
+# --- Extraction Service Settings (python main.py serve) --- #
+SERVICE_METHODS = ['naive', 'custom']  # Extractors loaded once at startup
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+SERVICE_UNIX_SOCKET = None             # Path of a Unix socket to listen on instead of TCP
+SERVICE_MAX_BATCH_NOTES = 256          # Maximum notes accepted per /extract request
+
 # --- Hardware Settings --- #
 DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu') 
 
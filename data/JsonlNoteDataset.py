@@ -0,0 +1,185 @@
+# JSON Lines dataset of clinical notes with a byte-offset index
+import os
+import mmap
+import json
+from array import array
+
+import numpy as np
+
+INDEX_SUFFIX = '.idx'
+# Offsets are buffered and flushed in chunks while building the index
+INDEX_CHUNK_SIZE = 1000000
+
+def is_jsonl_path(path):
+    """Check whether a dataset path refers to a JSON Lines file."""
+    return isinstance(path, str) and path.lower().endswith('.jsonl')
+
+def build_offset_index(data_path, index_path=None):
+    """
+    Scan a JSON Lines file and write the byte offset of every record to a sidecar index.
+
+    The index is a flat array of little-endian uint64 values: one start offset per
+    record followed by the file size, so record i spans offsets[i]:offsets[i + 1].
+    Blank lines are skipped.
+
+    Args:
+        data_path (str): Path to the .jsonl file.
+        index_path (str, optional): Path of the index file (defaults to data_path + '.idx').
+
+    Returns:
+        str: Path of the written index.
+    """
+    index_path = index_path or data_path + INDEX_SUFFIX
+    tmp_path = index_path + '.tmp'
+    offsets = array('Q')
+    position = 0
+    with open(data_path, 'rb') as data_file, open(tmp_path, 'wb') as index_file:
+        for line in data_file:
+            if line.strip():
+                offsets.append(position)
+            position += len(line)
+            if len(offsets) >= INDEX_CHUNK_SIZE:
+                offsets.tofile(index_file)
+                offsets = array('Q')
+        offsets.append(position)
+        offsets.tofile(index_file)
+    os.replace(tmp_path, index_path)
+    return index_path
+
+def _index_is_current(data_path, index_path):
+    """An index is current if it is newer than the data file and ends at the data file size."""
+    if not os.path.exists(index_path):
+        return False
+    if os.path.getmtime(index_path) < os.path.getmtime(data_path):
+        return False
+    index_size = os.path.getsize(index_path)
+    if index_size < 8 or index_size % 8:
+        return False
+    with open(index_path, 'rb') as f:
+        f.seek(-8, os.SEEK_END)
+        last_offset = int.from_bytes(f.read(8), 'little')
+    return last_offset == os.path.getsize(data_path)
+
+class JsonlNoteDataset:
+    """
+    Random-access view of a JSON Lines dataset (one note entry per line).
+
+    Record offsets are kept in a memory-mapped sidecar index (built on first use), and
+    records are read from a memory-mapped data file, so opening the dataset and reading
+    any note costs constant memory regardless of the file size.
+    """
+
+    def __init__(self, path, index_path=None):
+        """
+        Open the dataset, building or refreshing its offset index if needed.
+
+        Args:
+            path (str): Path to the .jsonl file.
+            index_path (str, optional): Path of the offset index (defaults to path + '.idx').
+        """
+        self.path = path
+        self.index_path = index_path or path + INDEX_SUFFIX
+        if not _index_is_current(path, self.index_path):
+            build_offset_index(path, self.index_path)
+
+        self._offsets = np.memmap(self.index_path, dtype='<u8', mode='r')
+        self._file = open(path, 'rb')
+        if len(self) > 0:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._mmap = None
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return list(self.iter_range(*idx.indices(len(self))[:2]))
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError(f"Record {idx} out of range for dataset of size {len(self)}")
+        start, end = int(self._offsets[idx]), int(self._offsets[idx + 1])
+        return json.loads(self._mmap[start:end])
+
+    def __iter__(self):
+        return self.iter_range(0, len(self))
+
+    def iter_range(self, start=0, stop=None):
+        """
+        Stream records [start, stop) in order without loading the rest of the file.
+
+        Yields:
+            dict: One dataset entry per record.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(int(self._offsets[start]))
+            remaining = stop - start
+            for line in f:
+                if not line.strip():
+                    continue
+                yield json.loads(line)
+                remaining -= 1
+                if remaining == 0:
+                    break
+
+    def view(self, start=0, stop=None):
+        """
+        Get a re-iterable, sized view over records [start, stop).
+
+        Returns:
+            JsonlRangeView: A lazy view that can be passed wherever a list of entries is iterated.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        return JsonlRangeView(self, start, max(start, stop))
+
+    def split(self, train_fraction=0.8):
+        """
+        Split the dataset by index range without reading any records.
+
+        Returns:
+            tuple: (train_view, eval_view) - the first train_fraction of records and the rest.
+        """
+        split_point = int(len(self) * train_fraction)
+        return self.view(0, split_point), self.view(split_point, len(self))
+
+    def close(self):
+        """Release the memory maps and file handle."""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+        self._offsets = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class JsonlRangeView:
+    """Lazy, re-iterable view over a contiguous range of records in a JsonlNoteDataset."""
+
+    def __init__(self, dataset, start, stop):
+        self.dataset = dataset
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        return self.dataset.iter_range(self.start, self.stop)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, _ = idx.indices(len(self))
+            return JsonlRangeView(self.dataset, self.start + start, self.start + max(start, stop))
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError(f"Record {idx} out of range for view of size {len(self)}")
+        return self.dataset[self.start + idx]
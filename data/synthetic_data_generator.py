@@ -1,10 +1,11 @@
+import os
+import sys
 import random
 import datetime
 import json
 import re
-from faker import Faker
-
-fake = Faker()
+import argparse
+import multiprocessing
 
 # Define possible diagnoses
 DIAGNOSES = [
@@ -89,80 +90,96 @@ DURATIONS = ["1 day", "3 days", "1 week", "2 weeks", "1 month", "3 months", "6 m
 FOLLOW_UP_TIMES = ["1 week", "2 weeks", "1 month", "3 months", "6 months"]
 SIZES = ["0.5", "1.2", "2.3", "3.1", "4.5", "0.8", "1.5", "2.7"]
 
-def generate_date_formats(date):
-    """Generate date in various formats"""
-    formats = [
-        date.strftime("%d-%m-%Y"),          # 15-01-2023
-        date.strftime("%d.%m.%y"),          # 15.01.23
-        date.strftime("%d/%m/%y"),          # 15/01/23
-        date.strftime("%d/%m/%Y"),          # 15/01/2023
-        date.strftime("%Y-%m-%d"),          # 2023-01-15
-        date.strftime("%d %b %Y"),          # 15 Jan 2023
-        date.strftime("%d %b'%y"),          # 15 Jan'23
-        date.strftime("%dst %b %Y").replace("1st", "1st").replace("2st", "2nd").replace("3st", "3rd"),  # 1st Jan 2023
-        date.strftime("%dnd %b %Y").replace("1nd", "1st").replace("2nd", "2nd").replace("3nd", "3rd"),  # 2nd Jan 2023
-        date.strftime("%drd %b %Y").replace("1rd", "1st").replace("2rd", "2nd").replace("3rd", "3rd"),  # 3rd Jan 2023
-        date.strftime("%dth %b %Y").replace("1th", "1st").replace("2th", "2nd").replace("3th", "3rd")   # 4th, 5th, etc.
-    ]
-    return random.choice(formats)
+# Date formats as (strftime pattern, ordinal suffix fixes)
+DATE_FORMATS = [
+    ("%d-%m-%Y", ()),          # 15-01-2023
+    ("%d.%m.%y", ()),          # 15.01.23
+    ("%d/%m/%y", ()),          # 15/01/23
+    ("%d/%m/%Y", ()),          # 15/01/2023
+    ("%Y-%m-%d", ()),          # 2023-01-15
+    ("%d %b %Y", ()),          # 15 Jan 2023
+    ("%d %b'%y", ()),          # 15 Jan'23
+    ("%dst %b %Y", (("1st", "1st"), ("2st", "2nd"), ("3st", "3rd"))),  # 1st Jan 2023
+    ("%dnd %b %Y", (("1nd", "1st"), ("2nd", "2nd"), ("3nd", "3rd"))),  # 2nd Jan 2023
+    ("%drd %b %Y", (("1rd", "1st"), ("2rd", "2nd"), ("3rd", "3rd"))),  # 3rd Jan 2023
+    ("%dth %b %Y", (("1th", "1st"), ("2th", "2nd"), ("3th", "3rd")))   # 4th, 5th, etc.
+]
+
+# Fixed reference date used by the seeded generator so output does not depend on the clock
+DEFAULT_REFERENCE_DATE = datetime.datetime(2025, 1, 1)
+
+def generate_date_formats(date, rng=random):
+    """Generate date in a randomly chosen format (only the chosen format is rendered)"""
+    pattern, fixes = DATE_FORMATS[rng.randrange(len(DATE_FORMATS))]
+    date_str = date.strftime(pattern)
+    for old, new in fixes:
+        date_str = date_str.replace(old, new)
+    return date_str
 
-def generate_section(previous_date=None, min_days=1, max_days=60):
-    """Generate a clinical note section"""
+def generate_section(previous_date=None, min_days=1, max_days=60, rng=random, reference_date=None):
+    """Generate a clinical note section.
+    rng is a random.Random instance (defaults to the global random module) and
+    reference_date anchors the first section date (defaults to now)."""
     if previous_date:
         # Generate a date after the previous date
-        days_after = random.randint(min_days, max_days)
+        days_after = rng.randint(min_days, max_days)
         date = previous_date + datetime.timedelta(days=days_after)
     else:
         # Start with a random date in the past year
-        days_ago = random.randint(30, 365)
-        date = datetime.datetime.now() - datetime.timedelta(days=days_ago)
+        days_ago = rng.randint(30, 365)
+        date = (reference_date or datetime.datetime.now()) - datetime.timedelta(days=days_ago)
     
-    date_str = generate_date_formats(date)
+    date_str = generate_date_formats(date, rng)
     
-    template = random.choice(SECTION_TEMPLATES)
+    template = rng.choice(SECTION_TEMPLATES)
     
     # Fill in placeholders
-    visit_type = random.choice(VISIT_TYPES)
-    specialty = random.choice(SPECIALTIES)
-    symptom = random.choice(SYMPTOMS).replace("{duration}", random.choice(DURATIONS))
-    status = random.choice(STATUS)
+    visit_type = rng.choice(VISIT_TYPES)
+    specialty = rng.choice(SPECIALTIES)
+    symptom = rng.choice(SYMPTOMS).replace("{duration}", rng.choice(DURATIONS))
+    status = rng.choice(STATUS)
     
     # Generate a primary diagnosis for this section
-    diagnosis = random.choice(DIAGNOSES)
-    diagnosis2 = random.choice([d for d in DIAGNOSES if d != diagnosis])  # Different from primary
+    diagnosis_idx = rng.randrange(len(DIAGNOSES))
+    diagnosis = DIAGNOSES[diagnosis_idx]
+    # Pick a different secondary diagnosis without building a filtered list
+    diagnosis2_idx = rng.randrange(len(DIAGNOSES) - 1)
+    if diagnosis2_idx >= diagnosis_idx:
+        diagnosis2_idx += 1
+    diagnosis2 = DIAGNOSES[diagnosis2_idx]
 
     # Format diagnoses with underscores
     diagnosis_fmt = diagnosis.replace(' ', '_')
     diagnosis2_fmt = diagnosis2.replace(' ', '_')
 
-    assessment = random.choice(ASSESSMENTS).replace(
+    assessment = rng.choice(ASSESSMENTS).replace(
         "{diagnosis}", diagnosis_fmt  # Use formatted diagnosis
     ).replace(
         "{diagnosis2}", diagnosis2_fmt # Use formatted diagnosis2
     )
     
-    plan = random.choice(PLANS).replace(
-        "{medication}", random.choice(MEDICATIONS)
+    plan = rng.choice(PLANS).replace(
+        "{medication}", rng.choice(MEDICATIONS)
     ).replace(
-        "{specialty}", random.choice(SPECIALTIES)
+        "{specialty}", rng.choice(SPECIALTIES)
     ).replace(
-        "{imaging_type}", random.choice(IMAGING_TYPES)
+        "{imaging_type}", rng.choice(IMAGING_TYPES)
     ).replace(
-        "{follow_up_time}", random.choice(FOLLOW_UP_TIMES)
+        "{follow_up_time}", rng.choice(FOLLOW_UP_TIMES)
     )
     
-    imaging_type = random.choice(IMAGING_TYPES)
-    imaging_results = random.choice(IMAGING_RESULTS).replace(
-        "{size}", random.choice(SIZES)
+    imaging_type = rng.choice(IMAGING_TYPES)
+    imaging_results = rng.choice(IMAGING_RESULTS).replace(
+        "{size}", rng.choice(SIZES)
     ).replace(
-        "{location}", random.choice(LOCATIONS)
+        "{location}", rng.choice(LOCATIONS)
     ).replace(
         "{diagnosis}", diagnosis_fmt # Use formatted diagnosis
     ).replace(
-        "{pathology}", random.choice(PATHOLOGIES)
+        "{pathology}", rng.choice(PATHOLOGIES)
     )
     
-    lab_results = random.choice(LAB_RESULTS)
+    lab_results = rng.choice(LAB_RESULTS)
     
     section = template.format(
         visit_type=visit_type,
@@ -211,7 +228,7 @@ def generate_section(previous_date=None, min_days=1, max_days=60):
     
     return section, date, ground_truth
 
-def generate_clinical_note(num_sections=5):
+def generate_clinical_note(num_sections=5, rng=random, reference_date=None):
     """Generate a complete clinical note with multiple sections"""
     sections = []
     ground_truth = []
@@ -219,20 +236,23 @@ def generate_clinical_note(num_sections=5):
     date = None
     
     for i in range(num_sections):
-        section, date, section_truth = generate_section(date)
+        section, date, section_truth = generate_section(date, rng=rng, reference_date=reference_date)
         sections.append(section)
         ground_truth.append(section_truth)
     
+    note = "\n\n".join(sections)
+
     # Occasional typos and formatting issues for realism
-    if random.random() < 0.3:
-        # Add some typos
-        note = "\n\n".join(sections)
+    if rng.random() < 0.3:
+        # Add some typos, inserting into a character list and joining once
+        chars = list(note)
         typo_chars = [",", ".", " ", "", ";"]
-        for _ in range(random.randint(1, 5)):
-            pos = random.randint(0, len(note) - 1)
-            note = note[:pos] + random.choice(typo_chars) + note[pos:]
-    else:
-        note = "\n\n".join(sections)
+        for _ in range(rng.randint(1, 5)):
+            pos = rng.randint(0, len(chars) - 1)
+            typo = rng.choice(typo_chars)
+            if typo:
+                chars.insert(pos, typo)
+        note = "".join(chars)
     
     # Add some common abbreviations
     abbreviations = {
@@ -249,23 +269,24 @@ def generate_clinical_note(num_sections=5):
     }
     
     for word, abbr in abbreviations.items():
-        if random.random() < 0.7:  # 70% chance to use abbreviation
+        if rng.random() < 0.7:  # 70% chance to use abbreviation
             note = note.replace(word, abbr)
     
     # Occasionally add spacing issues
-    if random.random() < 0.4:
+    if rng.random() < 0.4:
         note = note.replace(". ", ".")
-    if random.random() < 0.3:
+    if rng.random() < 0.3:
         note = note.replace(", ", ",")
     
     return note, ground_truth
 
-def generate_dataset(num_notes=100):
-    """Generate a dataset of clinical notes with ground truth relationships"""
+def generate_dataset(num_notes=100, min_sections=3, max_sections=8):
+    """Generate a dataset of clinical notes with ground truth relationships.
+    Each note gets between min_sections and max_sections dated sections."""
     dataset = []
     
     for i in range(num_notes):
-        note, ground_truth = generate_clinical_note(num_sections=random.randint(3, 8))
+        note, ground_truth = generate_clinical_note(num_sections=random.randint(min_sections, max_sections))
         
         # Create entry with note and ground truth
         entry = {
@@ -278,12 +299,106 @@ def generate_dataset(num_notes=100):
     
     return dataset
 
+def generate_note_entry(note_id, seed, min_sections=3, max_sections=8, reference_date=DEFAULT_REFERENCE_DATE):
+    """Generate a single dataset entry deterministically from (seed, note_id).
+    Every note has its own RNG, so the output does not depend on how notes are sharded."""
+    rng = random.Random(f"{seed}:{note_id}")
+    note, ground_truth = generate_clinical_note(
+        num_sections=rng.randint(min_sections, max_sections), rng=rng, reference_date=reference_date
+    )
+    return {
+        "id": note_id,
+        "clinical_note": note,
+        "ground_truth": ground_truth
+    }
+
+def _generate_shard(shard):
+    """Generate the JSON Lines text for a contiguous range of note ids (worker entry point)"""
+    start, stop, seed, min_sections, max_sections, reference_date = shard
+    lines = []
+    for note_id in range(start, stop):
+        entry = generate_note_entry(note_id, seed, min_sections, max_sections, reference_date)
+        lines.append(json.dumps(entry, separators=(',', ':')))
+        lines.append("\n")
+    return "".join(lines)
+
+def generate_dataset_jsonl(output_path, num_notes, seed=42, num_workers=None, shard_size=10000,
+                           min_sections=3, max_sections=8, reference_date=DEFAULT_REFERENCE_DATE):
+    """
+    Generate a synthetic dataset in parallel and stream it to a JSON Lines file.
+
+    Notes are sharded by id range across worker processes and written in id order as
+    shards complete. For a given seed (and reference date) the file is byte-identical
+    regardless of the number of workers or the shard size.
+
+    Args:
+        output_path (str): Path of the .jsonl file to write.
+        num_notes (int): Number of notes to generate.
+        seed (int): Seed controlling all random choices.
+        num_workers (int, optional): Worker processes (defaults to the CPU count; 1 disables multiprocessing).
+        shard_size (int): Number of notes generated per task.
+        min_sections (int): Minimum number of sections per note.
+        max_sections (int): Maximum number of sections per note.
+        reference_date (datetime): Anchor for the first section date of each note.
+
+    Returns:
+        int: Number of notes written.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    shards = [
+        (start, min(start + shard_size, num_notes), seed, min_sections, max_sections, reference_date)
+        for start in range(0, num_notes, shard_size)
+    ]
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    with open(output_path, 'w', encoding='utf-8', newline='\n') as f:
+        if num_workers == 1 or len(shards) <= 1:
+            for shard in shards:
+                f.write(_generate_shard(shard))
+        else:
+            with multiprocessing.Pool(min(num_workers, len(shards))) as pool:
+                # imap yields shards in submission order, keeping the file ordered by note id
+                for chunk in pool.imap(_generate_shard, shards):
+                    f.write(chunk)
+    return num_notes
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic clinical notes with ground truth relationships.")
+    parser.add_argument('--num-notes', type=int, default=100, help="Number of notes to generate.")
+    parser.add_argument('--output', default='data/synthetic_data.json',
+                        help="Output path. A .jsonl path uses the seeded parallel generator.")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Random seed (the .jsonl generator defaults to 42).")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes for .jsonl output.")
+    parser.add_argument('--shard-size', type=int, default=10000, help="Notes per worker task for .jsonl output.")
+    parser.add_argument('--min-sections', type=int, default=3, help="Minimum sections per note.")
+    parser.add_argument('--max-sections', type=int, default=8, help="Maximum sections per note.")
+    parser.add_argument('--reference-date', default=DEFAULT_REFERENCE_DATE.strftime('%Y-%m-%d'),
+                        help="Anchor date (YYYY-MM-DD) for the seeded .jsonl generator.")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
+    output_path = args.output
+
+    if output_path.endswith('.jsonl'):
+        seed = 42 if args.seed is None else args.seed
+        reference_date = datetime.datetime.strptime(args.reference_date, '%Y-%m-%d')
+        generate_dataset_jsonl(
+            output_path, args.num_notes, seed=seed, num_workers=args.workers, shard_size=args.shard_size,
+            min_sections=args.min_sections, max_sections=args.max_sections, reference_date=reference_date
+        )
+        print(f"Generated {args.num_notes} synthetic clinical notes (seed {seed}) to {output_path}")
+        sys.exit(0)
+
     # Generate dataset
-    dataset = generate_dataset(100)
+    if args.seed is not None:
+        random.seed(args.seed)
+    dataset = generate_dataset(args.num_notes, min_sections=args.min_sections, max_sections=args.max_sections)
     
     # Save to file
-    output_path = 'data/synthetic_data.json'
     with open(output_path, 'w') as f:
         json.dump(dataset, f, indent=2)
     
@@ -0,0 +1,311 @@
+"""
+Long-running extraction service.
+
+Loads the configured extractors once and serves batch extraction over HTTP (TCP or a
+Unix socket), so callers do not pay model load time per invocation:
+
+    python main.py serve --methods naive,custom --port 8765
+
+Endpoints:
+    GET  /health      -> {"status": "ok", "extractors": [...]}
+    GET  /extractors  -> per-extractor name, load time and request statistics
+    POST /extract     -> {"method": "custom", "notes": [{"id": ..., "text": ..., "entities": ...}]}
+
+"entities" is optional per note and may be {"diagnoses": [[label, pos], ...],
+"dates": [[parsed, original, pos], ...]} or the equivalent [diagnoses, dates] pair.
+When it is omitted the extractor finds entities in the text itself.
+"""
+import os
+import json
+import stat
+import time
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+from extractors.extractor_factory import create_extractor
+from utils.batching_utils import create_extractor_batcher
+
+class ExtractorPool:
+    """
+    Loaded extractors keyed by method name. Notes from concurrent requests are coalesced
+    per extractor by a MicroBatcher, so model-based extractors see full batches.
+    """
+
+    def __init__(self, methods, settings):
+        """
+        Create and load the extractors for the given methods.
+
+        Args:
+            methods (list): Extraction methods to serve (e.g. ['naive', 'custom']).
+            settings (Settings): Run settings passed to the extractors.
+        """
+        self.extractors = {}
+        self.batchers = {}
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+        max_batch_size = getattr(settings, 'MICRO_BATCH_MAX_SIZE', 32)
+        max_wait_ms = getattr(settings, 'MICRO_BATCH_MAX_WAIT_MS', 5.0)
+        for method in methods:
+            method = method.lower()
+            print(f"Loading {method} extractor...")
+            try:
+                extractor = create_extractor(method, settings)
+                start = time.perf_counter()
+                loaded = extractor.load()
+                load_time = time.perf_counter() - start
+            except Exception as e:
+                print(f"Skipping {method}: Load error - {e}")
+                continue
+            if not loaded:
+                print(f"Skipping {method}: load() failed")
+                continue
+            self.extractors[method] = extractor
+            self.batchers[method] = create_extractor_batcher(extractor, max_batch_size, max_wait_ms)
+            self.stats[method] = {
+                'name': extractor.name,
+                'load_time_s': load_time,
+                'requests': 0,
+                'notes': 0,
+                'total_time_s': 0.0
+            }
+            print(f"Loaded {extractor.name} in {load_time:.2f}s")
+
+    def extract(self, method, texts, entities_list):
+        """
+        Extract relationships for a request's notes with the given extractor.
+
+        Each note is submitted to the extractor's MicroBatcher, where it may share a
+        batch with notes from other concurrent requests.
+
+        Returns:
+            list: One list of relationship dicts per note.
+        """
+        start = time.perf_counter()
+        batcher = self.batchers[method]
+        futures = [batcher.submit((text, entities)) for text, entities in zip(texts, entities_list)]
+        results = [future.result() for future in futures]
+        with self._stats_lock:
+            stats = self.stats[method]
+            stats['requests'] += 1
+            stats['notes'] += len(texts)
+            stats['total_time_s'] += time.perf_counter() - start
+        return results
+
+    def get_stats(self):
+        """Per-extractor request statistics, including micro-batching statistics."""
+        with self._stats_lock:
+            stats = {method: dict(values) for method, values in self.stats.items()}
+        for method, batcher in self.batchers.items():
+            stats[method]['batching'] = batcher.get_stats()
+        return stats
+
+    def close(self):
+        """Stop the batchers after processing queued notes."""
+        for batcher in self.batchers.values():
+            batcher.close()
+
+def parse_entities(entities):
+    """
+    Convert JSON entities to the (diagnoses, dates) tuple expected by the extractors.
+
+    Args:
+        entities (dict or list or None): {"diagnoses": [...], "dates": [...]} or [diagnoses, dates].
+
+    Returns:
+        tuple: (diagnoses, dates) with tuple items, or None if no entities were given.
+
+    Raises:
+        ValueError: If the entities are malformed.
+    """
+    if entities is None:
+        return None
+    if isinstance(entities, dict):
+        diagnoses, dates = entities.get('diagnoses', []), entities.get('dates', [])
+    elif isinstance(entities, (list, tuple)) and len(entities) == 2:
+        diagnoses, dates = entities
+    else:
+        raise ValueError("'entities' must be {\"diagnoses\": [...], \"dates\": [...]} or [diagnoses, dates]")
+    diagnoses = [(str(label).lower(), int(pos)) for label, pos in diagnoses]
+    dates = [(parsed, original, int(pos)) for parsed, original, pos in dates]
+    return diagnoses, dates
+
+class ExtractionRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler for the extraction endpoints. The server provides `pool` and `max_batch_notes`."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        # Unix socket clients have no (host, port) address
+        if isinstance(self.client_address, tuple) and self.client_address:
+            return str(self.client_address[0])
+        return 'unix'
+
+    def log_message(self, format, *args):
+        if getattr(self.server, 'verbose', False):
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        pool = self.server.pool
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok', 'extractors': sorted(pool.extractors)})
+        elif self.path == '/extractors':
+            self._send_json(200, {'extractors': pool.get_stats()})
+        else:
+            self._send_json(404, {'error': f"Unknown path '{self.path}'"})
+
+    def do_POST(self):
+        if self.path != '/extract':
+            self._send_json(404, {'error': f"Unknown path '{self.path}'"})
+            return
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {'error': f"Invalid JSON body: {e}"})
+            return
+
+        pool = self.server.pool
+        method = str(request.get('method') or self.server.default_method or '').lower()
+        if method not in pool.extractors:
+            self._send_json(400, {'error': f"Extractor '{method}' is not loaded. Available: {sorted(pool.extractors)}"})
+            return
+
+        notes = request.get('notes')
+        if notes is None and 'text' in request:
+            notes = [request]
+        if not isinstance(notes, list) or not notes:
+            self._send_json(400, {'error': "Request must contain a non-empty 'notes' list"})
+            return
+        if len(notes) > self.server.max_batch_notes:
+            self._send_json(413, {'error': f"At most {self.server.max_batch_notes} notes per request"})
+            return
+
+        try:
+            texts = [str(note['text']) for note in notes]
+            entities_list = [parse_entities(note.get('entities')) for note in notes]
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_json(400, {'error': f"Invalid note: {e}"})
+            return
+
+        try:
+            results = pool.extract(method, texts, entities_list)
+        except Exception as e:
+            self._send_json(500, {'error': f"Extraction failed: {e}"})
+            return
+
+        self._send_json(200, {
+            'method': method,
+            'extractor': pool.extractors[method].name,
+            'results': [
+                {'id': note.get('id', i), 'relationships': relationships}
+                for i, (note, relationships) in enumerate(zip(notes, results))
+            ],
+            'elapsed_ms': (time.perf_counter() - start) * 1000
+        })
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    """Threaded HTTP server listening on a Unix domain socket."""
+    daemon_threads = True
+
+    def server_bind(self):
+        UnixStreamServer.server_bind(self)
+        # Attributes BaseHTTPRequestHandler expects from an HTTPServer
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+def remove_stale_socket(path):
+    """
+    Remove a Unix socket left behind at path (by a previous run).
+
+    Raises:
+        FileExistsError: If path exists but is not a socket.
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a Unix socket; not removing it")
+    os.remove(path)
+
+def create_server(pool, settings, host=None, port=None, unix_socket=None):
+    """
+    Create the HTTP server for an extractor pool.
+
+    Args:
+        pool (ExtractorPool): Loaded extractors.
+        settings (Settings): Run settings (SERVICE_* values are used as defaults).
+        host (str, optional): TCP host to bind.
+        port (int, optional): TCP port to bind.
+        unix_socket (str, optional): Path of a Unix socket to listen on instead of TCP.
+
+    Returns:
+        The server instance (call serve_forever() to run it).
+
+    Raises:
+        FileExistsError: If unix_socket names an existing file that is not a socket.
+    """
+    unix_socket = unix_socket or getattr(settings, 'SERVICE_UNIX_SOCKET', None)
+    if unix_socket:
+        remove_stale_socket(unix_socket)
+        server = ThreadingUnixHTTPServer(unix_socket, ExtractionRequestHandler)
+    else:
+        host = host or getattr(settings, 'SERVICE_HOST', '127.0.0.1')
+        port = port if port is not None else getattr(settings, 'SERVICE_PORT', 8765)
+        server = ThreadingHTTPServer((host, port), ExtractionRequestHandler)
+        server.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    server.pool = pool
+    server.max_batch_notes = getattr(settings, 'SERVICE_MAX_BATCH_NOTES', 256)
+    server.default_method = getattr(settings, 'EXTRACTION_METHOD', None)
+    server.verbose = getattr(settings, 'DEBUG_MODE', False)
+    return server
+
+def serve(settings, methods=None, host=None, port=None, unix_socket=None):
+    """
+    Load the extractors once and serve extraction requests until interrupted.
+
+    Args:
+        settings (Settings): Run settings.
+        methods (list, optional): Extraction methods to load (defaults to SERVICE_METHODS).
+        host, port, unix_socket: Listening address overrides (see create_server).
+
+    Returns:
+        int: Process exit code.
+    """
+    methods = methods or getattr(settings, 'SERVICE_METHODS', ['naive'])
+    pool = ExtractorPool(methods, settings)
+    if not pool.extractors:
+        print("No extractors loaded successfully. Exiting.")
+        return 1
+
+    try:
+        server = create_server(pool, settings, host=host, port=port, unix_socket=unix_socket)
+    except OSError as e:
+        print(f"Error: Could not start the extraction service: {e}")
+        pool.close()
+        return 1
+    if isinstance(server, ThreadingUnixHTTPServer):
+        print(f"Serving {', '.join(sorted(pool.extractors))} on unix socket {server.server_address}")
+    else:
+        print(f"Serving {', '.join(sorted(pool.extractors))} on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down extraction service...")
+    finally:
+        server.server_close()
+        pool.close()
+        if isinstance(server, ThreadingUnixHTTPServer):
+            remove_stale_socket(server.server_address)
+    return 0
@@ -28,6 +28,24 @@ class BaseRelationExtractor(ABC):
         """
         pass
     
+    def extract_batch(self, texts, entities_list=None):
+        """
+        Extract relationships for several notes at once.
+
+        The default implementation calls extract() per note; model-based extractors
+        override it to run a single batched forward pass.
+
+        Args:
+            texts (list): Clinical note texts.
+            entities_list (list, optional): One (diagnoses, dates) tuple or None per note.
+
+        Returns:
+            list: One list of relationship dicts (as returned by extract()) per note.
+        """
+        if entities_list is None:
+            entities_list = [None] * len(texts)
+        return [self.extract(text, entities=entities) for text, entities in zip(texts, entities_list)]
+
     @abstractmethod
     def load(self):
         """
@@ -5,7 +5,8 @@ from model_training.DiagnosisDateRelationModel import DiagnosisDateRelationModel
 from model_training.Vocabulary import Vocabulary
 from model_training.training_config import EMBEDDING_DIM, HIDDEN_DIM
 from utils.extraction_utils import extract_entities
-from utils.training_utils import preprocess_note_for_prediction, create_prediction_dataset
+from utils.training_utils import preprocess_note_for_prediction, create_prediction_batch
+from utils.segmentation_utils import get_section_window
 
 class CustomExtractor(BaseRelationExtractor):
     """
@@ -26,6 +27,10 @@ class CustomExtractor(BaseRelationExtractor):
         # Use specific prediction parameters from main config
         self.pred_max_distance = getattr(config, 'PREDICTION_MAX_DISTANCE', 500)
         self.pred_max_context_len = getattr(config, 'PREDICTION_MAX_CONTEXT_LEN', 512)
+        self.confidence_threshold = getattr(config, 'PREDICTION_CONFIDENCE_THRESHOLD', 0.0)
+        self.batch_size = getattr(config, 'PREDICTION_BATCH_SIZE', 256)
+        # Only score pairs within the same/adjacent note sections (SECTION_RESTRICTION)
+        self.section_window = get_section_window(config)
         self.device = config.DEVICE
         self.name = "Custom (PyTorch NN)"
         
@@ -89,62 +94,93 @@ class CustomExtractor(BaseRelationExtractor):
                     'confidence': float    # Model prediction confidence
                 }
         """
+        return self.extract_batch([text], [entities])[0]
+
+    def extract_batch(self, texts, entities_list=None):
+        """
+        Extract relationships for several notes with batched forward passes.
+
+        Candidate diagnosis-date pairs from all notes are scored together in chunks of
+        PREDICTION_BATCH_SIZE, then split back per note.
+
+        Args:
+            texts (list): Clinical note texts.
+            entities_list (list, optional): One (diagnoses, dates) tuple or None per note.
+
+        Returns:
+            list: One list of relationship dicts (as returned by extract()) per note.
+        """
         if self.model is None or self.vocab is None:
             print("Custom Model or Vocabulary not loaded. Call load() first.")
-            return []
-        
-        if entities is None:
-            # This call should return a tuple of two lists
-            diagnoses, dates = extract_entities(text) 
-        else:
-            # This is the suspected line causing the "too many values" error:
-            diagnoses, dates = entities 
-        
-        # Use prediction-specific parameters when calling utils
-        # Check if the previous unpacking succeeded before proceeding
-        if diagnoses is None or dates is None: 
-             print("Error: Diagnoses or dates list is None after unpacking/extraction.")
-             return [] # Avoid further errors if unpacking failed silently somehow
+            return [[] for _ in texts]
+        if entities_list is None:
+            entities_list = [None] * len(texts)
 
-        features = preprocess_note_for_prediction(text, self.pred_max_distance)
-        # Pass the confirmed lists to the next function
-        test_data = create_prediction_dataset(features, self.vocab, self.device, 
-                                              self.pred_max_distance, self.pred_max_context_len)
-        
-        # Create a dictionary to store all predictions for each diagnosis
-        diagnosis_predictions = {}
+        note_features = []
+        for text, entities in zip(texts, entities_list):
+            if entities is None:
+                # This call should return a tuple of two lists
+                diagnoses, dates = extract_entities(text)
+            else:
+                diagnoses, dates = entities
+            if diagnoses is None or dates is None:
+                print("Error: Diagnoses or dates list is None after unpacking/extraction.")
+                note_features.append([])
+                continue
+            note_features.append(
+                preprocess_note_for_prediction(text, self.pred_max_distance, entities=(diagnoses, dates),
+                                               section_window=self.section_window)
+            )
+
+        all_features = [feature for features in note_features for feature in features]
+        probabilities = self._predict_probabilities(all_features)
+
+        results = []
+        offset = 0
+        for features in note_features:
+            results.append(self._select_best_dates(features, probabilities[offset:offset + len(features)]))
+            offset += len(features)
+        return results
+
+    def _predict_probabilities(self, features):
+        """
+        Score candidate pairs in batches.
+
+        Returns:
+            list: One relation probability per feature.
+        """
+        probabilities = []
         self.model.eval()
-        
         with torch.no_grad():
-            for data in test_data:
-                output = self.model(data['context'], data['distance'], data['diag_before'])
-                prob = output.item()
-                
-                feature = data['feature']
-                diagnosis = feature['diagnosis']
-                date = feature['date']
-                
-                # Store this prediction for the diagnosis
-                if diagnosis not in diagnosis_predictions:
-                    diagnosis_predictions[diagnosis] = []
-                
-                diagnosis_predictions[diagnosis].append({
-                    'date': date,
-                    'confidence': prob
-                })
-        
-        # For each diagnosis, select the date with the highest confidence
+            for start in range(0, len(features), self.batch_size):
+                batch = create_prediction_batch(features[start:start + self.batch_size], self.vocab, self.device,
+                                                self.pred_max_distance, self.pred_max_context_len)
+                output = self.model(batch['context'], batch['distance'], batch['diag_before'])
+                probabilities.extend(output.cpu().tolist())
+        return probabilities
+
+    def _select_best_dates(self, features, probabilities):
+        """
+        For each diagnosis, keep the date with the highest confidence (above the threshold).
+
+        Returns:
+            list: Relationship dicts for one note.
+        """
+        # Create a dictionary to store the best prediction for each diagnosis
+        best_predictions = {}
+        for feature, prob in zip(features, probabilities):
+            diagnosis = feature['diagnosis']
+            best = best_predictions.get(diagnosis)
+            if best is None or prob > best['confidence']:
+                best_predictions[diagnosis] = {'date': feature['date'], 'confidence': prob}
+
         relationships = []
-        for diagnosis, predictions in diagnosis_predictions.items():
-            if predictions:
-                # Sort predictions by confidence (highest first)
-                best_prediction = max(predictions, key=lambda x: x['confidence'])
-                
-                # Add the best prediction to our results
-                relationships.append({
-                    'diagnosis': diagnosis,
-                    'date': best_prediction['date'],
-                    'confidence': best_prediction['confidence']
-                })
-        
-        return relationships 
\ No newline at end of file
+        for diagnosis, best_prediction in best_predictions.items():
+            if best_prediction['confidence'] < self.confidence_threshold:
+                continue
+            relationships.append({
+                'diagnosis': diagnosis,
+                'date': best_prediction['date'],
+                'confidence': best_prediction['confidence']
+            })
+        return relationships
@@ -1,10 +1,35 @@
-import os
 import json
-import torch
 from extractors.base_extractor import BaseRelationExtractor
 from utils.extraction_utils import extract_entities
+from utils.llama_utils import get_llama_pipeline, generate_chat_batch
+from utils.structured_output_utils import (
+    RelationshipArrayConstraint,
+    batch_prefix_allowed_tokens_fn,
+    parse_relationships_json
+)
 from tqdm import tqdm
 
+SYSTEM_PROMPT = "You are a medical AI assistant specialized in analyzing clinical notes to find relationships between diagnoses and dates."
+
+# Fixed instructions come before the note so their key/value cache can be reused across notes
+INSTRUCTIONS = """
+        I need you to identify relationships between diagnoses and dates in a clinical note.
+
+        The full clinical note text is provided below, along with diagnoses and dates that have been extracted, including their positions in the text.
+        
+        For each diagnosis listed in 'Diagnoses Info', identify the single most relevant date from the 'Dates Info' list based on the context in the 'Clinical Note'.
+
+        Return ONLY a JSON array where each object represents a likely relationship and has the following structure:
+        {
+            "diagnosis": "name of diagnosis from the Diagnoses Info list",
+            "date": "the RAW date string (from raw_date field) associated with the diagnosis",
+            "confidence": a number between 0 and 1 indicating your confidence in this association
+        }
+        Do not include diagnoses that have no associated date in the output.
+
+        Provide ONLY the JSON array, no other explanation or text.
+"""
+
 class LlamaExtractor(BaseRelationExtractor):
     """
     Relation extractor that uses Llama 3.2 3B model locally to identify 
@@ -22,6 +47,12 @@ class LlamaExtractor(BaseRelationExtractor):
         self.model_id = config.LLAMA_MODEL_PATH if hasattr(config, 'LLAMA_MODEL_PATH') else './Llama-3.2-3B-Instruct'
         self.name = "Llama-3.2"
         self.pipeline = None
+        self.batch_size = getattr(config, 'LLAMA_BATCH_SIZE', 4)
+        self.max_new_tokens = getattr(config, 'LLAMA_MAX_NEW_TOKENS', 2000)
+        self.tokens_per_diagnosis = getattr(config, 'LLAMA_TOKENS_PER_DIAGNOSIS', 48)
+        self.base_new_tokens = getattr(config, 'LLAMA_BASE_NEW_TOKENS', 32)
+        self.use_prefix_cache = getattr(config, 'LLAMA_PREFIX_CACHE', True)
+        self.structured_output = getattr(config, 'LLAMA_STRUCTURED_OUTPUT', True)
         
     def load(self):
         """
@@ -33,28 +64,13 @@ class LlamaExtractor(BaseRelationExtractor):
         try:
             # Check if transformers package is installed
             try:
-                from transformers import pipeline
+                import transformers
             except ImportError:
                 print("Error: transformers package not installed. Install with 'pip install transformers'.")
                 return False
                 
-            # Create a loading indicator since model loading can take time
-            with tqdm(total=100, desc="Loading Llama model", unit="%") as pbar:
-                print(f"Loading Llama model from {self.model_id}...")
-                
-                # Update progress to 25% - started loading
-                pbar.update(25)
-                
-                # Load the model
-                self.pipeline = pipeline(
-                    "text-generation",
-                    model=self.model_id,
-                    torch_dtype=torch.bfloat16,
-                    device_map="auto",
-                )
-                
-                # Update progress to 100% - done loading
-                pbar.update(75)
+            # Shared with relative date extraction, so the model is only loaded once per process
+            self.pipeline = get_llama_pipeline(self.model_id)
                 
             print("Llama Extractor: Model initialized successfully.")
             return True
@@ -78,147 +94,130 @@ class LlamaExtractor(BaseRelationExtractor):
                     'confidence': float    # Model prediction confidence
                 }
         """
+        return self.extract_batch([text], [entities])[0]
+    
+    def extract_batch(self, texts, entities_list=None):
+        """
+        Extract relationships for several notes with batched generation.
+        
+        Notes are grouped into batches of LLAMA_BATCH_SIZE (notes with similar output
+        budgets together) and each batch is generated in a single model.generate() call.
+        With LLAMA_PREFIX_CACHE the cached system prompt and instructions are reused, so
+        only the note-specific part of each prompt is prefilled. With
+        LLAMA_STRUCTURED_OUTPUT decoding is constrained to a JSON array that only uses
+        the note's diagnoses and raw dates, and stops once the array is closed.
+        
+        Args:
+            texts (list): Clinical note texts.
+            entities_list (list, optional): One (diagnoses, dates) tuple or None per note.
+            
+        Returns:
+            list: One list of relationship dicts (as returned by extract()) per note.
+        """
         if self.pipeline is None:
             print("Llama model not initialized. Call load() first.")
-            return []
+            return [[] for _ in texts]
+        if entities_list is None:
+            entities_list = [None] * len(texts)
         
-        if entities is None:
-            diagnoses, dates = extract_entities(text)
-        else:
-            diagnoses, dates = entities
+        results = [[] for _ in texts]
+        requests = []  # (note index, note-specific prompt input, max_new_tokens, constraint)
+        for i, (text, entities) in enumerate(zip(texts, entities_list)):
+            if entities is None:
+                diagnoses, dates = extract_entities(text)
+            else:
+                diagnoses, dates = entities
+            # Nothing to relate - skip the model call
+            if not diagnoses or not dates:
+                continue
+            constraint = None
+            budget = self._max_new_tokens(len(diagnoses))
+            if self.structured_output:
+                constraint = RelationshipArrayConstraint(
+                    self.pipeline.tokenizer, [d[0] for d in diagnoses], [d[1] for d in dates]
+                )
+                # The grammar bounds the output length exactly, so the array is never cut off
+                budget = min(self.max_new_tokens, constraint.max_new_tokens())
+            requests.append((i, self._build_note_input(text, diagnoses, dates), budget, constraint))
         
+        # Batch notes with similar output budgets so short answers don't wait on long ones
+        requests.sort(key=lambda request: request[2])
+        batches = [requests[start:start + self.batch_size] for start in range(0, len(requests), self.batch_size)]
+        for batch in tqdm(batches, desc="Llama generation", unit="batch", disable=len(batches) < 2):
+            generate_kwargs = {}
+            if self.structured_output:
+                generate_kwargs['prefix_allowed_tokens_fn'] = batch_prefix_allowed_tokens_fn(
+                    [constraint for _, _, _, constraint in batch]
+                )
+            try:
+                responses = generate_chat_batch(
+                    self.pipeline, SYSTEM_PROMPT, INSTRUCTIONS,
+                    [note_input for _, note_input, _, _ in batch],
+                    max(budget for _, _, budget, _ in batch),
+                    use_prefix_cache=self.use_prefix_cache,
+                    **generate_kwargs
+                )
+            except Exception as e:
+                print(f"Error during model inference: {e}")
+                continue
+            for (i, _, _, _), response in zip(batch, responses):
+                if self.structured_output:
+                    results[i] = parse_relationships_json(response)
+                else:
+                    results[i] = self._parse_response(response)
+        return results
+    
+    def _max_new_tokens(self, num_diagnoses):
+        """Output token budget: one JSON object per diagnosis plus array/formatting overhead."""
+        return min(self.max_new_tokens, self.base_new_tokens + self.tokens_per_diagnosis * num_diagnoses)
+    
+    def _build_note_input(self, text, diagnoses, dates):
+        """Build the note-specific part of the user message (follows INSTRUCTIONS)."""
         # Extract diagnosis names and positions
         diagnoses_info = [{"diagnosis": d[0], "position": d[1]} for d in diagnoses]
         # Extract parsed date, raw date string, and position
         dates_info = [{"parsed_date": d[0], "raw_date": d[1], "position": d[2]} for d in dates]
         
-        # Construct the messages for the model
-        system_prompt = "You are a medical AI assistant specialized in analyzing clinical notes to find relationships between diagnoses and dates."
-        
-        user_prompt = f"""
-        I need you to identify relationships between diagnoses and dates in a clinical note.
-
-        The full clinical note text is provided below, along with diagnoses and dates that have been extracted, including their positions in the text.
-        
-        For each diagnosis listed in 'Diagnoses Info', identify the single most relevant date from the 'Dates Info' list based on the context in the 'Clinical Note'.
-
-        Return ONLY a JSON array where each object represents a likely relationship and has the following structure:
-        {{
-            "diagnosis": "name of diagnosis from the Diagnoses Info list",
-            "date": "the RAW date string (from raw_date field) associated with the diagnosis",
-            "confidence": a number between 0 and 1 indicating your confidence in this association
-        }}
-        Do not include diagnoses that have no associated date in the output.
-
+        return f"""
         Clinical Note: {text}
 
         Diagnoses Info: {diagnoses_info}
         Dates Info: {dates_info}
-
-        Provide ONLY the JSON array, no other explanation or text.
         """
+    
+    def _parse_response(self, response_content):
+        """
+        Parse the JSON array of relationships from a model response.
         
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        Returns:
+            list: Relationship dicts with float confidences ([] if no valid array was found).
+        """
+        response_content = response_content.strip()
+        # Extract JSON from the response
+        start_idx = response_content.find('[')
+        end_idx = response_content.rfind(']') + 1
         
-        try:
-            # Show a continuous spinner during inference
-            import sys
-            import time
-            import threading
-            
-            # Create a threading event to signal when to stop the spinner
-            stop_spinner = threading.Event()
-            
-            # Define the spinner function
-            def spinner_function():
-                chars = "|/-\\"
-                i = 0
-                start_time = time.time()
-                while not stop_spinner.is_set():
-                    elapsed = int(time.time() - start_time)
-                    mins, secs = divmod(elapsed, 60)
-                    timeformat = f"{mins:02d}:{secs:02d}"
-                    sys.stdout.write(f"\rGenerating response... {chars[i % len(chars)]} [{timeformat} elapsed]")
-                    sys.stdout.flush()
-                    time.sleep(0.1)
-                    i += 1
-                
-                # Clear the spinner line when done
-                sys.stdout.write("\rInference complete!                                  \n")
-                sys.stdout.flush()
-            
-            # Start the spinner in a separate thread
-            spinner_thread = threading.Thread(target=spinner_function)
-            spinner_thread.daemon = True
-            spinner_thread.start()
-            
-            try:
-                # Run the model
-                outputs = self.pipeline(
-                    messages,
-                    max_new_tokens=2000,
-                    do_sample=False,  # Deterministic generation
-                    temperature=None,  # Explicitly set to None to override defaults
-                    top_p=None,       # Explicitly set to None to override defaults
-                )
-            finally:
-                # Stop the spinner when inference is done (even if there's an error)
-                stop_spinner.set()
-                spinner_thread.join(timeout=1.0)  # Wait for spinner to finish
-            
-            # Based on the example in llama.py, we extract the assistant's response
-            # which is the last message in the generated output
-            response_content = ""
+        if start_idx >= 0 and end_idx > start_idx:
+            json_str = response_content[start_idx:end_idx]
             try:
-                # Get the last message from the generated conversation
-                last_message = outputs[0]["generated_text"][-1]
+                relationships = json.loads(json_str)
                 
-                # The last message should be a dict with the assistant's response
-                if isinstance(last_message, dict) and "content" in last_message:
-                    response_content = last_message["content"].strip()
-                else:
-                    # If it's not a dict with content, try to use it directly
-                    response_content = str(last_message).strip()
-            except (IndexError, KeyError, AttributeError) as e:
-                print(f"Error extracting response from model output: {e}")
-                print(f"Output format: {type(outputs)}")
-                # Try a fallback approach
-                if isinstance(outputs, list) and len(outputs) > 0:
-                    print("Attempting fallback extraction...")
-                    response_content = str(outputs[0])
-            
-            # Extract JSON from the response
-            start_idx = response_content.find('[')
-            end_idx = response_content.rfind(']') + 1
-            
-            if start_idx >= 0 and end_idx > start_idx:
-                json_str = response_content[start_idx:end_idx]
-                try:
-                    relationships = json.loads(json_str)
-                    
-                    # Ensure confidence is a float
-                    for rel in relationships:
-                        if 'confidence' in rel:
-                            try:
-                                rel['confidence'] = float(rel['confidence'])
-                            except (ValueError, TypeError):
-                                rel['confidence'] = 0.5
-                        else:
-                            rel['confidence'] = 1.0
-                            
-                    return relationships
-                except json.JSONDecodeError as e:
-                    print(f"Error parsing JSON: {e}")
-                    print(f"JSON string: {json_str[:100]}...")
-                    return []
-            else:
-                print(f"Error: Could not find JSON array in model response")
-                print(f"Response content: {response_content[:100]}...")
+                # Ensure confidence is a float
+                for rel in relationships:
+                    if 'confidence' in rel:
+                        try:
+                            rel['confidence'] = float(rel['confidence'])
+                        except (ValueError, TypeError):
+                            rel['confidence'] = 0.5
+                    else:
+                        rel['confidence'] = 1.0
+                        
+                return relationships
+            except json.JSONDecodeError as e:
+                print(f"Error parsing JSON: {e}")
+                print(f"JSON string: {json_str[:100]}...")
                 return []
-            
-        except Exception as e:
-            print(f"Error during model inference or processing: {e}")
-            return [] 
\ No newline at end of file
+        else:
+            print(f"Error: Could not find JSON array in model response")
+            print(f"Response content: {response_content[:100]}...")
+            return []
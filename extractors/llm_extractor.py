@@ -1,8 +1,87 @@
-import os
 import json
-from dotenv import load_dotenv
 from extractors.base_extractor import BaseRelationExtractor
 from utils.extraction_utils import extract_entities
+from utils.structured_output_utils import (
+    combined_response_format,
+    relationship_response_format,
+    packed_relationship_response_format,
+    parse_relationships_json,
+    normalize_relationships
+)
+from utils.openai_client import get_openai_client
+from utils.llm_usage_utils import create_chat_completion
+from utils.openai_batch_utils import chat_request, create_batch_backend, run_batch_job
+from utils.segmentation_utils import get_section_window, split_sections, restrict_entities_to_sections
+from utils.prompt_utils import (
+    build_compact_note_input,
+    map_compact_relationships,
+    count_tokens,
+    PromptSavings
+)
+
+SYSTEM_PROMPT = "You are a medical AI assistant specialized in analyzing unstructured clinical notes."
+
+# Completion token budget of a single-note request
+MAX_COMPLETION_TOKENS = 2000
+# Estimated output of one note in a packed response: its key and array, plus at most one
+# relationship object per diagnosis
+PACKED_NOTE_OUTPUT_TOKENS = 20
+RELATIONSHIP_OUTPUT_TOKENS = 40
+
+# Instructions for the compact prompt (fixed, so they come before the note-specific input)
+COMPACT_INSTRUCTIONS = """You are tasked with doing relationship extraction between diagnoses and dates from unstructured medical text.
+
+Below are excerpts of a clinical note around the entity mentions, separated by "...". Each diagnosis mention is preceded by its ID (e.g. [D1]) and each date mention by its ID (e.g. [T1]). The 'Diagnoses' line gives the diagnosis for each D ID.
+
+For each diagnosis ID, identify the single most relevant date ID based on the context. Do not include diagnoses that have no associated date.
+
+Return ONLY a JSON array where each object has the structure:
+{"diagnosis": "D ID", "date": "T ID", "confidence": a number between 0 and 1 indicating your confidence in this association}
+
+"""
+
+# Instructions for several notes packed into one request (see extract_batch)
+PACKED_HEADER = """You are tasked with doing relationship extraction between diagnoses and dates from unstructured medical text.
+
+Several clinical notes are given below. Each starts with a line "### Note <number>". Handle each note independently.
+
+"""
+
+COMPACT_NOTE_FORMAT = """Each note is given as excerpts around its entity mentions, separated by "...". Each diagnosis mention is preceded by its ID (e.g. [D1]) and each date mention by its ID (e.g. [T1]). The note's 'Diagnoses' line gives the diagnosis for each D ID; IDs are local to their note.
+
+For each diagnosis ID, identify the single most relevant date ID from the same note based on the context. Do not include diagnoses that have no associated date.
+
+Each relationship is an object with the structure:
+{"diagnosis": "D ID", "date": "T ID", "confidence": a number between 0 and 1 indicating your confidence in this association}
+
+"""
+
+FULL_NOTE_FORMAT = """Each note is given with lists of its diagnoses and dates, along with their character positions in the text ('Diagnoses Info', 'Dates Info').
+
+For each diagnosis listed in a note's 'Diagnoses Info', identify the single most relevant date from that note's 'Dates Info' list based on the context in its 'Clinical Note'. Do not include diagnoses that have no associated date.
+
+Each relationship is an object with the structure:
+{"diagnosis": "name of diagnosis from the Diagnoses Info list", "date": "the RAW date string (from raw_date field) associated with the diagnosis", "confidence": a number between 0 and 1 indicating your confidence in this association}
+
+"""
+
+# Instructions for combined relative date and relationship extraction (one request per note)
+COMBINED_INSTRUCTIONS = """You are tasked with extracting relative dates and relationships between diagnoses and dates from unstructured medical text.
+
+Below is a clinical note with its document creation date. Each diagnosis mention is preceded by its ID (e.g. [D1]) and each date mention by its ID (e.g. [T1]). The 'Diagnoses' line gives the diagnosis for each D ID. IDs are not part of the note text.
+
+Task 1: Find all phrases that describe dates relative to the document creation date (e.g. "last year", "six months ago", "yesterday", "next week", "in 3 days"). For each, give the exact phrase, the start character index of the phrase in the note text and the absolute date it refers to in YYYY-MM-DD format.
+
+Task 2: For each diagnosis ID, identify the single most relevant date based on the context: either a date ID (e.g. "T1") or the calculated YYYY-MM-DD date of a relative date phrase from Task 1. Do not include diagnoses that have no associated date.
+
+Return ONLY a JSON object with the structure:
+{"relative_dates": [{"phrase": "...", "start_index": integer, "calculated_date": "YYYY-MM-DD"}], "relationships": [{"diagnosis": "D ID", "date": "T ID or YYYY-MM-DD", "confidence": a number between 0 and 1 indicating your confidence in this association}]}
+
+"""
+
+PACKED_FOOTER = """Return ONLY a JSON object with one key per note number (e.g. "1", "2"), whose value is the JSON array of relationships for that note ([] if it has none).
+
+"""
 
 class LLMExtractor(BaseRelationExtractor):
     """
@@ -23,6 +102,28 @@ class LLMExtractor(BaseRelationExtractor):
         self.api_key = None 
         self.model_name = config.OPENAI_MODEL if hasattr(config, 'OPENAI_MODEL') else 'gpt-4o'
         self.name = f"LLM ({self.model_name})"
+        self.structured_output = getattr(config, 'LLM_STRUCTURED_OUTPUT', True)
+        self.compact_prompt = getattr(config, 'LLM_COMPACT_PROMPT', False)
+        self.prompt_window_chars = getattr(config, 'LLM_PROMPT_WINDOW_CHARS', 150)
+        # Leave out entities with no candidate partner in the same/adjacent note sections
+        # (SECTION_RESTRICTION) and keep compact excerpts within their sections
+        self.section_window = get_section_window(config)
+        self.debug = getattr(config, 'DEBUG_MODE', False)
+        # Several short notes per request, up to a prompt token budget
+        self.pack_notes = getattr(config, 'LLM_PACK_NOTES', False)
+        self.pack_max_tokens = getattr(config, 'LLM_PACK_MAX_PROMPT_TOKENS', 4000)
+        self.pack_max_notes = getattr(config, 'LLM_PACK_MAX_NOTES', 8)
+        self.pack_max_output_tokens = getattr(config, 'LLM_PACK_MAX_OUTPUT_TOKENS', 4000)
+        # Prompt token totals (full vs. compact prompt) and API request counts
+        self.prompt_savings = PromptSavings()
+        self.num_requests = 0
+        self.num_packed_requests = 0
+        # One request per note returns both relative dates and relationships (run_extraction
+        # uses extract_with_relative_dates for notes with a document timestamp)
+        self.combined_relative_dates = getattr(config, 'LLM_COMBINED_RELATIVE_DATES', False)
+        # Offline batch jobs (run_extraction calls extract_batch_job for all notes at once)
+        self.batch_mode = getattr(config, 'LLM_BATCH_MODE', False)
+        self.batch_backend = None
         self.client = None
         
     def load(self):
@@ -33,24 +134,21 @@ class LLMExtractor(BaseRelationExtractor):
             bool: True if successfully loaded, False otherwise.
         """
         try:
-            # Load environment variables from .env file
-            load_dotenv()
-            self.api_key = os.getenv('OPENAI_API_KEY')
+            # The local batch backend answers requests itself - no API client needed
+            if self.batch_mode and getattr(self.config, 'OPENAI_BATCH_BACKEND', 'openai') == 'local':
+                self.batch_backend = create_batch_backend(self.config)
+                print("LLM Extractor: Using the local batch backend (no API calls).")
+                return True
             
-            # Check if openai package is installed
+            # Shared OpenAI client (keep-alive connection pool reused by all OpenAI calls)
             try:
-                from openai import OpenAI
-            except ImportError:
-                print("Error: openai package not installed. Install with 'pip install openai'.")
-                return False
-            
-            # Check if API key was loaded
-            if not self.api_key:
-                print("Error: OPENAI_API_KEY not found in .env file or environment variables.")
+                self.client = get_openai_client(self.config)
+            except (ImportError, ValueError) as e:
+                print(f"Error: {e}")
                 return False
-            
-            # Initialize OpenAI client
-            self.client = OpenAI(api_key=self.api_key)
+            self.api_key = self.client.api_key
+            if self.batch_mode:
+                self.batch_backend = create_batch_backend(self.config, self.client)
             print("LLM Extractor: OpenAI client initialized successfully.")
             return True
         except Exception as e:
@@ -77,11 +175,266 @@ class LLMExtractor(BaseRelationExtractor):
             print("LLM client (OpenAI) not initialized. Call load() first.")
             return []
         
+        note = self._prepare_note(text, entities)
+        if note is None:
+            return []
+        return self._request_single(note)
+    
+    def extract_batch(self, texts, entities_list=None):
+        """
+        Extract relationships for several notes, packing short notes into shared requests.
+        
+        With LLM_PACK_NOTES, notes are added (in order) to a request until the prompt would
+        exceed LLM_PACK_MAX_PROMPT_TOKENS or hold LLM_PACK_MAX_NOTES notes. The model returns
+        one relationship array per note number, which is split back into per-note lists.
+        Notes missing from a packed response are retried on their own.
+        
+        Args:
+            texts (list): Clinical note texts.
+            entities_list (list, optional): One (diagnoses, dates) tuple or None per note.
+            
+        Returns:
+            list: One list of relationship dicts (as returned by extract()) per note.
+        """
+        if not self.pack_notes or self.client is None:
+            return super().extract_batch(texts, entities_list)
+        if entities_list is None:
+            entities_list = [None] * len(texts)
+        
+        results = [[] for _ in texts]
+        notes = []
+        for i, (text, entities) in enumerate(zip(texts, entities_list)):
+            note = self._prepare_note(text, entities)
+            if note is not None:
+                notes.append((i, note))
+        
+        for pack in self._pack(notes):
+            if len(pack) == 1:
+                i, note = pack[0]
+                results[i] = self._request_single(note)
+                continue
+            packed_results = self._request_packed([note for _, note in pack])
+            for (i, note), relationships in zip(pack, packed_results):
+                results[i] = relationships if relationships is not None else self._request_single(note)
+        return results
+    
+    def extract_with_relative_dates(self, text, entities, document_timestamp):
+        """
+        Extract relative dates and relationships with a single request.
+        
+        The whole note is sent with its entity mentions marked by IDs, together with the
+        document date. The model resolves relative date phrases and links each diagnosis
+        to a date ID or to one of the resolved relative dates.
+        
+        Args:
+            text (str): The clinical note text.
+            entities (tuple): (diagnoses, dates) of the note (dates without relative dates).
+            document_timestamp (datetime): The timestamp of the document.
+            
+        Returns:
+            tuple: (relationships, relative_dates) where relationships are dicts as returned
+                   by extract() (relative dates as YYYY-MM-DD) and relative_dates are
+                   (parsed_date_str, raw_phrase_str, start_position) tuples, or None if no
+                   request was made, it failed or its response was malformed.
+        """
+        if self.client is None:
+            print("LLM client (OpenAI) not initialized. Call load() first.")
+            return [], None
+        if entities is None:
+            entities = extract_entities(text)
+        diagnoses, dates = entities
+        if not diagnoses:
+            return [], None
+        
+        # A window spanning the whole note keeps the full text (relative dates can be anywhere)
+        compact = build_compact_note_input(text, diagnoses, dates, window_chars=len(text))
+        prompt = (COMBINED_INSTRUCTIONS
+                  + f"Document creation date: {document_timestamp.strftime('%Y-%m-%d')}\n"
+                  + compact['note_input'])
+        response_format = combined_response_format(list(compact['diagnosis_ids'])) if self.structured_output else None
+        try:
+            content = self._chat(self._chat_body(prompt, response_format)).content
+        except Exception as e:
+            print(f"Error during combined LLM request: {e}")
+            return [], None
+        return self._parse_combined(content or '', compact)
+    
+    def _parse_combined(self, content, compact):
+        """Split a combined response into relationships and relative date tuples."""
+        response_text = content.strip()
+        start_idx = response_text.find('{')
+        end_idx = response_text.rfind('}') + 1
+        try:
+            data = json.loads(response_text[start_idx:end_idx]) if start_idx >= 0 and end_idx > start_idx else None
+        except json.JSONDecodeError as e:
+            print(f"Error parsing combined LLM response: {e}")
+            data = None
+        if not isinstance(data, dict):
+            print("Error: Could not find a JSON object in combined LLM response")
+            return [], None
+        
+        # Without a relative_dates array the note's relative dates are unknown (None), not empty
+        relative_dates = None
+        if isinstance(data.get('relative_dates'), list):
+            relative_dates = []
+            for item in data['relative_dates']:
+                if not isinstance(item, dict):
+                    continue
+                phrase = item.get('phrase', '')
+                calculated_date = item.get('calculated_date', '')
+                # Only add valid entries
+                if phrase and calculated_date:
+                    relative_dates.append((calculated_date, phrase, item.get('start_index', 0)))
+        resolved_dates = {date for date, _, _ in relative_dates or []}
+        
+        relationships = []
+        for rel in normalize_relationships(data.get('relationships')):
+            diagnosis = compact['diagnosis_ids'].get(str(rel['diagnosis']).strip().strip('[]'))
+            date = str(rel['date']).strip().strip('[]')
+            # A date ID maps to its raw date string; a relative date is kept as YYYY-MM-DD
+            date = compact['date_ids'].get(date, date if date in resolved_dates else None)
+            if diagnosis is None or date is None:
+                continue
+            relationships.append({**rel, 'diagnosis': diagnosis, 'date': date})
+        return relationships, relative_dates
+    
+    def extract_batch_job(self, texts, entities_list=None):
+        """
+        Extract relationships for many notes with one offline batch job.
+        
+        Every request (single notes, or packed notes with LLM_PACK_NOTES) is written to a
+        Batch API JSONL file, submitted through the OPENAI_BATCH_BACKEND backend and polled
+        until done. Responses are matched back to their notes by custom_id.
+        
+        Args:
+            texts (list): Clinical note texts.
+            entities_list (list, optional): One (diagnoses, dates) tuple or None per note.
+            
+        Returns:
+            list: One list of relationship dicts (as returned by extract()) per note.
+            
+        Raises:
+            BatchJobError: If the batch job timed out or did not complete.
+        """
+        if self.batch_backend is None:
+            print("LLM batch backend not initialized. Call load() with LLM_BATCH_MODE enabled.")
+            return [[] for _ in texts]
+        if entities_list is None:
+            entities_list = [None] * len(texts)
+        
+        notes = []
+        for i, (text, entities) in enumerate(zip(texts, entities_list)):
+            note = self._prepare_note(text, entities)
+            if note is not None:
+                notes.append((i, note))
+        packs = self._pack(notes) if self.pack_notes else [[item] for item in notes]
+        job_name = f"relations_{self.model_name}_{len(texts)}notes"
+        
+        results = [[] for _ in texts]
+        retry = self._collect_batch_results(packs, job_name, results)
+        if retry:
+            # As in extract_batch(): notes missing from a packed response (or whose packed
+            # response could not be parsed) are requested again on their own
+            print(f"Resubmitting {len(retry)} notes from packed batch responses as single requests")
+            self._collect_batch_results([[item] for item in retry], job_name + '_retry', results)
+        return results
+    
+    def _collect_batch_results(self, packs, job_name, results):
+        """
+        Run one batch job for the packs and store each note's relationships in results.
+        
+        A response that fails to parse only affects its own request: a single note keeps
+        [] and the notes of a packed request are returned for a retry.
+        
+        Returns:
+            list: (index, note) pairs of packed notes without a usable result.
+        
+        Raises:
+            BatchJobError: If the batch job did not complete (see run_batch_job()).
+        """
+        requests = []
+        for pack in packs:
+            custom_id = 'notes-' + '-'.join(str(i) for i, _ in pack)
+            if len(pack) == 1:
+                body = self._single_body(pack[0][1])
+            else:
+                body = self._packed_body([note for _, note in pack])
+            requests.append(chat_request(custom_id, body))
+        self.num_requests += len(requests)
+        self.num_packed_requests += sum(1 for pack in packs if len(pack) > 1)
+        
+        contents = run_batch_job(
+            requests, self.batch_backend,
+            job_name=job_name,
+            usage_component=self.name,
+            config=self.config,
+            work_dir=getattr(self.config, 'OPENAI_BATCH_DIR', 'batch_jobs'),
+            poll_seconds=getattr(self.config, 'OPENAI_BATCH_POLL_SECONDS', 30),
+            timeout_seconds=getattr(self.config, 'OPENAI_BATCH_TIMEOUT_HOURS', 24) * 3600
+        )
+        
+        retry = []
+        for pack, request in zip(packs, requests):
+            content = contents.get(request['custom_id'])
+            if content is None:
+                continue
+            try:
+                if len(pack) == 1:
+                    i, note = pack[0]
+                    results[i] = self._parse_single(content, note)
+                    continue
+                for (i, note), relationships in zip(pack, self._parse_packed(content, [note for _, note in pack])):
+                    if relationships is None:
+                        retry.append((i, note))
+                    else:
+                        results[i] = relationships
+            except Exception as e:
+                print(f"Error parsing batch response {request['custom_id']}: {e}")
+                if len(pack) > 1:
+                    retry.extend(item for item in pack if item not in retry)
+        return retry
+    
+    def _pack(self, notes):
+        """Greedily group (index, note) pairs into requests up to the prompt and output token budgets and note limit."""
+        instruction_tokens, _ = count_tokens(SYSTEM_PROMPT + self._packed_instructions(), self.model_name)
+        packs = []
+        current, current_tokens, current_output_tokens = [], instruction_tokens, 0
+        for i, note in notes:
+            if current and (len(current) >= self.pack_max_notes
+                            or current_tokens + note['tokens'] > self.pack_max_tokens
+                            or current_output_tokens + note['output_tokens'] > self.pack_max_output_tokens):
+                packs.append(current)
+                current, current_tokens, current_output_tokens = [], instruction_tokens, 0
+            current.append((i, note))
+            current_tokens += note['tokens']
+            current_output_tokens += note['output_tokens']
+        if current:
+            packs.append(current)
+        return packs
+    
+    def _prepare_note(self, text, entities):
+        """
+        Build the prompt parts for one note.
+        
+        Returns:
+            dict or None: The note's entities, single-note prompt, section for packed
+                prompts, compact ID mapping (or None) and section token count. None if
+                the note cannot have any relationships (structured output only).
+        """
         if entities is None:
             diagnoses, dates = extract_entities(text)
         else:
             diagnoses, dates = entities
         
+        sections = None
+        if self.section_window is not None:
+            sections = split_sections(text)
+            diagnoses, dates = restrict_entities_to_sections(text, diagnoses, dates, self.section_window, sections)
+        
+        # With structured output the answer can only be an empty array - skip the call
+        if self.structured_output and (not diagnoses or not dates):
+            return None
+        
         # Extract diagnosis names and positions
         diagnoses_info = [{"diagnosis": d[0], "position": d[1]} for d in diagnoses]
         # Extract parsed date, raw date string, and position
@@ -112,38 +465,183 @@ class LLMExtractor(BaseRelationExtractor):
         Provide ONLY the JSON array, no other explanation.
         """
         
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": "You are a medical AI assistant specialized in analyzing unstructured clinical notes."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0,  
-                max_tokens=2000
+        note = {
+            'diagnoses': diagnoses,
+            'dates': dates,
+            'prompt': prompt,
+            'section': f"Clinical Note: {text}\n\nDiagnoses Info: {diagnoses_info}\nDates Info: {dates_info}",
+            'compact': None
+        }
+        
+        if self.compact_prompt:
+            compact = build_compact_note_input(text, diagnoses, dates, window_chars=self.prompt_window_chars,
+                                               sections=sections)
+            full_tokens, exact = count_tokens(SYSTEM_PROMPT + prompt, self.model_name)
+            note['prompt'] = COMPACT_INSTRUCTIONS + compact['note_input']
+            note['section'] = compact['note_input']
+            note['compact'] = compact
+            compact_tokens, _ = count_tokens(SYSTEM_PROMPT + note['prompt'], self.model_name)
+            self.prompt_savings.add(full_tokens, compact_tokens, exact)
+            if self.debug:
+                print(f"Compact prompt: {full_tokens} -> {compact_tokens} tokens "
+                      f"({100 * (1 - compact_tokens / full_tokens):.1f}% saved)")
+        
+        note['tokens'], _ = count_tokens(note['section'], self.model_name)
+        note['output_tokens'] = PACKED_NOTE_OUTPUT_TOKENS + RELATIONSHIP_OUTPUT_TOKENS * len(diagnoses)
+        return note
+    
+    def _entity_choices(self, note):
+        """Diagnosis and date values the model may answer with (compact IDs or names/raw dates)."""
+        if note['compact']:
+            return list(note['compact']['diagnosis_ids']), list(note['compact']['date_ids'])
+        return [d[0] for d in note['diagnoses']], [d[1] for d in note['dates']]
+    
+    def _packed_instructions(self):
+        note_format = COMPACT_NOTE_FORMAT if self.compact_prompt else FULL_NOTE_FORMAT
+        return PACKED_HEADER + note_format + PACKED_FOOTER
+    
+    def _chat_body(self, prompt, response_format=None, max_tokens=MAX_COMPLETION_TOKENS):
+        """Chat completion request body (used for direct calls and batch files)."""
+        body = {
+            'model': self.model_name,
+            'messages': [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            'temperature': 0,
+            'max_tokens': max_tokens
+        }
+        if response_format:
+            body['response_format'] = response_format
+        return body
+    
+    def _chat(self, body):
+        """Send one chat completion request and return the response message."""
+        self.num_requests += 1
+        # Records tokens, latency, retries and cost for the usage report
+        response = create_chat_completion(self.client, body, self.name, self.config)
+        message = response.choices[0].message
+        if getattr(message, 'refusal', None):
+            raise ValueError(f"LLM refused to answer: {message.refusal}")
+        return message
+    
+    def _single_body(self, note):
+        response_format = None
+        if self.structured_output:
+            # The schema only allows this note's diagnoses and raw dates (or their IDs),
+            # so every response parses and no output tokens are spent on free text
+            response_format = relationship_response_format(*self._entity_choices(note))
+        return self._chat_body(note['prompt'], response_format)
+    
+    def _packed_body(self, notes):
+        keys = [str(number) for number in range(1, len(notes) + 1)]
+        prompt = self._packed_instructions() + "\n\n".join(
+            f"### Note {key}\n{note['section']}" for key, note in zip(keys, notes)
+        )
+        response_format = None
+        if self.structured_output:
+            response_format = packed_relationship_response_format(
+                {key: self._entity_choices(note) for key, note in zip(keys, notes)}
             )
-            
-            response_text = response.choices[0].message.content.strip()
-            
-            start_idx = response_text.find('[')
-            end_idx = response_text.rfind(']') + 1
-            
-            if start_idx >= 0 and end_idx > start_idx:
-                json_str = response_text[start_idx:end_idx]
-                relationships = json.loads(json_str)
-                for rel in relationships:
-                    if 'confidence' in rel:
-                         try:
-                             rel['confidence'] = float(rel['confidence'])
-                         except (ValueError, TypeError):
-                             rel['confidence'] = 0.0 
-                    else:
-                         rel['confidence'] = 1.0 
-                return relationships
-            else:
-                print(f"Error: Could not find JSON array in LLM response: {response_text}")
-                return []
-            
+        # The output grows with the number of notes (_pack keeps it within LLM_PACK_MAX_OUTPUT_TOKENS)
+        max_tokens = max(MAX_COMPLETION_TOKENS, sum(note['output_tokens'] for note in notes))
+        return self._chat_body(prompt, response_format, max_tokens)
+    
+    def _parse_single(self, content, note):
+        """Parse one note's relationships from response content."""
+        if self.structured_output:
+            relationships = parse_relationships_json(content or '')
+            return map_compact_relationships(relationships, note['compact']) if note['compact'] else relationships
+        
+        response_text = content.strip()
+        
+        start_idx = response_text.find('[')
+        end_idx = response_text.rfind(']') + 1
+        
+        if start_idx >= 0 and end_idx > start_idx:
+            json_str = response_text[start_idx:end_idx]
+            relationships = []
+            # Skip items that are not relationship objects
+            for rel in json.loads(json_str):
+                if not isinstance(rel, dict):
+                    continue
+                if 'confidence' in rel:
+                     try:
+                         rel['confidence'] = float(rel['confidence'])
+                     except (ValueError, TypeError):
+                         rel['confidence'] = 0.0 
+                else:
+                     rel['confidence'] = 1.0 
+                relationships.append(rel)
+            return map_compact_relationships(relationships, note['compact']) if note['compact'] else relationships
+        else:
+            print(f"Error: Could not find JSON array in LLM response: {response_text}")
+            return []
+    
+    def _parse_packed(self, content, notes):
+        """
+        Split a packed response into per-note relationship lists.
+        
+        Returns:
+            list: One relationship list per note, or None for notes missing from the response.
+        """
+        response_text = (content or '').strip()
+        start_idx = response_text.find('{')
+        end_idx = response_text.rfind('}') + 1
+        try:
+            data = json.loads(response_text[start_idx:end_idx]) if start_idx >= 0 and end_idx > start_idx else None
+        except json.JSONDecodeError as e:
+            print(f"Error parsing packed LLM response: {e}")
+            data = None
+        if not isinstance(data, dict):
+            print("Error: Could not find a JSON object in packed LLM response")
+            return [None] * len(notes)
+        
+        results = []
+        for key, note in zip((str(number) for number in range(1, len(notes) + 1)), notes):
+            if not isinstance(data.get(key), list):
+                results.append(None)
+                continue
+            relationships = normalize_relationships(data[key])
+            results.append(map_compact_relationships(relationships, note['compact']) if note['compact'] else relationships)
+        return results
+    
+    def _request_single(self, note):
+        """Extract one note's relationships with its own request."""
+        try:
+            return self._parse_single(self._chat(self._single_body(note)).content, note)
         except Exception as e:
             print(f"Error during LLM API call or processing: {e}")
-            return [] 
\ No newline at end of file
+            return [] 
+    
+    def _request_packed(self, notes):
+        """
+        Extract several notes' relationships with one request.
+        
+        Returns:
+            list: One relationship list per note, or None for notes missing from the
+                  response (or for all notes if the request failed).
+        """
+        try:
+            self.num_packed_requests += 1
+            content = self._chat(self._packed_body(notes)).content
+        except Exception as e:
+            print(f"Error during packed LLM request for {len(notes)} notes: {e}")
+            return [None] * len(notes)
+        return self._parse_packed(content, notes)
+    
+    def get_prompt_stats(self):
+        """
+        Summarize API requests and the prompt token savings of the compact prompt over
+        the full-note prompt.
+        
+        Returns:
+            dict or None: PromptSavings.summary() output (if compact prompts were used)
+                plus request counts, or None if no requests were sent.
+        """
+        if not self.num_requests:
+            return None
+        stats = self.prompt_savings.summary() if self.prompt_savings.notes else {}
+        stats['requests'] = self.num_requests
+        stats['packed_requests'] = self.num_packed_requests
+        return stats
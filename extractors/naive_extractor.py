@@ -1,14 +1,15 @@
 import os
 from extractors.base_extractor import BaseRelationExtractor
 from utils.extraction_utils import extract_entities
-from sklearn.metrics import precision_recall_fscore_support, accuracy_score
+from utils.segmentation_utils import get_section_window, get_entity_sections, in_section_window
 
 class NaiveExtractor(BaseRelationExtractor):
     """
     Relation extractor that uses character proximity as the basis for matching.
     
     This is a naive approach that assigns each diagnosis to the closest date
-    within a configured maximum distance.
+    within a configured maximum distance (and, with SECTION_RESTRICTION, within
+    the same or adjacent note sections).
     """
     
     def __init__(self, config):
@@ -19,6 +20,7 @@ class NaiveExtractor(BaseRelationExtractor):
             config: The configuration object or dict containing PROXIMITY_MAX_DISTANCE parameter.
         """
         self.max_distance = config.PROXIMITY_MAX_DISTANCE if hasattr(config, 'PROXIMITY_MAX_DISTANCE') else 200
+        self.section_window = get_section_window(config)
         self.name = "Naive (Proximity)"
     
     def load(self):
@@ -50,15 +52,23 @@ class NaiveExtractor(BaseRelationExtractor):
         else:
             diagnoses, dates = entities
         
+        # Section of each entity (only needed when candidates are restricted to sections)
+        if self.section_window is not None:
+            diagnosis_sections, date_sections = get_entity_sections(text, (diagnoses, dates))
+        else:
+            diagnosis_sections, date_sections = [0] * len(diagnoses), [0] * len(dates)
+        
         # Find relationships
         relationships = []
         
-        for diagnosis, diag_pos in diagnoses:
+        for (diagnosis, diag_pos), diagnosis_section in zip(diagnoses, diagnosis_sections):
             closest_date = None
             min_distance = float('inf')
             
             # Unpack the 3 elements: parsed_date, raw date_str, position
-            for parsed_date, date_str, date_pos in dates:
+            for (parsed_date, date_str, date_pos), date_section in zip(dates, date_sections):
+                if not in_section_window(diagnosis_section, date_section, self.section_window):
+                    continue
                 distance = abs(diag_pos - date_pos)
                 
                 if distance < min_distance and distance <= self.max_distance:
@@ -1,6 +1,9 @@
 import os
-import matplotlib.pyplot as plt
+import sys
+import argparse
+import subprocess
 import pandas as pd
+import numpy as np
 import json
 # Add tqdm for progress bars
 from tqdm import tqdm
@@ -15,8 +18,22 @@ from utils.extraction_utils import (
     run_extraction,
     get_data_path,
     transform_python_to_json,
-    extract_relative_dates_llm
+    extract_relative_dates_llm,
+    run_relative_date_stage,
+    store_combined_relative_dates
 )
+from utils.profiling_utils import (
+    StageProfiler,
+    STAGE_EXTRACTOR_LOAD,
+    STAGE_MODEL_INFERENCE,
+    STAGE_METRICS,
+    STAGE_CSV_WRITE,
+    STAGE_REPORTING
+)
+from utils.reporting_utils import queue_plot, finish_plots
+from utils.llm_usage_utils import get_usage_tracker
+from utils.openai_batch_utils import BatchJobError
+from utils.settings import load_settings, parse_setting_value
 from data.sample_note import CLINICAL_NOTE
 import config
 
@@ -25,18 +42,98 @@ if 'project_root' not in locals() and 'project_root' not in globals():
     project_root = os.path.dirname(os.path.abspath(__file__))
 EXPERIMENT_OUTPUT_DIR = os.path.join(project_root, "experiment_outputs")
 
-def test_single_note():
+def get_output_dir(settings):
+    """
+    Resolve the experiment output directory (EXPERIMENT_OUTPUT_DIR setting, relative to the project root).
+    """
+    output_dir = getattr(settings, 'EXPERIMENT_OUTPUT_DIR', None) or EXPERIMENT_OUTPUT_DIR
+    return os.path.join(project_root, output_dir)
+
+def create_profiler(run_mode, settings):
+    """
+    Create a stage profiler for an evaluation run, honouring ENABLE_PROFILING in settings.
+    """
+    return StageProfiler(
+        enabled=getattr(settings, 'ENABLE_PROFILING', True),
+        run_info={'run_mode': run_mode, 'data_source': getattr(settings, 'DATA_SOURCE', 'synthetic')}
+    )
+
+def save_profile_report(profiler, run_mode, settings):
     """
-    Test a single clinical note using the extraction method from config.
+    Print the stage summary and save the profiling report next to the metrics outputs.
+    """
+    profiler.print_summary()
+    data_source = getattr(settings, 'DATA_SOURCE', 'synthetic')
+    # LLM token usage, latency and cost (also written on its own when profiling is disabled)
+    usage_tracker = get_usage_tracker(settings)
+    usage_summary = usage_tracker.get_summary()
+    if usage_summary:
+        usage_tracker.print_summary()
+        profiler.add_section('llm_usage', usage_summary)
+        usage_path = os.path.join(get_output_dir(settings), f"{data_source}_{run_mode}_llm_usage.json")
+        os.makedirs(os.path.dirname(usage_path), exist_ok=True)
+        with open(usage_path, 'w') as f:
+            json.dump(usage_summary, f, indent=2)
+        print(f"LLM usage report saved to {usage_path}")
+    profiler.write_report(get_output_dir(settings), f"{data_source}_{run_mode}_profile.json")
+
+def get_combined_mode_settings(settings, methods):
+    """
+    Disable LLM_COMBINED_RELATIVE_DATES unless the LLM extractor is the only method, since the
+    other methods need the relative dates before they run.
+    """
+    if getattr(settings, 'LLM_COMBINED_RELATIVE_DATES', False) and list(methods) != ['llm']:
+        print("LLM_COMBINED_RELATIVE_DATES only applies when 'llm' is the only method; "
+              "extracting relative dates separately.")
+        return settings.replace(LLM_COMBINED_RELATIVE_DATES=False)
+    return settings
+
+def get_llm_usage_metrics(extractor_name, settings):
+    """Token, latency and cost totals of an extractor's LLM calls, as llm_* metrics (empty if it made none)."""
+    totals = get_usage_tracker(settings).get_totals(extractor_name)
+    if not totals['calls']:
+        return {}
+    return {
+        'llm_calls': totals['calls'],
+        'llm_prompt_tokens': totals['prompt_tokens'],
+        'llm_completion_tokens': totals['completion_tokens'],
+        'llm_latency_mean_s': totals['latency_mean_s'],
+        'llm_cost_usd': totals['cost_usd']
+    }
+
+def get_evaluation_settings(settings):
+    """Collect the confidence interval and PR curve settings for calculate_and_report_metrics."""
+    return {
+        'bootstrap_resamples': getattr(settings, 'BOOTSTRAP_RESAMPLES', 0),
+        'confidence_level': getattr(settings, 'BOOTSTRAP_CONFIDENCE', 0.95),
+        'bootstrap_workers': getattr(settings, 'BOOTSTRAP_WORKERS', 1),
+        'bootstrap_seed': getattr(settings, 'BOOTSTRAP_SEED', 42),
+        'pr_curve': getattr(settings, 'ENABLE_PR_CURVES', False)
+    }
+
+def get_batching_settings(settings):
+    """Collect the micro-batching settings for run_extraction."""
+    return {
+        'batch_size': getattr(settings, 'MICRO_BATCH_MAX_SIZE', 1),
+        'max_wait_ms': getattr(settings, 'MICRO_BATCH_MAX_WAIT_MS', 5.0)
+    }
+
+def test_single_note(settings=None):
+    """
+    Test a single clinical note using the configured extraction method.
     Outputs a list of (date, diagnosis) tuples.
+
+    Args:
+        settings (Settings, optional): Run settings (defaults to config.py with environment overrides).
     """
-    print(f"Using device: {config.DEVICE}")
-    print(f"Using extraction method: {config.EXTRACTION_METHOD}")
-    print(f"Using data source: {config.DATA_SOURCE}")
+    settings = settings or load_settings()
+    print(f"Using device: {settings.DEVICE}")
+    print(f"Using extraction method: {settings.EXTRACTION_METHOD}")
+    print(f"Using data source: {settings.DATA_SOURCE}")
     
     # Create appropriate extractor instance
     try:
-        extractor = create_extractor(config.EXTRACTION_METHOD, config)
+        extractor = create_extractor(settings.EXTRACTION_METHOD, settings)
         print(f"Created {extractor.name} extractor")
     except ValueError as e:
         print(f"Error: {e}")
@@ -61,21 +158,21 @@ def test_single_note():
     entities = None
     
     # Get the clinical note and entities based on the data source
-    if hasattr(config, 'DATA_SOURCE') and config.DATA_SOURCE.lower() != 'synthetic':
+    if hasattr(settings, 'DATA_SOURCE') and settings.DATA_SOURCE.lower() != 'synthetic':
         # Load the first note from the real data CSV
         try:
             import pandas as pd
             import json
             
-            dataset_path = get_data_path(config)
+            dataset_path = get_data_path(settings)
             df = pd.read_csv(dataset_path)
-            if len(df) > 0 and config.REAL_DATA_TEXT_COLUMN in df.columns:
+            if len(df) > 0 and settings.REAL_DATA_TEXT_COLUMN in df.columns:
                 # Get the note text
-                clinical_note = df.iloc[0][config.REAL_DATA_TEXT_COLUMN]
+                clinical_note = df.iloc[0][settings.REAL_DATA_TEXT_COLUMN]
                 
                 # Check if annotation columns exist and try to load entities from them
-                diagnoses_column = getattr(config, 'REAL_DATA_DIAGNOSES_COLUMN', None)
-                dates_column = getattr(config, 'REAL_DATA_DATES_COLUMN', None)
+                diagnoses_column = getattr(settings, 'REAL_DATA_DIAGNOSES_COLUMN', None)
+                dates_column = getattr(settings, 'REAL_DATA_DATES_COLUMN', None)
                 
                 if (diagnoses_column and dates_column and 
                     diagnoses_column in df.columns and dates_column in df.columns):
@@ -124,7 +221,7 @@ def test_single_note():
                         print(f"No valid annotations available, using empty entity lists")
                 else:
                     # No annotation columns, only try extraction for synthetic data
-                    if config.DATA_SOURCE.lower() == 'synthetic':
+                    if settings.DATA_SOURCE.lower() == 'synthetic':
                         print(f"No annotation columns found, this will be extracted for synthetic data only")
                     else:
                         # For real data with no annotation columns, use empty entities
@@ -147,24 +244,24 @@ def test_single_note():
     # If entities weren't loaded from annotation columns, extract them from text
     # but only for synthetic data
     if entities is None:
-        if not hasattr(config, 'DATA_SOURCE') or config.DATA_SOURCE.lower() == 'synthetic':
+        if not hasattr(settings, 'DATA_SOURCE') or settings.DATA_SOURCE.lower() == 'synthetic':
             entities = extract_entities(clinical_note)
         else:
             # For real data with no entities yet, use empty lists
             entities = ([], [])
     
     # Check if we should try to extract relative dates for real data
-    if (hasattr(config, 'ENABLE_RELATIVE_DATE_EXTRACTION') and 
-        config.ENABLE_RELATIVE_DATE_EXTRACTION and
-        hasattr(config, 'DATA_SOURCE') and 
-        config.DATA_SOURCE.lower() != 'synthetic' and
-        hasattr(config, 'REAL_DATA_TIMESTAMP_COLUMN')):
+    if (hasattr(settings, 'ENABLE_RELATIVE_DATE_EXTRACTION') and 
+        settings.ENABLE_RELATIVE_DATE_EXTRACTION and
+        hasattr(settings, 'DATA_SOURCE') and 
+        settings.DATA_SOURCE.lower() != 'synthetic' and
+        hasattr(settings, 'REAL_DATA_TIMESTAMP_COLUMN')):
         
-        timestamp_column = config.REAL_DATA_TIMESTAMP_COLUMN
+        timestamp_column = settings.REAL_DATA_TIMESTAMP_COLUMN
         
         try:
             # Get the dataset path and load the first row
-            dataset_path = get_data_path(config)
+            dataset_path = get_data_path(settings)
             df = pd.read_csv(dataset_path, nrows=1)
             
             if timestamp_column in df.columns:
@@ -193,7 +290,7 @@ def test_single_note():
                     if document_timestamp:
                         print(f"Extracting relative dates using document timestamp: {document_timestamp.strftime('%Y-%m-%d')}")
                         # Extract relative dates using LLM
-                        relative_dates = extract_relative_dates_llm(clinical_note, document_timestamp, config)
+                        relative_dates = extract_relative_dates_llm(clinical_note, document_timestamp, settings)
                         
                         if relative_dates:
                             # Append relative dates to existing dates list
@@ -237,27 +334,38 @@ def test_single_note():
     
     print("\nDone!")
 
-def evaluate_on_dataset():
+def evaluate_on_dataset(settings=None):
     """
-    Evaluate the configured extraction method on the dataset specified in config.py.
-    Saves predictions and correctness indicators to the original CSV file.
+    Evaluate the configured extraction method on the configured dataset.
+    Saves predictions and correctness indicators to the original CSV file
+    unless WRITE_PREDICTIONS_TO_CSV is disabled.
+
+    Args:
+        settings (Settings, optional): Run settings (defaults to config.py with environment overrides).
     """
+    settings = settings or load_settings()
+    settings = get_combined_mode_settings(settings, [settings.EXTRACTION_METHOD])
+    output_dir = get_output_dir(settings)
     # Use get_data_path to determine the dataset path
-    dataset_path = get_data_path(config)
+    dataset_path = get_data_path(settings)
     
     # Use None to use all evaluation samples (the last 20% of dataset)
     num_test_samples = None
 
+    profiler = create_profiler('evaluate', settings)
+
     # Load and prepare data using the helper function, passing the config
-    prepared_test_data, gold_standard = load_and_prepare_data(dataset_path, num_test_samples, config)
+    prepared_test_data, gold_standard = load_and_prepare_data(dataset_path, num_test_samples, settings, profiler)
     if prepared_test_data is None or gold_standard is None:
         print("Failed to load or prepare data. Exiting evaluation.")
         return
 
     # Create and load extractor
     try:
-        extractor = create_extractor(config.EXTRACTION_METHOD, config)
-        if not extractor.load():
+        extractor = create_extractor(settings.EXTRACTION_METHOD, settings)
+        with profiler.stage(STAGE_EXTRACTOR_LOAD, extractor=extractor.name):
+            loaded = extractor.load()
+        if not loaded:
              print(f"Failed to load {extractor.name}. Exiting evaluation.")
              return
     except Exception as e:
@@ -265,21 +373,32 @@ def evaluate_on_dataset():
         return
 
     # Generate predictions using the helper function
-    all_predictions = run_extraction(extractor, prepared_test_data)
+    try:
+        with profiler.stage(STAGE_MODEL_INFERENCE, extractor=extractor.name, notes=len(prepared_test_data)):
+            all_predictions = run_extraction(extractor, prepared_test_data, **get_batching_settings(settings))
+    except BatchJobError as e:
+        # Without the job's results every note would be scored as having no relationships
+        print(f"Evaluation incomplete for {extractor.name}: {e}")
+        return
+    if getattr(settings, 'LLM_COMBINED_RELATIVE_DATES', False):
+        store_combined_relative_dates(settings, prepared_test_data)
 
     # Calculate and report metrics
     print("\nCalculating metrics...")
-    os.makedirs(EXPERIMENT_OUTPUT_DIR, exist_ok=True)
-    metrics_result = calculate_and_report_metrics(
-        all_predictions,
-        gold_standard,
-        extractor.name,
-        EXPERIMENT_OUTPUT_DIR,
-        len(prepared_test_data)
-    )
+    os.makedirs(output_dir, exist_ok=True)
+    with profiler.stage(STAGE_METRICS, extractor=extractor.name, notes=len(prepared_test_data)):
+        metrics_result = calculate_and_report_metrics(
+            all_predictions,
+            gold_standard,
+            extractor.name,
+            output_dir,
+            len(prepared_test_data),
+            **get_evaluation_settings(settings)
+        )
     
     # Only save predictions to CSV for non-synthetic data
-    if hasattr(config, 'DATA_SOURCE') and config.DATA_SOURCE.lower() != 'synthetic':
+    write_predictions = getattr(settings, 'WRITE_PREDICTIONS_TO_CSV', True)
+    if write_predictions and hasattr(settings, 'DATA_SOURCE') and settings.DATA_SOURCE.lower() != 'synthetic':
         print(f"\nSaving predictions to {dataset_path}...")
         
         try:
@@ -336,7 +455,8 @@ def evaluate_on_dataset():
                         df.at[i, correctness_column] = json.dumps(note_correctness[i])
             
             # Save the updated dataframe back to CSV
-            df.to_csv(dataset_path, index=False)
+            with profiler.stage(STAGE_CSV_WRITE, extractor=extractor.name, notes=len(df)):
+                df.to_csv(dataset_path, index=False)
             print(f"Successfully saved predictions to column '{predictions_column}'")
             if gold_standard:
                 print(f"Successfully saved correctness indicators to column '{correctness_column}'")
@@ -344,32 +464,45 @@ def evaluate_on_dataset():
         except Exception as e:
             print(f"Error saving predictions to CSV: {e}")
     
+    render_plots(profiler, settings)
+    save_profile_report(profiler, 'evaluate', settings)
+
     print("\nEvaluation Done!")
 
-def compare_all_methods():
+def compare_all_methods(settings=None):
     """
     Compare available extraction methods on the dataset.
-    Saves predictions and correctness indicators from all methods to the original CSV file.
+    Saves predictions and correctness indicators from all methods to the original CSV file
+    unless WRITE_PREDICTIONS_TO_CSV is disabled.
+
+    Args:
+        settings (Settings, optional): Run settings (defaults to config.py with environment overrides).
     """
+    settings = settings or load_settings()
+    output_dir = get_output_dir(settings)
     # Use get_data_path to determine the dataset path
-    dataset_path = get_data_path(config)
+    dataset_path = get_data_path(settings)
     
     # Use None to use all evaluation samples (the last 20% of dataset)
     num_test_samples = None
 
     # List methods to compare
-    if hasattr(config, 'COMPARISON_METHODS'):
-        methods_to_try = config.COMPARISON_METHODS
+    if hasattr(settings, 'COMPARISON_METHODS'):
+        methods_to_try = settings.COMPARISON_METHODS
     else:
         # Default to most available methods (ensure 'llama' is included)
         methods_to_try = ['custom', 'naive', 'relcat', 'llm', 'llama']
 
+    settings = get_combined_mode_settings(settings, methods_to_try)
+
     print(f"\nComparing methods: {', '.join(methods_to_try)}")
-    print(f"Using data source: {config.DATA_SOURCE}")
+    print(f"Using data source: {settings.DATA_SOURCE}")
     print(f"Using dataset: {dataset_path}")
 
+    profiler = create_profiler('compare', settings)
+
     # Load and prepare data once using the helper function, passing the config
-    prepared_test_data, gold_standard = load_and_prepare_data(dataset_path, num_test_samples, config)
+    prepared_test_data, gold_standard = load_and_prepare_data(dataset_path, num_test_samples, settings, profiler)
     if prepared_test_data is None or gold_standard is None:
         print("Failed to load or prepare data. Exiting comparison.")
         return
@@ -379,8 +512,10 @@ def compare_all_methods():
     for method in methods_to_try:
         print(f"\nAttempting to load {method} extractor...")
         try:
-            extractor = create_extractor(method, config)
-            if extractor.load():
+            extractor = create_extractor(method, settings)
+            with profiler.stage(STAGE_EXTRACTOR_LOAD, extractor=extractor.name):
+                loaded = extractor.load()
+            if loaded:
                 extractors_to_compare.append(extractor)
                 print(f"Loaded {extractor.name}")
             else:
@@ -398,7 +533,8 @@ def compare_all_methods():
     
     # For CSV updates
     original_df = None
-    if hasattr(config, 'DATA_SOURCE') and config.DATA_SOURCE.lower() != 'synthetic':
+    write_predictions = getattr(settings, 'WRITE_PREDICTIONS_TO_CSV', True)
+    if write_predictions and hasattr(settings, 'DATA_SOURCE') and settings.DATA_SOURCE.lower() != 'synthetic':
         try:
             original_df = pd.read_csv(dataset_path)
             print(f"Loaded original CSV with {len(original_df)} rows")
@@ -411,18 +547,27 @@ def compare_all_methods():
             print(f"\nEvaluating {extractor.name}...")
             
             # Generate predictions
-            all_predictions = run_extraction(extractor, prepared_test_data)
+            try:
+                with profiler.stage(STAGE_MODEL_INFERENCE, extractor=extractor.name, notes=len(prepared_test_data)):
+                    all_predictions = run_extraction(extractor, prepared_test_data, **get_batching_settings(settings))
+            except BatchJobError as e:
+                print(f"Skipping {extractor.name} (evaluation incomplete): {e}")
+                pbar.update(1)
+                continue
             all_method_predictions[extractor.name] = all_predictions
             
             # Calculate metrics
             print(f"Calculating metrics for {extractor.name}...")
-            metrics = calculate_and_report_metrics(
-                all_predictions,
-                gold_standard,
-                extractor.name,
-                EXPERIMENT_OUTPUT_DIR,
-                len(prepared_test_data)
-            )
+            with profiler.stage(STAGE_METRICS, extractor=extractor.name, notes=len(prepared_test_data)):
+                metrics = calculate_and_report_metrics(
+                    all_predictions,
+                    gold_standard,
+                    extractor.name,
+                    output_dir,
+                    len(prepared_test_data),
+                    **get_evaluation_settings(settings)
+                )
+            metrics.update(get_llm_usage_metrics(extractor.name, settings))
             all_method_metrics[extractor.name] = metrics
             
             # Save predictions to CSV if applicable
@@ -482,71 +627,273 @@ def compare_all_methods():
     # Save the updated dataframe back to CSV
     if original_df is not None:
         try:
-            original_df.to_csv(dataset_path, index=False)
+            with profiler.stage(STAGE_CSV_WRITE, notes=len(original_df)):
+                original_df.to_csv(dataset_path, index=False)
             print(f"Successfully saved all predictions to {dataset_path}")
         except Exception as e:
             print(f"Error saving predictions to CSV: {e}")
     
     # Generate a comparison plot
     if all_method_metrics:
-        plot_comparison(all_method_metrics)
+        plot_comparison(all_method_metrics, settings)
+
+    render_plots(profiler, settings)
+    save_profile_report(profiler, 'compare', settings)
 
     print("\nComparison completed!")
 
     # Return the metrics dict for potential future use (e.g., in notebooks)
     return all_method_metrics
 
-def plot_comparison(method_metrics):
+def plot_comparison(method_metrics, settings):
     """
     Plot a comparison of metrics from different extraction methods.
     
     Args:
         method_metrics (dict): Dictionary mapping extractor names to their metrics.
+        settings (Settings): Run settings.
     """
-    os.makedirs(EXPERIMENT_OUTPUT_DIR, exist_ok=True)
-    print("\nGenerating comparison plot...")
+    output_dir = get_output_dir(settings)
+    os.makedirs(output_dir, exist_ok=True)
+    print("\nPreparing comparison plot...")
     
-    # Create a DataFrame from the metrics
-    comparison_df = pd.DataFrame(method_metrics).T  # Transpose
+    # Create a DataFrame from the scalar metrics (breakdown tables are skipped)
+    scalar_metrics = {
+        name: {key: value for key, value in metrics.items() if not isinstance(value, pd.DataFrame)}
+        for name, metrics in method_metrics.items()
+    }
+    comparison_df = pd.DataFrame(scalar_metrics).T  # Transpose
     
+    metrics_to_plot = ['precision', 'recall', 'f1']
+    has_intervals = all(f'{col}_ci_low' in comparison_df.columns for col in metrics_to_plot)
+
     print("\nComparison results:")
-    # Select only P, R, F1 for printing summary, but keep others for potential use
-    print(comparison_df[['precision', 'recall', 'f1']].round(3))
+    # Select only P, R, F1 (and their confidence intervals) for printing, but keep others for potential use
+    if has_intervals:
+        summary_df = pd.DataFrame(index=comparison_df.index)
+        for col in metrics_to_plot:
+            summary_df[col] = comparison_df[col].astype(float).round(3)
+            summary_df[f'{col}_ci'] = [
+                f"{low:.3f}-{high:.3f}" if pd.notna(low) else '-'
+                for low, high in zip(comparison_df[f'{col}_ci_low'], comparison_df[f'{col}_ci_high'])
+            ]
+        print(summary_df)
+    else:
+        print(comparison_df[['precision', 'recall', 'f1']].round(3))
+
+    # Cost of the LLM-based methods, to weigh their scores against cheaper methods
+    costs = None
+    if 'llm_cost_usd' in comparison_df.columns:
+        usage_columns = [col for col in ['llm_calls', 'llm_prompt_tokens', 'llm_completion_tokens',
+                                         'llm_latency_mean_s', 'llm_cost_usd'] if col in comparison_df.columns]
+        print("\nLLM usage per method:")
+        print(comparison_df[usage_columns].dropna(how='all').to_string())
+        costs = [None if pd.isna(cost) else float(cost) for cost in comparison_df['llm_cost_usd']]
 
-    metrics_to_plot = ['precision', 'recall', 'f1']
     try:
-        plot_df = comparison_df[[col for col in metrics_to_plot if col in comparison_df.columns]]  # Ensure columns exist
+        plot_df = comparison_df[[col for col in metrics_to_plot if col in comparison_df.columns]].astype(float)  # Ensure columns exist
         if not plot_df.empty:
-            plot_df.plot(kind='bar', figsize=(10, 6), rot=0)
-            plt.title(f'Comparison of Extraction Methods - {config.DATA_SOURCE.capitalize()} Data')
-            plt.ylabel('Score')
-            plt.xlabel('Method')
-            plt.ylim(0, 1.05)
-            plt.grid(axis='y', linestyle='--', alpha=0.7)
-            plt.legend(title='Metric')
-            plt.tight_layout()
-            plot_save_path = os.path.join(EXPERIMENT_OUTPUT_DIR, f"{config.DATA_SOURCE}_extractor_comparison.png")
-            plt.savefig(plot_save_path)
-            print(f"\nComparison plot saved to {plot_save_path}")
-            plt.close()
+            errors = None
+            if has_intervals:
+                # Asymmetric error bars per metric: [distance below, distance above] per method
+                errors = {
+                    col: np.nan_to_num(np.array([
+                        plot_df[col] - comparison_df[f'{col}_ci_low'].astype(float),
+                        comparison_df[f'{col}_ci_high'].astype(float) - plot_df[col]
+                    ])).tolist()
+                    for col in plot_df.columns
+                }
+            plot_save_path = os.path.join(output_dir, f"{settings.DATA_SOURCE}_extractor_comparison.png")
+            queue_plot('comparison', {
+                'methods': list(plot_df.index),
+                'metrics': list(plot_df.columns),
+                'values': {col: plot_df[col].tolist() for col in plot_df.columns},
+                'errors': errors,
+                'costs': costs,
+                'title': f'Comparison of Extraction Methods - {settings.DATA_SOURCE.capitalize()} Data'
+            }, plot_save_path)
+            print(f"\nComparison plot queued for {plot_save_path}")
         else:
             print("\nSkipping comparison plot: No P/R/F1 data available.")
     except Exception as e:
-        print(f"\nError generating comparison plot: {e}")
+        print(f"\nError queuing comparison plot: {e}")
 
-if __name__ == "__main__":
-    # Read mode and method directly from config
-    run_mode = config.RUN_MODE.lower()
+def render_plots(profiler, settings):
+    """
+    Render the queued plots according to PLOT_MODE ('background', 'inline' or 'deferred').
+    """
+    output_dir = get_output_dir(settings)
+    with profiler.stage(STAGE_REPORTING):
+        finish_plots(output_dir, getattr(settings, 'PLOT_MODE', 'background'))
+
+def run_relative_date_stage_mode(settings=None):
+    """
+    Run the relative date stage on the configured dataset (RUN_MODE 'relative-dates'), so
+    later evaluate/compare runs read the stored dates instead of calling an LLM.
+    """
+    settings = settings or load_settings()
+    if getattr(settings, 'DATA_SOURCE', 'synthetic').lower() == 'synthetic':
+        print("Relative dates are only extracted for real data sources.")
+        return
+    profiler = create_profiler('relative-dates', settings)
+    run_relative_date_stage(settings, profiler=profiler)
+    save_profile_report(profiler, 'relative-dates', settings)
+
+RUN_MODES = ['single', 'evaluate', 'compare', 'relative-dates', 'train', 'bench', 'serve']
+
+def build_parser():
+    """
+    Build the command-line parser. Flags override config.py and PITUITARY_* environment variables.
+    """
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--data-source', dest='DATA_SOURCE',
+                        help="Data source: 'synthetic', 'imaging', 'notes', 'letters' or 'sample'.")
+    common.add_argument('--output-dir', dest='EXPERIMENT_OUTPUT_DIR',
+                        help="Directory for metrics, plots and profiling reports (default: experiment_outputs).")
+    common.add_argument('--plot-mode', dest='PLOT_MODE', choices=['background', 'inline', 'deferred'],
+                        help="How queued plots are rendered.")
+    common.add_argument('--no-profiling', dest='ENABLE_PROFILING', action='store_const', const=False,
+                        help="Disable the per-stage profiling report.")
+    common.add_argument('--no-csv-write', dest='WRITE_PREDICTIONS_TO_CSV', action='store_const', const=False,
+                        help="Do not write predictions back into the source CSV (safe for concurrent jobs).")
+    common.add_argument('--debug', dest='DEBUG_MODE', action='store_const', const=True,
+                        help="Enable verbose logging.")
+    common.add_argument('--set', dest='extra_settings', action='append', default=[], metavar='NAME=VALUE',
+                        help="Override any config.py setting, e.g. --set BOOTSTRAP_RESAMPLES=5000 (repeatable).")
+
+    parser = argparse.ArgumentParser(
+        description="Extract diagnosis-date relationships from clinical notes. "
+                    "Without a subcommand, RUN_MODE from config.py is used."
+    )
+    subparsers = parser.add_subparsers(dest='command')
+
+    single = subparsers.add_parser('single', parents=[common], help="Run one extractor on a single note.")
+    single.add_argument('--method', dest='EXTRACTION_METHOD',
+                        help="Extraction method: 'custom', 'naive', 'relcat', 'llm' or 'llama'.")
+
+    evaluate = subparsers.add_parser('evaluate', parents=[common], help="Evaluate one extractor on a dataset.")
+    evaluate.add_argument('--method', dest='EXTRACTION_METHOD',
+                          help="Extraction method: 'custom', 'naive', 'relcat', 'llm' or 'llama'.")
+
+    compare = subparsers.add_parser('compare', parents=[common], help="Compare several extractors on a dataset.")
+    compare.add_argument('--methods', dest='COMPARISON_METHODS',
+                         type=lambda value: [m.strip() for m in value.split(',') if m.strip()],
+                         help="Comma-separated extraction methods to compare.")
+
+    for subparser in (single, evaluate, compare):
+        subparser.add_argument('--dataset-path', dest='DATASET_PATH',
+                               help="Dataset file to use instead of the DATA_SOURCE default path.")
+
+    relative_dates = subparsers.add_parser('relative-dates', parents=[common],
+                                           help="Extract relative dates for notes without stored results.")
+    relative_dates.add_argument('--dataset-path', dest='DATASET_PATH',
+                                help="Dataset file to use instead of the DATA_SOURCE default path.")
+    relative_dates.add_argument('--store-path', dest='RELATIVE_DATE_STORE_PATH',
+                                help="Relative date store (default: data/relative_dates.parquet).")
+
+    train = subparsers.add_parser('train', parents=[common], help="Train the custom PyTorch model.")
+    train.add_argument('--dataset-path', dest='SYNTHETIC_DATASET_PATH',
+                       help="Training dataset (.json or .jsonl); generated if missing.")
+    train.add_argument('--model-path', dest='MODEL_PATH', help="Where to save the trained model.")
+    train.add_argument('--vocab-path', dest='VOCAB_PATH', help="Where to save the vocabulary.")
+    train.add_argument('--checkpoint-path', dest='TRAINING_CHECKPOINT_PATH',
+                       help="Training checkpoint saved after every epoch (default: model_training/checkpoint.pt).")
+    train.add_argument('--no-resume', dest='TRAINING_RESUME', action='store_const', const=False,
+                       help="Start from scratch instead of resuming from the checkpoint.")
+
+    serve = subparsers.add_parser('serve', parents=[common],
+                                  help="Serve extraction over HTTP with the extractors loaded once.")
+    serve.add_argument('--methods', dest='SERVICE_METHODS',
+                       type=lambda value: [m.strip() for m in value.split(',') if m.strip()],
+                       help="Comma-separated extraction methods to load.")
+    serve.add_argument('--host', dest='SERVICE_HOST', help="Host to bind (default: 127.0.0.1).")
+    serve.add_argument('--port', dest='SERVICE_PORT', type=int, help="TCP port to bind.")
+    serve.add_argument('--unix-socket', dest='SERVICE_UNIX_SOCKET', help="Listen on a Unix socket instead of TCP.")
+
+    # Listed for --help only; main() passes everything after 'bench' to the harness
+    subparsers.add_parser('bench', help="Run the benchmark harness (arguments are passed through, "
+                                        "see `python main.py bench --help`).")
+    return parser
+
+def settings_from_args(args, parser):
+    """
+    Resolve the run settings from parsed command-line arguments.
+
+    Returns:
+        Settings: config.py defaults < PITUITARY_* environment variables < CLI flags.
+    """
+    settings = load_settings()
+    overrides = {}
+    for item in getattr(args, 'extra_settings', []):
+        name, sep, raw = item.partition('=')
+        name = name.strip()
+        if not sep or name not in settings:
+            parser.error(f"--set expects NAME=VALUE with NAME defined in config.py, got '{item}'")
+        try:
+            overrides[name] = parse_setting_value(raw, getattr(settings, name))
+        except ValueError as e:
+            parser.error(f"Invalid value for {name}: {e}")
+    # Dedicated flags take precedence over --set
+    overrides.update({
+        name: value for name, value in vars(args).items()
+        if name.isupper() and value is not None
+    })
+    if args.command in ('single', 'evaluate', 'compare', 'relative-dates', 'train', 'serve'):
+        overrides['RUN_MODE'] = args.command
+    return settings.replace(**overrides)
+
+def run_benchmarks(bench_args):
+    """
+    Run benchmarks/run_benchmarks.py in a fresh interpreter, so its environment setup
+    (e.g. disabling tqdm before import) is not affected by modules main.py already loaded.
+
+    Returns:
+        int: The benchmark harness exit code.
+    """
+    script = os.path.join(project_root, 'benchmarks', 'run_benchmarks.py')
+    return subprocess.call([sys.executable, script] + list(bench_args), cwd=project_root)
+
+def main(argv=None):
+    """
+    Command-line entry point.
+
+    Returns:
+        int: Process exit code.
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] == 'bench':
+        return run_benchmarks(argv[1:])
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    settings = settings_from_args(args, parser)
+    run_mode = settings.RUN_MODE.lower()
     
     print(f"--- Running Mode: {run_mode} ---")
     
     if run_mode == 'single':
-        print(f"--- Method: {config.EXTRACTION_METHOD} ---")
-        test_single_note()
+        print(f"--- Method: {settings.EXTRACTION_METHOD} ---")
+        test_single_note(settings)
     elif run_mode == 'evaluate':
-        print(f"--- Method: {config.EXTRACTION_METHOD} ---")
-        evaluate_on_dataset()
+        print(f"--- Method: {settings.EXTRACTION_METHOD} ---")
+        evaluate_on_dataset(settings)
     elif run_mode == 'compare':
-        compare_all_methods()
+        compare_all_methods(settings)
+    elif run_mode == 'relative-dates':
+        run_relative_date_stage_mode(settings)
+    elif run_mode == 'train':
+        from model_training.train import train
+        train(settings)
+    elif run_mode == 'bench':
+        return run_benchmarks([])
+    elif run_mode == 'serve':
+        from extraction_service import serve
+        return serve(settings)
     else:
-        print(f"Error: Invalid RUN_MODE '{config.RUN_MODE}' in config.py. Options are: 'single', 'evaluate', 'compare'.") 
\ No newline at end of file
+        print(f"Error: Invalid RUN_MODE '{settings.RUN_MODE}'. Options are: {', '.join(RUN_MODES)}.")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
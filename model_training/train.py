@@ -4,7 +4,6 @@ import json
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import DataLoader
 from sklearn.model_selection import train_test_split
 
 # Adjust relative paths for imports since train.py is in model_training/
@@ -12,32 +11,57 @@ from sklearn.model_selection import train_test_split
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 
-# Import from our modules using adjusted paths
-# Files within the same directory (model_training)
-from DiagnosisDateRelationModel import DiagnosisDateRelationModel 
-from model_training.Vocabulary import Vocabulary 
-import training_config 
+# Import from our modules using package paths (works both as a script and via `main.py train`)
+from model_training.DiagnosisDateRelationModel import DiagnosisDateRelationModel
+from model_training.Vocabulary import Vocabulary
+from model_training import training_config
 
 # Files from other top-level directories
 from data.ClinicalNoteDataset import ClinicalNoteDataset
-from data.synthetic_data_generator import generate_dataset
+from data.synthetic_data_generator import generate_dataset, generate_dataset_jsonl
+from data.JsonlNoteDataset import JsonlNoteDataset, is_jsonl_path
 from utils.training_utils import load_and_prepare_data
-from utils.training_utils import train_model, plot_training_curves
-from config import DEVICE, DATASET_PATH, MODEL_PATH, VOCAB_PATH 
+from utils.training_utils import train_model, plot_training_curves, create_data_loaders, seed_everything
+from utils.settings import load_settings
 
-def train():
+# training_config values that must match for a checkpoint to be resumed
+CHECKPOINT_PARAMS = (
+    'EMBEDDING_DIM', 'HIDDEN_DIM', 'LEARNING_RATE', 'NUM_EPOCHS', 'BATCH_SIZE', 'SEED',
+    'BF16_AUTOCAST', 'GRADIENT_ACCUMULATION_STEPS', 'EARLY_STOPPING_PATIENCE', 'EARLY_STOPPING_MIN_DELTA',
+    'MAX_DISTANCE', 'MAX_CONTEXT_LEN'
+)
+
+def train(settings=None):
+    """
+    Train the custom relation model on the synthetic dataset.
+
+    Args:
+        settings (Settings, optional): Run settings providing DEVICE, SYNTHETIC_DATASET_PATH,
+            MODEL_PATH, VOCAB_PATH, TRAINING_CHECKPOINT_PATH, TRAINING_RESUME and PLOT_MODE
+            (defaults to config.py with environment overrides).
+    """
+    settings = settings or load_settings()
+    DEVICE = settings.DEVICE
+    seed_everything(training_config.SEED)
+    DATASET_PATH = settings.SYNTHETIC_DATASET_PATH
     print(f"Using device: {DEVICE}")
     
     # Ensure the training directory exists for outputs
-    model_full_path = os.path.join(project_root, MODEL_PATH)
-    vocab_full_path = os.path.join(project_root, VOCAB_PATH) # Use updated config path
+    model_full_path = os.path.join(project_root, settings.MODEL_PATH)
+    vocab_full_path = os.path.join(project_root, settings.VOCAB_PATH) # Use updated config path
     output_dir = os.path.dirname(model_full_path) 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
     # Step 1: Generate or load dataset
     dataset_full_path = os.path.join(project_root, DATASET_PATH)
-    if os.path.exists(dataset_full_path):
+    if os.path.exists(dataset_full_path) and is_jsonl_path(dataset_full_path):
+        print(f"Loading existing JSON Lines dataset from {dataset_full_path}")
+        # Select the first 80% by index range; notes are streamed during preparation
+        full_dataset = JsonlNoteDataset(dataset_full_path)
+        dataset, _ = full_dataset.split(0.8)
+        print(f"Using first {len(dataset)}/{len(full_dataset)} samples (80%) for training")
+    elif os.path.exists(dataset_full_path):
         print(f"Loading existing dataset from {dataset_full_path}")
         with open(dataset_full_path, 'r') as f:
             full_dataset = json.load(f)
@@ -47,6 +71,10 @@ def train():
         # Use only the first 80% for training
         dataset = full_dataset[:train_size]
         print(f"Using first {train_size}/{len(full_dataset)} samples (80%) for training")
+    elif is_jsonl_path(dataset_full_path):
+        print(f"Generating synthetic clinical notes dataset with {training_config.NUM_SAMPLES} samples...")
+        generate_dataset_jsonl(dataset_full_path, training_config.NUM_SAMPLES)
+        dataset, _ = JsonlNoteDataset(dataset_full_path).split(0.8)
     else:
         # Use NUM_SAMPLES from training_config
         print(f"Generating synthetic clinical notes dataset with {training_config.NUM_SAMPLES} samples...") 
@@ -98,9 +126,11 @@ def train():
         training_config.MAX_CONTEXT_LEN, training_config.MAX_DISTANCE
     )
     
-    # Create data loaders using training_config batch size
-    train_loader = DataLoader(train_dataset, batch_size=training_config.BATCH_SIZE, shuffle=True)
-    val_loader = DataLoader(val_dataset, batch_size=training_config.BATCH_SIZE)
+    # Create data loaders using training_config batch size and worker count
+    train_loader, val_loader, generator = create_data_loaders(
+        train_dataset, val_dataset, training_config.BATCH_SIZE, DEVICE,
+        num_workers=training_config.NUM_WORKERS, seed=training_config.SEED
+    )
     
     # Step 4: Initialize and train model using training_config settings
     model = DiagnosisDateRelationModel(
@@ -113,16 +143,28 @@ def train():
     criterion = nn.BCELoss()
     optimizer = optim.Adam(model.parameters(), lr=training_config.LEARNING_RATE)
     
-    # Train model using training_config epochs
+    # Train model using training_config epochs, resuming from the last checkpoint if it holds an
+    # unfinished run with the same hyperparameters
+    checkpoint_path = getattr(settings, 'TRAINING_CHECKPOINT_PATH', None)
+    training_params = {name: getattr(training_config, name) for name in CHECKPOINT_PARAMS}
     print("Training model...")
     train_losses, val_losses, val_accs = train_model(
         model, train_loader, val_loader, optimizer, criterion, 
-        training_config.NUM_EPOCHS, DEVICE, model_full_path
+        training_config.NUM_EPOCHS, DEVICE, model_full_path,
+        accumulation_steps=training_config.GRADIENT_ACCUMULATION_STEPS,
+        bf16_autocast=training_config.BF16_AUTOCAST,
+        early_stopping_patience=training_config.EARLY_STOPPING_PATIENCE,
+        early_stopping_min_delta=training_config.EARLY_STOPPING_MIN_DELTA,
+        checkpoint_path=os.path.join(project_root, checkpoint_path) if checkpoint_path else None,
+        resume=getattr(settings, 'TRAINING_RESUME', True),
+        generator=generator,
+        training_params=training_params
     )
     
     # Plot training curves
     plot_save_path = os.path.join(output_dir, 'training_curves.png')
-    plot_training_curves(train_losses, val_losses, val_accs, plot_save_path)
+    plot_training_curves(train_losses, val_losses, val_accs, plot_save_path,
+                         plot_mode=getattr(settings, 'PLOT_MODE', 'background'))
     
     print("Done!")
 
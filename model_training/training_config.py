@@ -8,6 +8,14 @@ HIDDEN_DIM = 256
 LEARNING_RATE = 0.001
 NUM_EPOCHS = 15
 BATCH_SIZE = 16
+SEED = 42  # Seeds model initialisation, dropout and batch shuffling
+
+# Training Engine
+NUM_WORKERS = 2                  # DataLoader worker processes (0 = load batches in the main process)
+BF16_AUTOCAST = False            # bfloat16 autocast for forward passes (CPU or CUDA); the loss stays float32
+GRADIENT_ACCUMULATION_STEPS = 1  # Batches per optimizer step (effective batch size = BATCH_SIZE * steps)
+EARLY_STOPPING_PATIENCE = 3      # Stop after this many epochs without validation loss improvement (0 = off)
+EARLY_STOPPING_MIN_DELTA = 0.0   # Minimum validation loss decrease that counts as an improvement
 
 # Data Processing Parameters (used during training data prep)
 # Max char distance between entities to consider when creating training examples
@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+from extractors.base_extractor import BaseRelationExtractor
+from utils.batching_utils import MicroBatcher, create_extractor_batcher, format_batcher_stats
+
+class FailingExtractor(BaseRelationExtractor):
+    """Extractor that raises on notes containing 'bad'."""
+
+    name = 'failing'
+
+    def load(self):
+        return True
+
+    def extract(self, text, entities=None):
+        if 'bad' in text:
+            raise ValueError(f"cannot extract from {text!r}")
+        return [{'diagnosis': text, 'date': '2024-01-01', 'confidence': 1.0}]
+
+def test_items_are_batched_and_results_returned_in_order():
+    calls = []
+
+    def double(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    with MicroBatcher(double, max_batch_size=4, max_wait_ms=1000) as batcher:
+        futures = [batcher.submit(number) for number in range(8)]
+        assert [future.result(timeout=5) for future in futures] == [number * 2 for number in range(8)]
+    assert [len(call) for call in calls] == [4, 4]
+    assert batcher.get_stats()['failed_batches'] == 0
+
+def test_failing_item_only_fails_its_own_future():
+    release = threading.Event()
+
+    def invert(items):
+        release.wait(5)
+        return [1 / item for item in items]
+
+    with MicroBatcher(invert, max_batch_size=3, max_wait_ms=1000) as batcher:
+        futures = [batcher.submit(item) for item in (1, 0, 4)]
+        release.set()
+        assert futures[0].result(timeout=5) == 1.0
+        with pytest.raises(ZeroDivisionError):
+            futures[1].result(timeout=5)
+        assert futures[2].result(timeout=5) == 0.25
+
+    stats = batcher.get_stats()
+    assert (stats['batches'], stats['failed_batches'], stats['failed_items']) == (1, 1, 1)
+    assert 'failed batches retried per item' in format_batcher_stats(stats)
+
+def test_wrong_number_of_results_fails_each_item():
+    with MicroBatcher(lambda items: [], max_batch_size=2, max_wait_ms=1000) as batcher:
+        futures = [batcher.submit(item) for item in ('a', 'b')]
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result(timeout=5)
+
+def test_extractor_batcher_isolates_bad_notes():
+    with create_extractor_batcher(FailingExtractor(), max_batch_size=3, max_wait_ms=1000) as batcher:
+        futures = [batcher.submit((text, None)) for text in ('asthma', 'bad note', 'diabetes')]
+        assert futures[0].result(timeout=5)[0]['diagnosis'] == 'asthma'
+        with pytest.raises(ValueError):
+            futures[1].result(timeout=5)
+        assert futures[2].result(timeout=5)[0]['diagnosis'] == 'diabetes'
+
+def test_closed_batcher_rejects_items():
+    batcher = MicroBatcher(lambda items: items)
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit(1)
@@ -0,0 +1,35 @@
+import os
+import socket
+
+import pytest
+
+from extraction_service import ThreadingUnixHTTPServer, create_server
+from utils.settings import load_settings
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason="needs Unix domain sockets")
+
+def test_stale_socket_is_replaced(tmp_path):
+    path = str(tmp_path / 'service.sock')
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    server = create_server(None, load_settings(environ={}), unix_socket=path)
+    try:
+        assert isinstance(server, ThreadingUnixHTTPServer)
+        assert server.server_address == path
+    finally:
+        server.server_close()
+
+def test_existing_file_is_not_removed(tmp_path):
+    path = tmp_path / 'service.sock'
+    path.write_text('not a socket')
+
+    with pytest.raises(FileExistsError):
+        create_server(None, load_settings(environ={}), unix_socket=str(path))
+    assert path.read_text() == 'not a socket'
+
+def test_directory_is_not_removed(tmp_path):
+    with pytest.raises(FileExistsError):
+        create_server(None, load_settings(environ={}), unix_socket=str(tmp_path))
+    assert os.path.isdir(tmp_path)
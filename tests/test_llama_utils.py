@@ -0,0 +1,67 @@
+import pytest
+import torch
+
+transformers = pytest.importorskip('transformers')
+
+from utils.llama_utils import generate_chat_batch, split_chat_prompt
+
+PAD, EOS = 0, 1
+SYSTEM = 'You link diagnoses to dates.'
+INSTRUCTIONS = 'Find the relationships in this note: '
+NOTES = ['a', 'asthma 2024-01-01', 'type 2 diabetes diagnosed 01/02/24, copd since 2019-05-03']
+
+class CharTokenizer:
+    """One token per ASCII character (id = code point); a plain-text chat template."""
+
+    pad_token_id = PAD
+    eos_token_id = EOS
+
+    def __call__(self, text, return_tensors=None, add_special_tokens=True):
+        ids = [ord(char) for char in text]
+        return {'input_ids': torch.tensor([ids]) if return_tensors == 'pt' else ids}
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        return ''.join(f"<{message['role']}>{message['content']}" for message in messages) + '<assistant>'
+
+    def batch_decode(self, output_ids, skip_special_tokens=True):
+        special = {PAD, EOS} if skip_special_tokens else set()
+        return [''.join(chr(token_id) for token_id in row.tolist() if token_id not in special) for row in output_ids]
+
+class TinyPipeline:
+    """The pipeline attributes llama_utils uses, around a randomly initialised Llama."""
+
+    def __init__(self):
+        torch.manual_seed(0)
+        # A large init range makes greedy outputs depend strongly on every input position
+        config = transformers.LlamaConfig(
+            vocab_size=128, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+            num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=512,
+            pad_token_id=PAD, bos_token_id=2, eos_token_id=EOS, initializer_range=0.5
+        )
+        self.model = transformers.LlamaForCausalLM(config).eval()
+        self.tokenizer = CharTokenizer()
+
+@pytest.fixture(scope='module')
+def pipe():
+    return TinyPipeline()
+
+def generate(pipe, notes, use_prefix_cache):
+    return generate_chat_batch(pipe, SYSTEM, INSTRUCTIONS, notes, max_new_tokens=12, use_prefix_cache=use_prefix_cache)
+
+def test_prompt_is_split_before_the_note(pipe):
+    prefix, suffix = split_chat_prompt(pipe.tokenizer, SYSTEM, INSTRUCTIONS, NOTES[1])
+    assert prefix == f"<system>{SYSTEM}<user>{INSTRUCTIONS}"
+    assert suffix == f"{NOTES[1]}<assistant>"
+
+def test_prefix_cache_matches_uncached_generation(pipe):
+    uncached = generate(pipe, NOTES, use_prefix_cache=False)
+    # Outputs differ per note, so a shifted position or unmasked pad token would show up
+    assert len(set(uncached)) == len(NOTES)
+    assert generate(pipe, NOTES, use_prefix_cache=True) == uncached
+    # Padding between the cached prefix and shorter suffixes does not change any row
+    assert [generate(pipe, [note], use_prefix_cache=True)[0] for note in NOTES] == uncached
+
+def test_prefix_cache_is_reused_unchanged(pipe):
+    first = generate(pipe, NOTES, use_prefix_cache=True)
+    assert generate(pipe, NOTES[::-1], use_prefix_cache=True) == first[::-1]
+    assert generate(pipe, NOTES, use_prefix_cache=True) == first
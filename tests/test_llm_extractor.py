@@ -0,0 +1,33 @@
+from extractors.llm_extractor import MAX_COMPLETION_TOKENS, LLMExtractor
+from utils.settings import load_settings
+
+def make_note(number, num_diagnoses):
+    text = ' '.join(f"diagnosis{number}x{d} on 2024-01-0{d + 1}." for d in range(num_diagnoses))
+    diagnoses = [(f"diagnosis{number}x{d}", text.index(f"diagnosis{number}x{d}")) for d in range(num_diagnoses)]
+    dates = [(f"2024-01-0{d + 1}", f"2024-01-0{d + 1}", text.index(f"2024-01-0{d + 1}")) for d in range(num_diagnoses)]
+    return text, (diagnoses, dates)
+
+def prepared_notes(extractor, sizes):
+    return [(i, extractor._prepare_note(*make_note(i, size))) for i, size in enumerate(sizes)]
+
+def test_packed_max_tokens_grows_with_the_pack():
+    extractor = LLMExtractor(load_settings({'LLM_PACK_MAX_OUTPUT_TOKENS': 100000}, environ={}))
+    small = [note for _, note in prepared_notes(extractor, [1, 1])]
+    large = [note for _, note in prepared_notes(extractor, [8] * 8)]
+    assert extractor._single_body(small[0])['max_tokens'] == MAX_COMPLETION_TOKENS
+    assert extractor._packed_body(small)['max_tokens'] == MAX_COMPLETION_TOKENS
+    assert extractor._packed_body(large)['max_tokens'] == sum(note['output_tokens'] for note in large)
+    assert extractor._packed_body(large)['max_tokens'] > MAX_COMPLETION_TOKENS
+
+def test_packs_stay_within_the_output_budget():
+    extractor = LLMExtractor(load_settings({
+        'LLM_PACK_MAX_OUTPUT_TOKENS': 1000,
+        'LLM_PACK_MAX_PROMPT_TOKENS': 100000,
+        'LLM_PACK_MAX_NOTES': 100
+    }, environ={}))
+    notes = prepared_notes(extractor, [5] * 12)
+    packs = extractor._pack(notes)
+    assert len(packs) > 1
+    assert [i for pack in packs for i, _ in pack] == list(range(12))
+    for pack in packs:
+        assert sum(note['output_tokens'] for _, note in pack) <= 1000
@@ -0,0 +1,27 @@
+import json
+
+from data.JsonlNoteDataset import JsonlNoteDataset
+from utils.extraction_utils import load_synthetic_data
+
+def write_notes(path, count):
+    with open(path, 'w') as f:
+        for i in range(count):
+            f.write(json.dumps({
+                'clinical_note': f"Note {i}: asthma diagnosed on 2024-01-{i + 1:02d}.",
+                'ground_truth': [{'date': f"2024-01-{i + 1:02d}", 'diagnoses': [{'diagnosis': 'Asthma'}]}]
+            }) + '\n')
+
+def test_jsonl_dataset_is_closed_after_loading(tmp_path, monkeypatch):
+    closed = []
+    close = JsonlNoteDataset.close
+    monkeypatch.setattr(JsonlNoteDataset, 'close', lambda self: closed.append(self) or close(self))
+    path = str(tmp_path / 'notes.jsonl')
+    write_notes(path, 10)
+
+    test_data, gold_standard = load_synthetic_data(path, num_samples=None)
+    assert len(closed) == 1 and closed[0]._mmap is None
+    # The evaluation split (last 20%) was read before closing
+    assert [entry['note'] for entry in test_data] == ["Note 8: asthma diagnosed on 2024-01-09.",
+                                                     "Note 9: asthma diagnosed on 2024-01-10."]
+    assert gold_standard == [{'note_id': 0, 'diagnosis': 'asthma', 'date': '2024-01-09'},
+                             {'note_id': 1, 'diagnosis': 'asthma', 'date': '2024-01-10'}]
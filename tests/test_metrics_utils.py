@@ -0,0 +1,144 @@
+import random
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+from utils.metrics_utils import (
+    bootstrap_confidence_intervals,
+    compute_precision_recall_curve,
+    compute_relation_metrics
+)
+
+KINDS = ('true_positives', 'false_positives', 'false_negatives')
+
+def set_based_metrics(predictions, gold_standard):
+    """The set-based comparison compute_relation_metrics replaced (see calculate_and_report_metrics)."""
+    gold_note_ids = {g['note_id'] for g in gold_standard}
+    pred_set = {(p['note_id'], p['diagnosis'], p['date']) for p in predictions if p['note_id'] in gold_note_ids}
+    gold_set = {(g['note_id'], g['diagnosis'], g['date']) for g in gold_standard}
+    per_note, per_diagnosis = Counter(), Counter()
+    for triple in pred_set:
+        kind = 'true_positives' if triple in gold_set else 'false_positives'
+        per_note[(triple[0], kind)] += 1
+        per_diagnosis[(triple[1], kind)] += 1
+    for triple in gold_set - pred_set:
+        per_note[(triple[0], 'false_negatives')] += 1
+        per_diagnosis[(triple[1], 'false_negatives')] += 1
+    return {
+        'true_positives': len(pred_set & gold_set),
+        'false_positives': len(pred_set - gold_set),
+        'false_negatives': len(gold_set - pred_set),
+        'notes': gold_note_ids,
+        'diagnoses': {diagnosis for diagnosis, _ in per_diagnosis},
+        'per_note': per_note,
+        'per_diagnosis': per_diagnosis
+    }
+
+def random_relations(rng, count, missing_rate=0.0):
+    def value(choices):
+        return None if rng.random() < missing_rate else rng.choice(choices)
+    return [{
+        'note_id': rng.randrange(12),
+        'diagnosis': value(['asthma', 'diabetes', 'copd', 'hypertension']),
+        'date': value(['2024-01-01', '2024-02-01', '2024-03-01']),
+        'confidence': rng.random()
+    } for _ in range(count)]
+
+def breakdown_counts(frame):
+    """Row keys (NaN as None) and nonzero TP/FP/FN counts of a per-note or per-diagnosis frame."""
+    keys, counts = set(), Counter()
+    for key, row in frame.iterrows():
+        key = None if pd.isna(key) else key
+        keys.add(key)
+        for kind in KINDS:
+            if row[kind]:
+                counts[(key, kind)] = row[kind]
+    return keys, counts
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('missing_rate', [0.0, 0.1])
+def test_matches_set_based_metrics(seed, missing_rate):
+    rng = random.Random(seed)
+    predictions = random_relations(rng, rng.randrange(0, 80), missing_rate)
+    gold = random_relations(rng, rng.randrange(1, 60), missing_rate)
+    expected = set_based_metrics(predictions, gold)
+
+    result = compute_relation_metrics(predictions, gold)
+    for kind in KINDS:
+        assert result[kind] == expected[kind]
+    assert result['num_labeled_notes'] == len(expected['notes'])
+    assert breakdown_counts(result['per_note']) == (expected['notes'], expected['per_note'])
+    assert breakdown_counts(result['per_diagnosis']) == (expected['diagnoses'], expected['per_diagnosis'])
+
+def test_missing_gold_date_counts_as_false_negative():
+    result = compute_relation_metrics(
+        [{'note_id': 0, 'diagnosis': 'a', 'date': '2020-01-01', 'confidence': 1.0}],
+        [{'note_id': 0, 'diagnosis': 'a', 'date': None}]
+    )
+    assert (result['true_positives'], result['false_positives'], result['false_negatives']) == (0, 1, 1)
+    assert result['per_note'].loc[0, 'false_negatives'] == 1
+
+def test_missing_values_match_each_other():
+    result = compute_relation_metrics(
+        [{'note_id': 0, 'diagnosis': 'a', 'date': None}],
+        [{'note_id': 0, 'diagnosis': 'a', 'date': float('nan')}]
+    )
+    assert result['true_positives'] == 1
+
+def test_predictions_on_unlabeled_notes_are_ignored():
+    result = compute_relation_metrics(
+        [{'note_id': 0, 'diagnosis': 'a', 'date': 'd'}, {'note_id': 5, 'diagnosis': 'a', 'date': 'd'}],
+        [{'note_id': 0, 'diagnosis': 'a', 'date': 'd'}]
+    )
+    assert (result['precision'], result['recall'], result['num_predictions']) == (1.0, 1.0, 1)
+    assert list(result['per_note'].index) == [0]
+
+def test_empty_predictions():
+    result = compute_relation_metrics([], [{'note_id': 0, 'diagnosis': 'a', 'date': 'd'}])
+    assert (result['true_positives'], result['false_negatives'], result['f1']) == (0, 1, 0)
+
+@pytest.mark.parametrize('seed', range(10))
+def test_pr_curve_matches_thresholded_metrics(seed):
+    rng = random.Random(seed)
+    predictions = random_relations(rng, rng.randrange(1, 80), 0.05)
+    for prediction in predictions:
+        # Ties and missing confidences (counted as 1.0) exercise the grouping
+        prediction['confidence'] = rng.choice([None, 0.2, 0.5, 0.5, 0.9, round(rng.random(), 2)])
+    gold = random_relations(rng, rng.randrange(1, 60), 0.05)
+
+    result = compute_precision_recall_curve(predictions, gold)
+    assert len(result['curve'])
+    for point in result['curve'].itertuples():
+        kept = [p for p in predictions if (1.0 if p['confidence'] is None else p['confidence']) >= point.threshold]
+        expected = compute_relation_metrics(kept, gold)
+        assert (point.true_positives, point.false_positives) == (
+            expected['true_positives'], expected['false_positives'])
+        assert point.precision == pytest.approx(expected['precision'])
+        assert point.recall == pytest.approx(expected['recall'])
+        assert point.f1 == pytest.approx(expected['f1'])
+    best = result['curve']['f1'].idxmax()
+    assert result['best_threshold'] == result['curve'].loc[best, 'threshold']
+
+def bootstrap_per_note():
+    rng = random.Random(0)
+    return compute_relation_metrics(random_relations(rng, 120), random_relations(rng, 80))['per_note']
+
+def test_bootstrap_is_reproducible_and_independent_of_chunking():
+    per_note = bootstrap_per_note()
+    expected = bootstrap_confidence_intervals(per_note, n_resamples=200, seed=7)
+    assert bootstrap_confidence_intervals(per_note, n_resamples=200, seed=7) == expected
+    for chunk_size in (1, 13, 64, 200, 500):
+        assert bootstrap_confidence_intervals(per_note, n_resamples=200, seed=7, chunk_size=chunk_size) == expected
+    assert bootstrap_confidence_intervals(per_note, n_resamples=200, seed=7, chunk_size=13, num_workers=2) == expected
+    assert bootstrap_confidence_intervals(per_note, n_resamples=200, seed=8) != expected
+
+def test_bootstrap_intervals_bracket_the_point_estimate():
+    per_note = bootstrap_per_note()
+    intervals = bootstrap_confidence_intervals(per_note, n_resamples=500)
+    totals = per_note[list(KINDS)].sum()
+    precision = totals['true_positives'] / (totals['true_positives'] + totals['false_positives'])
+    recall = totals['true_positives'] / (totals['true_positives'] + totals['false_negatives'])
+    assert intervals['precision'][0] <= precision <= intervals['precision'][1]
+    assert intervals['recall'][0] <= recall <= intervals['recall'][1]
+    assert bootstrap_confidence_intervals(per_note.iloc[:0]) is None
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from extractors.llm_extractor import LLMExtractor
+from utils.openai_batch_utils import BatchJobError, LocalBatchBackend, chat_request, run_batch_job
+from utils.settings import load_settings
+
+GOOD = "Diabetes was diagnosed on 2024-01-05."
+BAD = "Asthma was diagnosed on 2023-03-02."
+ENTITIES = {
+    GOOD: ([('diabetes', 0)], [('2024-01-05', '2024-01-05', 26)]),
+    BAD: ([('asthma', 0)], [('2023-03-02', '2023-03-02', 24)])
+}
+GOOD_ANSWER = [{'diagnosis': 'diabetes', 'date': '2024-01-05', 'confidence': 0.9}]
+
+class StaticBackend:
+    """Batch backend whose jobs never complete."""
+
+    name = 'static'
+
+    def __init__(self, status):
+        self._status = status
+
+    def submit(self, input_path):
+        return 'batch_static'
+
+    def status(self, batch_id):
+        return {'status': self._status, 'completed': 0, 'failed': 0, 'total': 1}
+
+def make_extractor(tmp_path, responder, **overrides):
+    settings = load_settings({
+        'LLM_BATCH_MODE': True,
+        'OPENAI_BATCH_BACKEND': 'local',
+        'OPENAI_BATCH_DIR': str(tmp_path),
+        'OPENAI_BATCH_POLL_SECONDS': 0,
+        'LLM_STRUCTURED_OUTPUT': False,
+        'LLM_COMPACT_PROMPT': False,
+        **overrides
+    }, environ={})
+    extractor = LLMExtractor(settings)
+    assert extractor.load()
+    extractor.batch_backend = LocalBatchBackend(str(tmp_path / 'local'), responder)
+    return extractor
+
+def prompt_of(body):
+    return body['messages'][-1]['content']
+
+@pytest.mark.parametrize('status', ['failed', 'expired', 'in_progress'])
+def test_run_batch_job_raises_when_job_does_not_complete(tmp_path, status):
+    requests = [chat_request('note-0', {'model': 'gpt-4o', 'messages': []})]
+    with pytest.raises(BatchJobError) as excinfo:
+        run_batch_job(requests, StaticBackend(status), 'job', work_dir=str(tmp_path),
+                      poll_seconds=0, timeout_seconds=0)
+    assert excinfo.value.status == status
+    assert excinfo.value.custom_ids == ['note-0']
+
+@pytest.mark.parametrize('bad_answer', ['[{"diagnosis": ]', '["no relationship", 3]'])
+def test_bad_batch_response_only_affects_its_note(tmp_path, bad_answer):
+    def responder(body):
+        return bad_answer if BAD in prompt_of(body) else json.dumps(GOOD_ANSWER)
+
+    extractor = make_extractor(tmp_path, responder)
+    results = extractor.extract_batch_job([GOOD, BAD], [ENTITIES[GOOD], ENTITIES[BAD]])
+    assert results[0] == GOOD_ANSWER
+    assert results[1] == []
+
+def test_notes_missing_from_packed_batch_response_are_resubmitted_singly(tmp_path):
+    single_prompts = []
+
+    def responder(body):
+        prompt = prompt_of(body)
+        if '### Note' in prompt:
+            # Answer only the first note of the pack
+            return json.dumps({'1': GOOD_ANSWER})
+        single_prompts.append(prompt)
+        return json.dumps([{'diagnosis': 'asthma', 'date': '2023-03-02', 'confidence': 0.8}])
+
+    extractor = make_extractor(tmp_path, responder, LLM_PACK_NOTES=True)
+    results = extractor.extract_batch_job([GOOD, BAD], [ENTITIES[GOOD], ENTITIES[BAD]])
+    assert results[0] == GOOD_ANSWER
+    assert results[1] == [{'diagnosis': 'asthma', 'date': '2023-03-02', 'confidence': 0.8}]
+    assert len(single_prompts) == 1 and BAD in single_prompts[0]
+
+def test_incomplete_batch_job_is_not_scored_as_empty(tmp_path):
+    extractor = make_extractor(tmp_path, lambda body: '[]')
+    extractor.batch_backend = StaticBackend('failed')
+    with pytest.raises(BatchJobError):
+        extractor.extract_batch_job([GOOD], [ENTITIES[GOOD]])
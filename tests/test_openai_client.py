@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+from utils.openai_client import close_openai_clients, create_async_openai_client, get_openai_client
+from utils.settings import load_settings
+
+pytest.importorskip('openai')
+httpx = pytest.importorskip('httpx')
+
+@pytest.fixture
+def config(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'sk-test')
+    yield load_settings({'OPENAI_HTTP_CONNECT_TIMEOUT_SECONDS': 3.0, 'OPENAI_HTTP_TIMEOUT_SECONDS': 7.0}, environ={})
+    close_openai_clients()
+
+def test_client_is_shared_and_uses_the_configured_pool(config):
+    client = get_openai_client(config)
+    assert get_openai_client(config) is client
+    assert isinstance(client._client, httpx.Client)
+    assert (client._client.timeout.connect, client._client.timeout.read) == (3.0, 7.0)
+
+def test_async_client_uses_the_configured_pool(config):
+    client = create_async_openai_client(config, max_connections=4)
+    assert isinstance(client._client, httpx.AsyncClient)
+    assert client._client.timeout.connect == 3.0
+    asyncio.run(client.close())
+
+def test_missing_api_key_is_rejected(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'your_api_key_here')
+    with pytest.raises(ValueError):
+        get_openai_client(load_settings(environ={}))
@@ -0,0 +1,36 @@
+from extractors.llm_extractor import LLMExtractor
+from utils.prompt_utils import PromptSavings, summarize_prompt_savings
+from utils.settings import load_settings
+
+NOTE = "Diabetes was diagnosed on 2024-01-05."
+ENTITIES = ([('diabetes', 0)], [('2024-01-05', '2024-01-05', 26)])
+
+def test_prompt_savings_totals():
+    savings = PromptSavings()
+    savings.add(100, 40, exact=True)
+    savings.add(50, 50, exact=True)
+    assert savings.summary() == {
+        'notes': 2, 'full_tokens': 150, 'compact_tokens': 90, 'saved_tokens': 60,
+        'mean_saving_pct': 30.0, 'exact': True
+    }
+    savings.add(0, 10)
+    summary = savings.summary()
+    assert summary['notes'] == 3 and summary['mean_saving_pct'] == 30.0 and not summary['exact']
+
+def test_summarize_prompt_savings_matches_running_totals():
+    records = [{'full_tokens': 80, 'compact_tokens': 20, 'exact': False},
+               {'full_tokens': 40, 'compact_tokens': 30, 'exact': False}]
+    savings = PromptSavings()
+    for record in records:
+        savings.add(record['full_tokens'], record['compact_tokens'], record['exact'])
+    assert summarize_prompt_savings(records) == savings.summary()
+
+def test_extractor_keeps_prompt_totals_not_records():
+    extractor = LLMExtractor(load_settings({'LLM_COMPACT_PROMPT': True}, environ={}))
+    for _ in range(100):
+        extractor._prepare_note(NOTE, ENTITIES)
+    extractor.num_requests = 100
+    stats = extractor.get_prompt_stats()
+    assert stats['notes'] == 100 and stats['requests'] == 100
+    assert stats['compact_tokens'] < stats['full_tokens']
+    assert not hasattr(extractor, 'prompt_records')
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import pytest
+
+from utils.relative_date_store import RelativeDateStore, parse_document_timestamp, relative_date_model_id
+from utils.settings import load_settings
+
+TIMESTAMP = datetime(2024, 6, 1)
+DATES = [('2023-06-01', 'last year', 10)]
+
+@pytest.fixture(params=['relative_dates.csv', 'relative_dates.parquet'])
+def store_path(request, tmp_path):
+    if request.param.endswith('.parquet'):
+        pytest.importorskip('pyarrow')
+    return str(tmp_path / request.param)
+
+def test_results_are_keyed_by_text_timestamp_and_model(store_path):
+    store = RelativeDateStore(store_path)
+    store.put_many([('note', TIMESTAMP, DATES), ('empty note', TIMESTAMP, [])], 'openai:gpt-3.5-turbo:1000')
+
+    store = RelativeDateStore(store_path)
+    assert len(store) == 2
+    assert store.get('note', TIMESTAMP, 'openai:gpt-3.5-turbo:1000') == DATES
+    # A note without relative dates is stored as [], unprocessed notes are None
+    assert store.get('empty note', TIMESTAMP, 'openai:gpt-3.5-turbo:1000') == []
+    assert store.get('note!', TIMESTAMP, 'openai:gpt-3.5-turbo:1000') is None
+    assert store.get('note', datetime(2024, 6, 2), 'openai:gpt-3.5-turbo:1000') is None
+    assert store.get('note', TIMESTAMP, 'llama:Llama-3.2-3B-Instruct:1000') is None
+
+def test_put_many_adds_to_stored_results(store_path):
+    RelativeDateStore(store_path).put_many([('first', TIMESTAMP, DATES)], 'model')
+    store = RelativeDateStore(store_path)
+    store.put_many([('second', TIMESTAMP, [])], 'model')
+
+    store = RelativeDateStore(store_path)
+    assert len(store) == 2
+    assert store.get('first', TIMESTAMP, 'model') == DATES
+
+def test_model_id_includes_context_window():
+    config = load_settings({'RELATIVE_DATE_LLM_MODEL': 'openai', 'RELATIVE_DATE_CONTEXT_WINDOW': 500}, environ={})
+    assert relative_date_model_id(config) == f"openai:{config.RELATIVE_DATE_OPENAI_MODEL}:500"
+    assert relative_date_model_id(config) != relative_date_model_id(config.replace(RELATIVE_DATE_CONTEXT_WINDOW=1000))
+
+@pytest.mark.parametrize('value', ['2024-06-01', '06/01/2024', '01-Jun-2024', '01 Jun 2024'])
+def test_parse_document_timestamp(value):
+    assert parse_document_timestamp(value) == TIMESTAMP
+
+@pytest.mark.parametrize('value', [None, '', 'yesterday', float('nan')])
+def test_parse_document_timestamp_rejects_unknown_values(value):
+    assert parse_document_timestamp(value) is None
@@ -0,0 +1,108 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from extractors.llm_extractor import LLMExtractor
+from utils.extraction_utils import (
+    extract_relative_dates_llm,
+    extract_relative_dates_openai_batch,
+    parse_relative_dates_llama,
+    parse_relative_dates_openai,
+    run_relative_date_stage,
+    store_combined_relative_dates
+)
+from utils.openai_batch_utils import LocalBatchBackend
+from utils.relative_date_store import RelativeDateStore, relative_date_model_id
+from utils.settings import load_settings
+
+TIMESTAMP = datetime(2024, 6, 1)
+ANSWER = '[{"phrase": "last year", "start_index": 10, "calculated_date": "2023-06-01"}]'
+MALFORMED = ['["last year", 3]', '[{"phrase": ]', 'No relative dates here.']
+
+def batch_settings(tmp_path):
+    return load_settings({
+        'OPENAI_BATCH_BACKEND': 'local',
+        'OPENAI_BATCH_DIR': str(tmp_path),
+        'OPENAI_BATCH_POLL_SECONDS': 0
+    }, environ={})
+
+def llama_settings(tmp_path, batch_size):
+    return load_settings({
+        'RELATIVE_DATE_LLM_MODEL': 'llama',
+        'RELATIVE_DATE_LLAMA_BATCH_SIZE': batch_size,
+        'RELATIVE_DATE_STORE_PATH': str(tmp_path / 'relative_dates.csv')
+    }, environ={})
+
+def fake_llama(monkeypatch, answer):
+    """Replace the Llama pipeline; answer maps a prompt to the model response."""
+    monkeypatch.setattr('utils.extraction_utils.get_llama_pipeline', lambda path: object())
+    monkeypatch.setattr('utils.extraction_utils.generate_chat_batch',
+                        lambda pipe, system, instructions, inputs, **kwargs: [answer(text) for text in inputs])
+
+def test_parse_relative_dates():
+    assert parse_relative_dates_openai(ANSWER) == [('2023-06-01', 'last year', 10)]
+    assert parse_relative_dates_llama(ANSWER) == [('2023-06-01', 'last year', 10)]
+    assert parse_relative_dates_openai('[]') == []
+    assert parse_relative_dates_llama('[]') == []
+
+@pytest.mark.parametrize('response', MALFORMED)
+def test_malformed_relative_date_responses_parse_to_none(response):
+    assert parse_relative_dates_openai(response) is None
+    assert parse_relative_dates_llama(response) is None
+
+def test_openai_batch_malformed_response_only_affects_its_item(tmp_path, monkeypatch):
+    def responder(body):
+        return '["last year"]' if 'bad note' in body['messages'][-1]['content'] else ANSWER
+
+    monkeypatch.setattr('utils.extraction_utils.create_batch_backend',
+                        lambda config, client=None: LocalBatchBackend(str(tmp_path / 'local'), responder))
+    results = extract_relative_dates_openai_batch(
+        [('Seen last year for asthma.', TIMESTAMP), ('bad note', TIMESTAMP)], batch_settings(tmp_path)
+    )
+    assert results == [[('2023-06-01', 'last year', 10)], None]
+
+def test_llama_errors_are_raised_on_request(tmp_path, monkeypatch):
+    fake_llama(monkeypatch, lambda text: 'not json')
+    config = llama_settings(tmp_path, 1)
+    assert extract_relative_dates_llm('Seen last year.', TIMESTAMP, config) == []
+    with pytest.raises(ValueError):
+        extract_relative_dates_llm('Seen last year.', TIMESTAMP, config, raise_errors=True)
+
+@pytest.mark.parametrize('batch_size', [1, 2])
+def test_stage_only_stores_real_results(tmp_path, monkeypatch, batch_size):
+    fake_llama(monkeypatch, lambda text: 'not json' if 'bad note' in text else ANSWER)
+    config = llama_settings(tmp_path, batch_size)
+    df = pd.DataFrame({
+        'note': ['Seen last year for asthma.', 'bad note'],
+        'document_timestamp': ['2024-06-01', '2024-06-01']
+    })
+    store = RelativeDateStore(config.RELATIVE_DATE_STORE_PATH)
+    stats = run_relative_date_stage(config, df, store=store)
+    assert (stats['extracted'], stats['failed']) == (1, 1)
+
+    model = relative_date_model_id(config)
+    store = RelativeDateStore(config.RELATIVE_DATE_STORE_PATH)
+    assert store.get('Seen last year for asthma.', TIMESTAMP, model) == [('2023-06-01', 'last year', 10)]
+    assert store.get('bad note', TIMESTAMP, model) is None
+
+def test_failed_combined_requests_are_not_stored(tmp_path):
+    config = load_settings({'RELATIVE_DATE_STORE_PATH': str(tmp_path / 'relative_dates.csv')}, environ={})
+    store_combined_relative_dates(config, [
+        {'note': 'found', 'document_timestamp': TIMESTAMP, 'relative_dates': [('2023-06-01', 'last year', 10)]},
+        {'note': 'none found', 'document_timestamp': TIMESTAMP, 'relative_dates': []},
+        {'note': 'failed', 'document_timestamp': TIMESTAMP, 'relative_dates': None},
+        {'note': 'not processed', 'document_timestamp': TIMESTAMP}
+    ])
+    store = RelativeDateStore(config.RELATIVE_DATE_STORE_PATH)
+    model = f"llm-combined:{config.OPENAI_MODEL}"
+    assert store.get('found', TIMESTAMP, model) == [('2023-06-01', 'last year', 10)]
+    assert store.get('none found', TIMESTAMP, model) == []
+    assert store.get('failed', TIMESTAMP, model) is None
+    assert store.get('not processed', TIMESTAMP, model) is None
+
+@pytest.mark.parametrize('content', ['not json', '{"relationships": []}', '{"relative_dates": "none"}'])
+def test_malformed_combined_response_has_unknown_relative_dates(content):
+    extractor = LLMExtractor(load_settings(environ={}))
+    compact = {'diagnosis_ids': {}, 'date_ids': {}}
+    assert extractor._parse_combined(content, compact) == ([], None)
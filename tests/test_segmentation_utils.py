@@ -0,0 +1,64 @@
+import pytest
+
+from utils.segmentation_utils import (
+    get_entity_sections,
+    get_section_window,
+    in_section_window,
+    restrict_entities_to_sections,
+    split_sections
+)
+from utils.settings import load_settings
+
+NOTE = (
+    "HPI: Patient reports chest pain.\n"
+    "\n"
+    "MRI (2024-01-05): no acute findings.\n"
+    "F/U (12/03/24): asthma stable.\n"
+    "  ASSESSMENT: diabetes, controlled"
+)
+
+def section_texts(text):
+    return [text[start:end] for start, end in split_sections(text)]
+
+def test_split_sections_covers_the_text():
+    sections = split_sections(NOTE)
+    assert sections[0][0] == 0 and sections[-1][1] == len(NOTE)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(sections, sections[1:]))
+
+def test_split_sections_at_blank_lines_and_headers():
+    texts = section_texts(NOTE)
+    assert [text.strip() for text in texts] == [
+        "HPI: Patient reports chest pain.",
+        "MRI (2024-01-05): no acute findings.",
+        "F/U (12/03/24): asthma stable.",
+        "ASSESSMENT: diabetes, controlled"
+    ]
+    # Indented headers start at the header text
+    assert texts[-1].startswith("ASSESSMENT")
+
+@pytest.mark.parametrize('text', ['', 'single line without headers'])
+def test_split_sections_without_breaks(text):
+    assert split_sections(text) == [(0, len(text))]
+
+@pytest.mark.parametrize('diagnosis_section, date_section, window, expected', [
+    (2, 2, None, True), (0, 5, None, True),
+    (2, 2, 0, True), (2, 3, 0, False),
+    (2, 3, 1, True), (3, 2, 1, True), (2, 4, 1, False)
+])
+def test_in_section_window(diagnosis_section, date_section, window, expected):
+    assert in_section_window(diagnosis_section, date_section, window) is expected
+
+def test_entities_outside_the_window_are_dropped():
+    diagnoses = [('chest pain', NOTE.index('chest pain')), ('diabetes', NOTE.index('diabetes'))]
+    dates = [('2024-01-05', '2024-01-05', NOTE.index('2024-01-05')), ('2024-12-03', '12/03/24', NOTE.index('12/03/24'))]
+    assert get_entity_sections(NOTE, (diagnoses, dates)) == ([0, 3], [1, 2])
+
+    # Same section: no diagnosis shares a section with a date
+    assert restrict_entities_to_sections(NOTE, diagnoses, dates, 0) == ([], [])
+    # Adjacent sections: chest pain (0) pairs with 2024-01-05 (1), diabetes (3) with 12/03/24 (2)
+    assert restrict_entities_to_sections(NOTE, diagnoses, dates, 1) == (diagnoses, dates)
+    assert restrict_entities_to_sections(NOTE, diagnoses, dates, None) == (diagnoses, dates)
+
+@pytest.mark.parametrize('restriction, window', [('off', None), ('same', 0), ('ADJACENT', 1), ('unknown', None)])
+def test_get_section_window(restriction, window):
+    assert get_section_window(load_settings({'SECTION_RESTRICTION': restriction}, environ={})) == window
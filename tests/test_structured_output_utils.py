@@ -0,0 +1,107 @@
+import json
+import random
+
+import pytest
+
+from utils.structured_output_utils import RelationshipArrayConstraint, parse_relationships_json
+
+DIAGNOSES = ['asthma', 'copd', 'type 2 diabetes']
+DATES = ['2024-01-01', '01/02/24']
+PROMPT = [1, 2, 3]
+EOS = 0
+
+class CharTokenizer:
+    """One token per character (id = code point), EOS = 0."""
+
+    eos_token_id = EOS
+    pad_token_id = None
+
+    def __call__(self, text, add_special_tokens=True):
+        return {'input_ids': [ord(char) for char in text]}
+
+def constraint():
+    return RelationshipArrayConstraint(CharTokenizer(), DIAGNOSES, DATES)
+
+def accepts(constraint, text):
+    """Feed `text` one token at a time; True if every token was allowed."""
+    input_ids = list(PROMPT)
+    for char in text:
+        if ord(char) not in constraint.allowed_tokens(input_ids):
+            return False
+        input_ids.append(ord(char))
+    constraint.allowed_tokens(input_ids)
+    return True
+
+def item(diagnosis, date, confidence):
+    return f'{{"diagnosis": {json.dumps(diagnosis)}, "date": {json.dumps(date)}, "confidence": {confidence}}}'
+
+@pytest.mark.parametrize('text', [
+    '[]',
+    '[' + item('copd', '01/02/24', '0.7') + ']',
+    '[' + ', '.join(item(name, '2024-01-01', '1.0') for name in DIAGNOSES) + ']'
+])
+def test_valid_array_is_accepted_and_then_only_eos(text):
+    decoder = constraint()
+    assert accepts(decoder, text)
+    assert decoder.allowed_tokens(PROMPT + [ord(char) for char in text]) == [EOS]
+    assert parse_relationships_json(text) == json.loads(text)
+
+def test_used_diagnosis_cannot_be_repeated():
+    first = '[' + item('asthma', '2024-01-01', '0.5')
+    assert accepts(constraint(), first + ', ' + item('copd', '2024-01-01', '0.5') + ']')
+    assert not accepts(constraint(), first + ', ' + item('asthma', '01/02/24', '0.5') + ']')
+
+@pytest.mark.parametrize('text', [
+    '[{"diagnosis": "flu", "date": "2024-01-01", "confidence": 0.5}]',
+    '[' + item('asthma', '2024-02-02', '0.5') + ']',
+    '[' + item('asthma', '2024-01-01', '0.55') + ']',
+    '[' + item('asthma', '2024-01-01', '0.5') + ']]'
+])
+def test_invalid_array_is_rejected(text):
+    assert not accepts(constraint(), text)
+
+def test_eos_is_the_only_token_after_closing_bracket():
+    decoder = constraint()
+    text = '[' + item('copd', '2024-01-01', '0.1') + ']'
+    assert accepts(decoder, text)
+    input_ids = PROMPT + [ord(char) for char in text]
+    assert decoder.allowed_tokens(input_ids) == [EOS]
+    # Anything generated after the array still leaves only EOS
+    assert decoder.allowed_tokens(input_ids + [EOS, EOS]) == [EOS]
+
+def test_max_new_tokens_covers_longest_valid_output():
+    longest_date = max(DATES, key=len)
+    longest = '[' + ', '.join(item(name, longest_date, '0.1') for name in DIAGNOSES) + ']'
+    decoder = constraint()
+    assert accepts(decoder, longest)
+    assert decoder.max_new_tokens() >= len(longest) + 1  # + EOS
+
+@pytest.mark.parametrize('seed', range(10))
+def test_random_constrained_walk_is_valid_json(seed):
+    rng = random.Random(seed)
+    decoder = constraint()
+    input_ids = list(PROMPT)
+    while True:
+        token_id = rng.choice(decoder.allowed_tokens(input_ids))
+        if token_id == EOS:
+            break
+        input_ids.append(token_id)
+    generated = input_ids[len(PROMPT):]
+    assert len(generated) + 1 <= decoder.max_new_tokens()
+
+    relationships = json.loads(''.join(chr(token_id) for token_id in generated))
+    diagnoses = [rel['diagnosis'] for rel in relationships]
+    assert len(set(diagnoses)) == len(diagnoses) and set(diagnoses) <= set(DIAGNOSES)
+    assert all(rel['date'] in DATES and 0 < rel['confidence'] <= 1 for rel in relationships)
+
+def test_truncated_array_keeps_complete_objects():
+    text = '[' + item('asthma', '2024-01-01', '0.5') + ', ' + item('copd', '01/02/24', '0.7')[:20]
+    assert parse_relationships_json(text) == [{'diagnosis': 'asthma', 'date': '2024-01-01', 'confidence': 0.5}]
+
+@pytest.mark.parametrize('text', ['', 'no relationships', '[{"diagnosis": "asthma"', '{"relationships": '])
+def test_unparseable_output_gives_no_relationships(text):
+    assert parse_relationships_json(text) == []
+
+def test_wrapped_relationships_are_normalized():
+    text = '{"relationships": [{"diagnosis": "asthma", "date": "d", "confidence": "high"}, {"date": "d"}]}'
+    assert parse_relationships_json(text) == [{'diagnosis': 'asthma', 'date': 'd', 'confidence': 1.0}]
@@ -0,0 +1,94 @@
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import Dataset
+
+from model_training.DiagnosisDateRelationModel import DiagnosisDateRelationModel
+from utils.training_utils import create_data_loaders, load_checkpoint, seed_everything, train_model
+
+EPOCHS = 3
+BATCH_SIZE = 8
+PARAMS = {'LEARNING_RATE': 0.01, 'NUM_EPOCHS': EPOCHS, 'BATCH_SIZE': BATCH_SIZE}
+
+class RandomExamples(Dataset):
+    """Fixed random examples in the ClinicalNoteDataset item format."""
+
+    def __init__(self, size, seed):
+        generator = torch.Generator().manual_seed(seed)
+        self.context = torch.randint(1, 20, (size, 16), generator=generator)
+        self.distance = torch.rand(size, generator=generator)
+        self.diag_before = torch.randint(0, 2, (size,), generator=generator).float()
+        self.label = torch.randint(0, 2, (size,), generator=generator).float()
+
+    def __len__(self):
+        return len(self.label)
+
+    def __getitem__(self, idx):
+        return {'context': self.context[idx], 'distance': self.distance[idx],
+                'diag_before': self.diag_before[idx], 'label': self.label[idx]}
+
+class Interrupted(Exception):
+    pass
+
+class InterruptingLoss(nn.BCELoss):
+    """BCELoss that raises Interrupted on its `after`-th call."""
+
+    def __init__(self, after):
+        super().__init__()
+        self.calls = 0
+        self.after = after
+
+    def forward(self, outputs, labels):
+        self.calls += 1
+        if self.calls == self.after:
+            raise Interrupted()
+        return super().forward(outputs, labels)
+
+def run(tmp_path, criterion=None, params=PARAMS, resume=True):
+    seed_everything(0)
+    train_loader, val_loader, generator = create_data_loaders(
+        RandomExamples(32, 1), RandomExamples(8, 2), BATCH_SIZE, 'cpu', seed=0
+    )
+    model = DiagnosisDateRelationModel(vocab_size=20, embedding_dim=8, hidden_dim=8)
+    optimizer = optim.Adam(model.parameters(), lr=params['LEARNING_RATE'])
+    history = train_model(
+        model, train_loader, val_loader, optimizer, criterion or nn.BCELoss(), EPOCHS, 'cpu',
+        str(tmp_path / 'best.pt'), checkpoint_path=str(tmp_path / 'checkpoint.pt'), resume=resume,
+        generator=generator, training_params=params
+    )
+    return history, model
+
+def interrupt_in_second_epoch(tmp_path):
+    # 4 training and 1 validation batch per epoch: fail on the second epoch's second batch
+    try:
+        run(tmp_path, InterruptingLoss(after=7))
+    except Interrupted:
+        return
+    raise AssertionError("training was not interrupted")
+
+def test_interrupted_run_resumes_to_the_same_result(tmp_path):
+    full_history, full_model = run(tmp_path / 'full')
+    interrupt_in_second_epoch(tmp_path / 'resumed')
+    resumed_history, resumed_model = run(tmp_path / 'resumed')
+    assert resumed_history == full_history
+    for name, value in full_model.state_dict().items():
+        assert torch.equal(value, resumed_model.state_dict()[name]), name
+
+def test_finished_run_is_not_resumed(tmp_path, capsys):
+    first_history, _ = run(tmp_path)
+    capsys.readouterr()
+    second_history, _ = run(tmp_path)
+    # The second run trains all epochs again from scratch
+    output = capsys.readouterr().out
+    assert f"Epoch 1/{EPOCHS}" in output and f"Epoch {EPOCHS}/{EPOCHS}" in output
+    assert second_history == first_history
+
+def test_checkpoint_with_different_params_is_not_resumed(tmp_path):
+    interrupt_in_second_epoch(tmp_path)
+    model = DiagnosisDateRelationModel(vocab_size=20, embedding_dim=8, hidden_dim=8)
+    optimizer = optim.Adam(model.parameters())
+    path = str(tmp_path / 'checkpoint.pt')
+    assert load_checkpoint(path, model, optimizer, 'cpu', num_train_examples=32, training_params=PARAMS) is not None
+    assert load_checkpoint(path, model, optimizer, 'cpu', num_train_examples=32,
+                           training_params={**PARAMS, 'LEARNING_RATE': 0.001}) is None
+    assert load_checkpoint(path, model, optimizer, 'cpu', num_train_examples=24, training_params=PARAMS) is None
@@ -0,0 +1,215 @@
+# utils/batching_utils.py
+import time
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+# Number of recent per-item queue delays kept for percentile statistics
+DELAY_WINDOW = 10000
+
+class MicroBatcher:
+    """
+    Request coalescer for batch-friendly work such as model inference.
+
+    Callers submit single items and get a Future back. A worker thread collects
+    items until `max_batch_size` are waiting or `max_wait_ms` has passed since the
+    first item of the batch arrived, calls `batch_fn` once on the whole batch, and
+    resolves each caller's future with its own result. If `batch_fn` fails on a batch,
+    its items are retried one at a time so only the failing items' futures get the error.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait_ms=5.0, name=None):
+        """
+        Start the batcher.
+
+        Args:
+            batch_fn (callable): Takes a list of items and returns a list of results in
+                the same order. If it raises, each item of the batch is passed to it again
+                on its own, and the items that still fail get the exception.
+            max_batch_size (int): Maximum number of items per batch_fn call.
+            max_wait_ms (float): Longest time to hold a partial batch waiting for more items.
+            name (str, optional): Name for the worker thread and statistics.
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000
+        self.name = name or getattr(batch_fn, '__name__', 'batcher')
+
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+
+        # Statistics
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._queue_delays_ms = deque(maxlen=DELAY_WINDOW)
+        self._num_items = 0
+        self._num_batches = 0
+        self._num_failed_batches = 0
+        self._num_failed_items = 0
+        self._batch_time_s = 0.0
+
+        self._worker = threading.Thread(target=self._run, name=f"MicroBatcher-{self.name}", daemon=True)
+        self._worker.start()
+
+    def submit(self, item):
+        """
+        Queue an item for the next batch.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the item's result.
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f"MicroBatcher '{self.name}' is closed")
+            self._pending.append((item, future, time.perf_counter()))
+            self._condition.notify()
+        return future
+
+    def __call__(self, item, timeout=None):
+        """Submit an item and block until its result is available."""
+        return self.submit(item).result(timeout=timeout)
+
+    def _next_batch(self):
+        """Wait for the first item, then collect more until the batch is full or the deadline passes."""
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0][2] + self.max_wait_s
+            while len(self._pending) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            size = min(self.max_batch_size, len(self._pending))
+            return [self._pending.popleft() for _ in range(size)]
+
+    def _call(self, items):
+        results = self.batch_fn(items)
+        if len(results) != len(items):
+            raise RuntimeError(f"batch_fn returned {len(results)} results for {len(items)} items")
+        return results
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            items = [item for item, _, _ in batch]
+            errors = [None] * len(items)
+            failed = False
+            try:
+                results = self._call(items)
+            except Exception as e:
+                failed = True
+                results = [None] * len(items)
+                if len(items) == 1:
+                    errors[0] = e
+                else:
+                    # Retry the items one at a time so one bad item doesn't fail the whole batch
+                    for index, item in enumerate(items):
+                        try:
+                            results[index] = self._call([item])[0]
+                        except Exception as item_error:
+                            errors[index] = item_error
+            elapsed = time.perf_counter() - started
+
+            with self._stats_lock:
+                self._num_batches += 1
+                self._num_items += len(batch)
+                self._batch_sizes[len(batch)] += 1
+                self._batch_time_s += elapsed
+                if failed:
+                    self._num_failed_batches += 1
+                self._num_failed_items += sum(1 for error in errors if error is not None)
+                self._queue_delays_ms.extend((started - queued_at) * 1000 for _, _, queued_at in batch)
+
+            for (_, future, _), result, error in zip(batch, results, errors):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def get_stats(self):
+        """
+        Get batching statistics.
+
+        Returns:
+            dict: Item/batch counts, batch size distribution, and queueing delay
+                  percentiles (ms, over the most recent items).
+        """
+        with self._stats_lock:
+            delays = np.array(self._queue_delays_ms, dtype=float)
+            stats = {
+                'name': self.name,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait_s * 1000,
+                'items': self._num_items,
+                'batches': self._num_batches,
+                'failed_batches': self._num_failed_batches,
+                'failed_items': self._num_failed_items,
+                'mean_batch_size': self._num_items / self._num_batches if self._num_batches else 0.0,
+                'batch_size_histogram': {str(size): count for size, count in sorted(self._batch_sizes.items())},
+                'mean_batch_time_ms': self._batch_time_s / self._num_batches * 1000 if self._num_batches else 0.0
+            }
+        if len(delays):
+            p50, p90, p99 = np.percentile(delays, [50, 90, 99])
+            stats['queue_delay_ms'] = {
+                'mean': float(delays.mean()),
+                'p50': float(p50),
+                'p90': float(p90),
+                'p99': float(p99),
+                'max': float(delays.max())
+            }
+        else:
+            stats['queue_delay_ms'] = None
+        return stats
+
+    def close(self, wait=True):
+        """Stop accepting items; queued items are still processed before the worker exits."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if wait:
+            self._worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def create_extractor_batcher(extractor, max_batch_size=32, max_wait_ms=5.0):
+    """
+    Wrap an extractor's extract_batch() in a MicroBatcher.
+
+    Submitted items are (text, entities) tuples; each future resolves to that note's
+    list of relationship dicts.
+
+    Returns:
+        MicroBatcher: The batcher (close it when done).
+    """
+    def extract_items(items):
+        texts = [text for text, _ in items]
+        entities_list = [entities for _, entities in items]
+        return extractor.extract_batch(texts, entities_list)
+
+    return MicroBatcher(extract_items, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                        name=getattr(extractor, 'name', None))
+
+def format_batcher_stats(stats):
+    """One-line summary of MicroBatcher statistics for console output."""
+    line = (f"{stats['batches']} batches, {stats['items']} items, "
+            f"mean batch size {stats['mean_batch_size']:.1f}")
+    if stats['queue_delay_ms']:
+        delays = stats['queue_delay_ms']
+        line += f", queue delay p50 {delays['p50']:.1f} ms / p99 {delays['p99']:.1f} ms"
+    if stats.get('failed_batches'):
+        line += f", {stats['failed_batches']} failed batches retried per item ({stats['failed_items']} items failed)"
+    return line
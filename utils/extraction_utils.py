@@ -4,20 +4,41 @@ import os
 import ast  # For safely evaluating Python literals
 from datetime import datetime
 import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.metrics import ConfusionMatrixDisplay
 import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 # Add tqdm for progress bars
 from tqdm import tqdm
 # Add pandas for CSV processing
 import pandas as pd
-# Add dotenv for OpenAI API keys
-from dotenv import load_dotenv
+from utils.profiling_utils import (
+    NULL_PROFILER,
+    STAGE_DATA_LOAD,
+    STAGE_ANNOTATION_PARSING,
+    STAGE_ENTITY_EXTRACTION,
+    STAGE_RELATIVE_DATE_EXTRACTION,
+    STAGE_CSV_WRITE
+)
+from data.JsonlNoteDataset import JsonlNoteDataset, is_jsonl_path
+from utils.reporting_utils import queue_plot
+from utils.batching_utils import create_extractor_batcher, format_batcher_stats
+from utils.llama_utils import get_llama_pipeline, generate_chat_batch
+from utils.prompt_utils import format_prompt_savings
+from utils.openai_client import get_openai_client, create_async_openai_client
+from utils.llm_usage_utils import create_chat_completion, acreate_chat_completion
+from utils.relative_date_store import (
+    RelativeDateStore,
+    parse_document_timestamp,
+    relative_date_model_id
+)
+from utils.openai_batch_utils import chat_request, create_batch_backend, run_batch_job
+from utils.metrics_utils import compute_relation_metrics, bootstrap_confidence_intervals, compute_precision_recall_curve
 
 # Get the appropriate data path based on the config
 def get_data_path(config):
     """
     Determine the correct dataset path based on the DATA_SOURCE value in config.
+    An explicit DATASET_PATH setting takes precedence.
     
     Args:
         config: The configuration object containing data source settings.
@@ -25,6 +46,9 @@ def get_data_path(config):
     Returns:
         str: Path to the dataset file to be used.
     """
+    if getattr(config, 'DATASET_PATH', None):
+        return config.DATASET_PATH
+
     if not hasattr(config, 'DATA_SOURCE'):
         # Default to synthetic data if DATA_SOURCE is not defined
         return getattr(config, 'SYNTHETIC_DATASET_PATH', 'data/synthetic_data.json')
@@ -148,7 +172,7 @@ def extract_entities(text):
     return diagnoses, dates
 
 # Helper function to load dataset, select samples, prepare gold standard, and extract entities
-def load_and_prepare_data(dataset_path, num_samples, config=None):
+def load_and_prepare_data(dataset_path, num_samples, config=None, profiler=None):
     """
     Loads dataset, selects samples, prepares gold standard, and pre-extracts entities.
     Supports both synthetic data from JSON and real data from CSV.
@@ -157,6 +181,7 @@ def load_and_prepare_data(dataset_path, num_samples, config=None):
         dataset_path (str): Path to the dataset file (JSON or CSV).
         num_samples (int): Maximum number of samples to use (if provided).
         config: Configuration object to determine the data source.
+        profiler (StageProfiler, optional): Profiler recording per-stage timings.
 
     Returns:
         tuple: (prepared_test_data, gold_standard) or (None, None) if loading fails.
@@ -173,24 +198,38 @@ def load_and_prepare_data(dataset_path, num_samples, config=None):
         using_real_data = config.DATA_SOURCE.lower() != 'synthetic'
     
     if using_real_data:
-        return load_real_data(config, num_samples)
+        return load_real_data(config, num_samples, profiler)
     else:
-        return load_synthetic_data(dataset_path, num_samples)
+        return load_synthetic_data(dataset_path, num_samples, profiler)
 
-def load_synthetic_data(dataset_path, num_samples):
+def load_synthetic_data(dataset_path, num_samples, profiler=None):
     """
-    Loads synthetic data from a JSON file.
+    Loads synthetic data from a JSON or JSON Lines file.
+    JSON Lines datasets are read through an offset index, so only the
+    evaluation split is ever read from disk.
     """
+    profiler = profiler or NULL_PROFILER
+
     if not os.path.exists(dataset_path):
         print(f"Error: Dataset not found at {dataset_path}")
         return None, None
 
     print(f"Loading synthetic dataset from {dataset_path}...")
+    jsonl_dataset = None
     try:
-        with open(dataset_path, 'r') as f:
-            full_dataset = json.load(f)
+        with profiler.stage(STAGE_DATA_LOAD) as timing:
+            if is_jsonl_path(dataset_path):
+                # Lazy, indexed dataset: slicing below selects index ranges without reading notes
+                jsonl_dataset = JsonlNoteDataset(dataset_path)
+                full_dataset = jsonl_dataset.view()
+            else:
+                with open(dataset_path, 'r') as f:
+                    full_dataset = json.load(f)
+            timing.notes = len(full_dataset)
     except Exception as e:
         print(f"Error loading dataset: {e}")
+        if jsonl_dataset is not None:
+            jsonl_dataset.close()
         return None, None
 
     # Calculate the 80/20 split point
@@ -208,9 +247,15 @@ def load_synthetic_data(dataset_path, num_samples):
         test_data = dataset
         print(f"Using all {len(test_data)} evaluation samples.")
 
+    if jsonl_dataset is not None:
+        # Read just the evaluation notes, then release the file handle and mmap
+        with jsonl_dataset, profiler.stage(STAGE_DATA_LOAD):
+            test_data = list(test_data)
+
     # Prepare gold standard list with progress bar
     gold_standard = []
-    with tqdm(total=len(test_data), desc="Preparing gold standard", unit="note") as pbar:
+    with profiler.stage(STAGE_ANNOTATION_PARSING, notes=len(test_data)), \
+         tqdm(total=len(test_data), desc="Preparing gold standard", unit="note") as pbar:
         for i, entry in enumerate(test_data):
             # Check if 'ground_truth' exists and is iterable
             if 'ground_truth' in entry and isinstance(entry['ground_truth'], list):
@@ -240,7 +285,8 @@ def load_synthetic_data(dataset_path, num_samples):
     # Pre-extract entities for efficiency with progress bar
     print("Pre-extracting entities...")
     prepared_test_data = []
-    with tqdm(total=len(test_data), desc="Pre-extracting entities", unit="note") as pbar:
+    with profiler.stage(STAGE_ENTITY_EXTRACTION, notes=len(test_data)), \
+         tqdm(total=len(test_data), desc="Pre-extracting entities", unit="note") as pbar:
         for entry in test_data:
             text = entry.get('clinical_note', '') # Handle missing 'clinical_note'
             entities = extract_entities(text)
@@ -253,17 +299,19 @@ def load_synthetic_data(dataset_path, num_samples):
 
     return prepared_test_data, gold_standard
 
-def load_real_data(config, num_samples):
+def load_real_data(config, num_samples, profiler=None):
     """
     Loads real data from a CSV file.
     
     Args:
         config: The configuration object containing paths and column names.
         num_samples (int): Maximum number of samples to use (if provided).
+        profiler (StageProfiler, optional): Profiler recording per-stage timings.
         
     Returns:
         tuple: (prepared_test_data, gold_standard) or (None, None) if loading fails.
     """
+    profiler = profiler or NULL_PROFILER
     dataset_path = get_data_path(config)
     text_column = config.REAL_DATA_TEXT_COLUMN
     gold_column = getattr(config, 'REAL_DATA_GOLD_COLUMN', None)
@@ -280,7 +328,9 @@ def load_real_data(config, num_samples):
     print(f"Loading real dataset from {dataset_path}...")
     try:
         # Read the CSV file
-        df = pd.read_csv(dataset_path)
+        with profiler.stage(STAGE_DATA_LOAD) as timing:
+            df = pd.read_csv(dataset_path)
+            timing.notes = len(df)
         
         # Check if the text column exists
         if text_column not in df.columns:
@@ -300,9 +350,6 @@ def load_real_data(config, num_samples):
             if timestamp_column and timestamp_column in df.columns:
                 relative_date_extraction_enabled = True
                 print(f"Relative date extraction enabled using timestamp column: {timestamp_column}")
-                
-                # Add new column for storing LLM extracted dates
-                df['llm_extracted_dates'] = None
             else:
                 print(f"Warning: Relative date extraction enabled in config but timestamp column '{timestamp_column}' not found in CSV")
             
@@ -316,7 +363,8 @@ def load_real_data(config, num_samples):
     if gold_column and gold_column in df.columns:
         print("Found gold standard column. Processing gold standard data...")
         
-        with tqdm(total=len(df), desc="Preparing gold standard", unit="note") as pbar:
+        with profiler.stage(STAGE_ANNOTATION_PARSING), \
+             tqdm(total=len(df), desc="Preparing gold standard", unit="note") as pbar:
             for i, row in df.iterrows():
                 # Check if the gold standard cell is not empty
                 gold_data = row.get(gold_column)
@@ -367,13 +415,25 @@ def load_real_data(config, num_samples):
     print("Pre-extracting entities...")
     prepared_test_data = []
     
-    with tqdm(total=len(df), desc="Processing annotations", unit="note") as pbar:
+    # In combined mode the LLM extractor resolves relative dates in its own request, so only
+    # the document timestamp is kept with each note
+    combined_relative_dates = relative_date_extraction_enabled and getattr(config, 'LLM_COMBINED_RELATIVE_DATES', False)
+    if combined_relative_dates:
+        print("Relative dates will be extracted together with relationships by the LLM extractor")
+    # Otherwise relative dates come from the persisted relative date stage
+    stored_relative_dates = {}
+    if relative_date_extraction_enabled and not combined_relative_dates:
+        stored_relative_dates = load_stored_relative_dates(config, df, profiler)
+    
+    with profiler.stage(STAGE_ANNOTATION_PARSING, notes=len(df)), \
+         tqdm(total=len(df), desc="Processing annotations", unit="note") as pbar:
         for i, row in df.iterrows():
             # Get the text from the specified column
             text = str(row.get(text_column, ''))
             
             # Initialize entities as empty lists in case we can't get valid annotations
             entities = ([], [])
+            document_timestamp = None
             
             # Check if we have pre-annotated entities in the CSV and if this is a non-synthetic data source
             use_annotations = diagnoses_column and dates_column and diagnoses_column in df.columns and dates_column in df.columns
@@ -413,69 +473,12 @@ def load_real_data(config, num_samples):
                                 print(f"Row {i} diagnoses: {diagnoses_list[:2]}...")
                                 print(f"Row {i} dates: {dates_list[:2]}...")
                         
-                        # Try to extract relative dates using LLM if enabled and we have a timestamp
-                        if relative_date_extraction_enabled:
-                            # Get the document timestamp
-                            timestamp_str = row.get(timestamp_column)
-                            
-                            if pd.notna(timestamp_str) and timestamp_str:
-                                try:
-                                    # Parse the timestamp string into a datetime object
-                                    # Try different formats
-                                    document_timestamp = None
-                                    timestamp_formats = [
-                                        '%Y-%m-%d',              # 2023-10-26
-                                        '%Y-%m-%d %H:%M:%S',     # 2023-10-26 15:30:45
-                                        '%m/%d/%Y',              # 10/26/2023
-                                        '%m/%d/%Y %H:%M:%S',     # 10/26/2023 15:30:45
-                                        '%d-%b-%Y',              # 26-Oct-2023
-                                        '%d %b %Y',              # 26 Oct 2023
-                                        '%d/%m/%Y',              # 14/05/2025
-                                    ]
-                                    
-                                    for format_str in timestamp_formats:
-                                        try:
-                                            document_timestamp = datetime.strptime(timestamp_str, format_str)
-                                            break
-                                        except ValueError:
-                                            continue
-                                    
-                                    if document_timestamp:
-                                        # Only print for a few rows to reduce output
-                                        if i % 20 == 0 or i < 3:
-                                            print(f"Extracting relative dates for row {i} using timestamp: {document_timestamp.strftime('%Y-%m-%d')}")
-                                        
-                                        # Extract relative dates using LLM
-                                        relative_dates = extract_relative_dates_llm(text, document_timestamp, config)
-                                        
-                                        if relative_dates:
-                                            # Append relative dates to existing dates list
-                                            diagnoses_list, dates_list = entities
-                                            combined_dates_list = dates_list + relative_dates
-                                            
-                                            # Update entities with combined dates
-                                            entities = (diagnoses_list, combined_dates_list)
-                                            
-                                            # Convert relative dates to JSON for storage in CSV
-                                            relative_dates_json = []
-                                            for date_tuple in relative_dates:
-                                                parsed_date, original_phrase, start_pos = date_tuple
-                                                relative_dates_json.append({
-                                                    "parsed": parsed_date,
-                                                    "original": original_phrase,
-                                                    "start": start_pos
-                                                })
-                                            
-                                            # Store in the dataframe
-                                            df.at[i, 'llm_extracted_dates'] = json.dumps(relative_dates_json)
-                                            
-                                            if i % 20 == 0 or i < 3:  # Reduce output, just show some samples
-                                                print(f"Row {i} extracted {len(relative_dates)} relative dates")
-                                    else:
-                                        print(f"Warning: Could not parse timestamp '{timestamp_str}' for row {i}")
-                                
-                                except Exception as e:
-                                    print(f"Error extracting relative dates for row {i}: {e}")
+                        # Keep the document timestamp for combined LLM requests, or add the stored relative dates
+                        if combined_relative_dates:
+                            document_timestamp = parse_document_timestamp(row.get(timestamp_column))
+                        elif stored_relative_dates.get(i):
+                            diagnoses_list, dates_list = entities
+                            entities = (diagnoses_list, dates_list + stored_relative_dates[i])
                             
                     except Exception as e:
                         print(f"Warning: Could not parse annotations for row {i}: {e}")
@@ -497,24 +500,192 @@ def load_real_data(config, num_samples):
                 'note': text,
                 'entities': entities
             })
+            if combined_relative_dates and document_timestamp:
+                prepared_test_data[-1]['document_timestamp'] = document_timestamp
             
             pbar.update(1)
     
-    # Save the updated dataframe with the new column back to CSV
-    if relative_date_extraction_enabled:
-        print(f"Saving CSV with LLM extracted dates to {dataset_path}")
-        df.to_csv(dataset_path, index=False)
-    
     return prepared_test_data, gold_standard
 
+def relative_date_rows(config, df):
+    """
+    Rows of a real-data DataFrame that relative dates are extracted for.
+    
+    These are rows with a parseable document timestamp and, if annotation columns are
+    configured, with both diagnosis and date annotations.
+    
+    Args:
+        config: Configuration object with the REAL_DATA_* column names.
+        df (DataFrame): The loaded CSV.
+        
+    Returns:
+        list: (row index, text, document timestamp) tuples.
+    """
+    text_column = config.REAL_DATA_TEXT_COLUMN
+    timestamp_column = getattr(config, 'REAL_DATA_TIMESTAMP_COLUMN', None)
+    diagnoses_column = getattr(config, 'REAL_DATA_DIAGNOSES_COLUMN', None)
+    dates_column = getattr(config, 'REAL_DATA_DATES_COLUMN', None)
+    if not timestamp_column or timestamp_column not in df.columns:
+        return []
+    use_annotations = diagnoses_column and dates_column and diagnoses_column in df.columns and dates_column in df.columns
+    
+    rows = []
+    unparsed = 0
+    for i, row in df.iterrows():
+        if use_annotations and (pd.isna(row.get(diagnoses_column)) or pd.isna(row.get(dates_column))):
+            continue
+        timestamp_value = row.get(timestamp_column)
+        document_timestamp = parse_document_timestamp(timestamp_value)
+        if document_timestamp is None:
+            if pd.notna(timestamp_value) and str(timestamp_value).strip():
+                unparsed += 1
+            continue
+        rows.append((i, str(row.get(text_column, '')), document_timestamp))
+    if unparsed:
+        print(f"Warning: Could not parse the document timestamp of {unparsed} rows")
+    return rows
+
+def run_relative_date_stage(config, df=None, profiler=None, store=None):
+    """
+    Extract relative dates for the notes that have no stored result yet.
+    
+    Results are stored in the RELATIVE_DATE_STORE_PATH store (see utils/relative_date_store.py),
+    keyed by note text hash, document timestamp and model, so each note is sent to the LLM
+    once per model. Failed requests are not stored and are retried on the next run.
+    
+    OpenAI requests are sent concurrently (RELATIVE_DATE_CONCURRENCY in flight) or as a batch
+    job (RELATIVE_DATE_BATCH_MODE); Llama notes are generated in batches of
+    RELATIVE_DATE_LLAMA_BATCH_SIZE. A setting of 1 sends one note at a time.
+    
+    Args:
+        config: Configuration object.
+        df (DataFrame, optional): The loaded CSV (read from the dataset path if None).
+        profiler (StageProfiler, optional): Profiler recording per-stage timings.
+        store (RelativeDateStore, optional): Store to use instead of RELATIVE_DATE_STORE_PATH.
+        
+    Returns:
+        dict: Counts of 'notes', 'stored' (already in the store), 'extracted' and 'failed' notes.
+    """
+    profiler = profiler or NULL_PROFILER
+    if df is None:
+        dataset_path = get_data_path(config)
+        if not os.path.exists(dataset_path):
+            print(f"Error: Real dataset not found at {dataset_path}")
+            return None
+        df = pd.read_csv(dataset_path)
+    
+    rows = relative_date_rows(config, df)
+    if store is None:
+        store = RelativeDateStore(getattr(config, 'RELATIVE_DATE_STORE_PATH', 'data/relative_dates.parquet'))
+    model = relative_date_model_id(config)
+    missing = [(i, text, timestamp) for i, text, timestamp in rows if store.get(text, timestamp, model) is None]
+    stats = {'notes': len(rows), 'stored': len(rows) - len(missing), 'extracted': 0, 'failed': 0}
+    print(f"Relative date stage ({model}): {len(rows)} notes, {stats['stored']} already stored, "
+          f"{len(missing)} to extract")
+    if not missing:
+        return stats
+    
+    llm_model = getattr(config, 'RELATIVE_DATE_LLM_MODEL', 'openai').lower()
+    batch_mode = getattr(config, 'RELATIVE_DATE_BATCH_MODE', False) and llm_model == 'openai'
+    # Don't record a missing API key or model as "no relative dates" for every note
+    try:
+        if llm_model == 'openai' and not (batch_mode and getattr(config, 'OPENAI_BATCH_BACKEND', 'openai') == 'local'):
+            get_openai_client(config)
+        elif llm_model == 'llama':
+            get_llama_pipeline(getattr(config, 'LLAMA_MODEL_PATH', './Llama-3.2-3B-Instruct'))
+    except Exception as e:
+        print(f"Error: Relative date model unavailable, skipping the relative date stage: {e}")
+        stats['failed'] = len(missing)
+        return stats
+    
+    max_context = getattr(config, 'RELATIVE_DATE_CONTEXT_WINDOW', 1000)
+    items = [(text[:max_context], timestamp) for _, text, timestamp in missing]
+    concurrency = getattr(config, 'RELATIVE_DATE_CONCURRENCY', 8)
+    llama_batch_size = getattr(config, 'RELATIVE_DATE_LLAMA_BATCH_SIZE', 8)
+    with profiler.stage(STAGE_RELATIVE_DATE_EXTRACTION, notes=len(missing)):
+        if batch_mode:
+            results = extract_relative_dates_openai_batch(items, config)
+        elif llm_model == 'openai' and concurrency > 1:
+            results = extract_relative_dates_openai_concurrent(items, config, concurrency)
+        elif llm_model == 'llama' and llama_batch_size > 1:
+            results = extract_relative_dates_llama_batch(items, config, llama_batch_size)
+        else:
+            results = []
+            for i, text, timestamp in tqdm(missing, desc="Extracting relative dates", unit="note"):
+                try:
+                    results.append(extract_relative_dates_llm(text, timestamp, config, raise_errors=True))
+                except Exception as e:
+                    print(f"Error extracting relative dates for row {i}: {e}")
+                    results.append(None)
+    
+    records = [(text, timestamp, dates) for (_, text, timestamp), dates in zip(missing, results) if dates is not None]
+    store.put_many(records, model)
+    stats['extracted'] = len(records)
+    stats['failed'] = len(missing) - len(records)
+    print(f"Stored relative dates for {len(records)} notes in {store.path}"
+          + (f" ({stats['failed']} failed, retried on the next run)" if stats['failed'] else ""))
+    return stats
+
+def load_stored_relative_dates(config, df, profiler=None):
+    """
+    Look up the stored relative dates of a real-data DataFrame.
+    
+    With RELATIVE_DATE_AUTO_STAGE, the relative date stage is run first for notes without
+    a stored result; otherwise such notes get no relative dates.
+    
+    Returns:
+        dict: Row index -> list of (parsed_date_str, raw_phrase_str, start_position) tuples.
+    """
+    store = RelativeDateStore(getattr(config, 'RELATIVE_DATE_STORE_PATH', 'data/relative_dates.parquet'))
+    if getattr(config, 'RELATIVE_DATE_AUTO_STAGE', True):
+        run_relative_date_stage(config, df, profiler, store)
+    model = relative_date_model_id(config)
+    relative_dates = {}
+    missing = 0
+    for i, text, timestamp in relative_date_rows(config, df):
+        dates = store.get(text, timestamp, model)
+        if dates is None:
+            missing += 1
+        elif dates:
+            relative_dates[i] = dates
+    print(f"Loaded stored relative dates for {len(relative_dates)} notes"
+          + (f"; {missing} notes have none stored (run `python main.py relative-dates`)" if missing else ""))
+    return relative_dates
+
+def store_combined_relative_dates(config, prepared_test_data):
+    """
+    Store the relative dates found by combined LLM requests (LLM_COMBINED_RELATIVE_DATES).
+    
+    They are kept under their own model id ('llm-combined:<OPENAI_MODEL>'), separate from
+    the results of the relative date stage. Notes whose combined request failed are not
+    stored.
+    
+    Args:
+        config: Configuration object.
+        prepared_test_data (list): Note entries after run_extraction().
+    """
+    records = [
+        (entry['note'], entry['document_timestamp'], entry['relative_dates'])
+        for entry in prepared_test_data
+        if entry.get('document_timestamp') and entry.get('relative_dates') is not None
+    ]
+    if not records:
+        return
+    store = RelativeDateStore(getattr(config, 'RELATIVE_DATE_STORE_PATH', 'data/relative_dates.parquet'))
+    store.put_many(records, f"llm-combined:{getattr(config, 'OPENAI_MODEL', 'gpt-4o')}")
+    print(f"Stored relative dates from combined requests for {len(records)} notes in {store.path}")
+
 # Helper function to run extraction process for a given extractor and data
-def run_extraction(extractor, prepared_test_data):
+def run_extraction(extractor, prepared_test_data, batch_size=1, max_wait_ms=5.0):
     """
     Runs the extraction process for a given extractor on prepared data.
 
     Args:
         extractor: An initialized and loaded extractor object (subclass of BaseExtractor).
         prepared_test_data (list): List of dicts {'text': ..., 'entities': ...}.
+        batch_size (int): If > 1, notes are fed through a MicroBatcher so extractors with a
+            batched extract_batch() (e.g. the custom model) process up to this many notes per call.
+        max_wait_ms (float): MicroBatcher wait for a partial batch.
 
     Returns:
         list: List of predicted relationships [{'note_id': ..., 'diagnosis': ..., 'date': ..., 'confidence': ...}].
@@ -522,47 +693,103 @@ def run_extraction(extractor, prepared_test_data):
     print(f"Generating predictions using {extractor.name}...")
     all_predictions = []
     skipped_rels = 0
-    for i, note_entry in enumerate(tqdm(prepared_test_data, desc=f"Processing with {extractor.name}", unit="note")):
-        try:
-            # Extract relationships using the provided extractor
-            relationships = extractor.extract(note_entry['note'], entities=note_entry['entities'])
-            for rel in relationships:
-                # Ensure required keys exist and handle potential missing 'date' or 'diagnosis'
-                raw_date = rel.get('date')
-                raw_diagnosis = rel.get('diagnosis')
-                if raw_date is None or raw_diagnosis is None:
-                    print(f"Warning: Skipping relationship in note {i} due to missing 'date' or 'diagnosis'. Rel: {rel}")
-                    skipped_rels += 1
-                    continue
 
-                # Parse date and normalize diagnosis
-                parsed_date = parse_date_string(str(raw_date)) # Ensure string input
-                normalized_diagnosis = str(raw_diagnosis).strip().lower() # Ensure string, strip, lower
-
-                if parsed_date and normalized_diagnosis:
-                    all_predictions.append({
-                        'note_id': i,
-                        'diagnosis': normalized_diagnosis,
-                        'date': parsed_date,
-                        'confidence': rel.get('confidence', 1.0) # Default confidence to 1.0 if missing
-                    })
-                else:
-                    # Log if parsing failed but keys were present
-                    # print(f"Debug: Skipping relationship in note {i} due to parsing failure. Raw Date: '{raw_date}', Raw Diag: '{raw_diagnosis}'")
-                    skipped_rels += 1
-        except Exception as e:
-            # Log errors during extraction for a specific note
-            print(f"Extraction error on note {i} for {extractor.name}: {e}")
-            # Optionally, re-raise if you want errors to halt execution: raise e
-            continue # Continue with the next note
+    def collect(i, relationships):
+        """Normalize one note's relationships and append them to all_predictions."""
+        skipped = 0
+        for rel in relationships:
+            # Ensure required keys exist and handle potential missing 'date' or 'diagnosis'
+            raw_date = rel.get('date')
+            raw_diagnosis = rel.get('diagnosis')
+            if raw_date is None or raw_diagnosis is None:
+                print(f"Warning: Skipping relationship in note {i} due to missing 'date' or 'diagnosis'. Rel: {rel}")
+                skipped += 1
+                continue
+
+            # Parse date and normalize diagnosis
+            parsed_date = parse_date_string(str(raw_date)) # Ensure string input
+            normalized_diagnosis = str(raw_diagnosis).strip().lower() # Ensure string, strip, lower
+
+            if parsed_date and normalized_diagnosis:
+                all_predictions.append({
+                    'note_id': i,
+                    'diagnosis': normalized_diagnosis,
+                    'date': parsed_date,
+                    'confidence': rel.get('confidence', 1.0) # Default confidence to 1.0 if missing
+                })
+            else:
+                # Log if parsing failed but keys were present
+                # print(f"Debug: Skipping relationship in note {i} due to parsing failure. Raw Date: '{raw_date}', Raw Diag: '{raw_diagnosis}'")
+                skipped += 1
+        return skipped
+
+    if getattr(extractor, 'combined_relative_dates', False) and \
+            any(note_entry.get('document_timestamp') for note_entry in prepared_test_data):
+        # One request per note returns the relative dates (deferred by load_real_data) and the
+        # relationships; the relative dates are added to the note's entities
+        for i, note_entry in enumerate(tqdm(prepared_test_data, desc=f"Processing with {extractor.name}", unit="note")):
+            try:
+                if not note_entry.get('document_timestamp'):
+                    skipped_rels += collect(i, extractor.extract(note_entry['note'], entities=note_entry['entities']))
+                    continue
+                relationships, relative_dates = extractor.extract_with_relative_dates(
+                    note_entry['note'], note_entry['entities'], note_entry['document_timestamp']
+                )
+                # None if the request failed (not stored by store_combined_relative_dates)
+                note_entry['relative_dates'] = relative_dates
+                if relative_dates:
+                    diagnoses_list, dates_list = note_entry['entities']
+                    note_entry['entities'] = (diagnoses_list, dates_list + relative_dates)
+                skipped_rels += collect(i, relationships)
+            except Exception as e:
+                print(f"Extraction error on note {i} for {extractor.name}: {e}")
+                continue
+    elif getattr(extractor, 'batch_mode', False) and hasattr(extractor, 'extract_batch_job'):
+        # Offline batch job: all notes go into one submission and come back together
+        results = extractor.extract_batch_job(
+            [note_entry['note'] for note_entry in prepared_test_data],
+            [note_entry['entities'] for note_entry in prepared_test_data]
+        )
+        for i, relationships in enumerate(results):
+            skipped_rels += collect(i, relationships)
+    elif batch_size and batch_size > 1:
+        # Submit every note to the batcher, then resolve the futures in note order
+        with create_extractor_batcher(extractor, max_batch_size=batch_size, max_wait_ms=max_wait_ms) as batcher:
+            futures = [batcher.submit((note_entry['note'], note_entry['entities'])) for note_entry in prepared_test_data]
+            for i, future in enumerate(tqdm(futures, desc=f"Processing with {extractor.name}", unit="note")):
+                try:
+                    skipped_rels += collect(i, future.result())
+                except Exception as e:
+                    print(f"Extraction error on note {i} for {extractor.name}: {e}")
+                    continue
+        print(f"Micro-batching for {extractor.name}: {format_batcher_stats(batcher.get_stats())}")
+    else:
+        for i, note_entry in enumerate(tqdm(prepared_test_data, desc=f"Processing with {extractor.name}", unit="note")):
+            try:
+                # Extract relationships using the provided extractor
+                relationships = extractor.extract(note_entry['note'], entities=note_entry['entities'])
+                skipped_rels += collect(i, relationships)
+            except Exception as e:
+                # Log errors during extraction for a specific note
+                print(f"Extraction error on note {i} for {extractor.name}: {e}")
+                # Optionally, re-raise if you want errors to halt execution: raise e
+                continue # Continue with the next note
 
     print(f"Generated {len(all_predictions)} predictions. Skipped {skipped_rels} potentially invalid relationships.")
+    # LLM extractors report their API request counts and compact prompt token savings
+    prompt_stats = extractor.get_prompt_stats() if hasattr(extractor, 'get_prompt_stats') else None
+    if prompt_stats:
+        print(f"Prompt statistics for {extractor.name}: {format_prompt_savings(prompt_stats)}")
     return all_predictions
 
-def calculate_and_report_metrics(all_predictions, gold_standard, extractor_name, output_dir, total_notes_processed):
+def calculate_and_report_metrics(all_predictions, gold_standard, extractor_name, output_dir, total_notes_processed,
+                                 bootstrap_resamples=0, confidence_level=0.95, bootstrap_workers=1, bootstrap_seed=42,
+                                 pr_curve=False):
     """
     Compares predictions with gold standard, calculates metrics, prints results,
-    and saves a confusion matrix plot.
+    and queues a confusion matrix plot (rendered later by utils.reporting_utils). Optionally adds note-level bootstrap
+    confidence intervals for precision, recall and F1, and a precision-recall
+    curve over prediction confidence thresholds.
 
     Args:
         all_predictions (list): List of predicted relationships (normalized by the caller).
@@ -572,9 +799,19 @@ def calculate_and_report_metrics(all_predictions, gold_standard, extractor_name,
         extractor_name (str): Name of the extractor being evaluated.
         output_dir (str): Directory to save evaluation outputs.
         total_notes_processed (int): The total number of notes processed by the extractor.
+        bootstrap_resamples (int): Number of note-level bootstrap resamples (0 disables CIs).
+        confidence_level (float): Confidence level of the bootstrap intervals.
+        bootstrap_workers (int): Worker processes used for resampling.
+        bootstrap_seed (int): Seed for reproducible resampling.
+        pr_curve (bool): If True, sweep the prediction confidence threshold, report the
+                         average precision and best-F1 threshold, and queue a PR curve plot.
 
     Returns:
-        dict: A dictionary containing calculated metrics.
+        dict: A dictionary containing calculated metrics, including 'per_note' and
+              'per_diagnosis' DataFrames with TP/FP/FN and P/R/F1 breakdowns, and
+              '<metric>_ci_low' / '<metric>_ci_high' entries when bootstrapping is enabled.
+              With pr_curve, also 'average_precision', 'best_threshold', 'best_threshold_f1'
+              and a 'pr_curve' DataFrame.
     """
     if not gold_standard:
         print(f"  No gold standard data provided for {extractor_name} (processed {total_notes_processed} notes). Skipping metric calculation.")
@@ -584,9 +821,9 @@ def calculate_and_report_metrics(all_predictions, gold_standard, extractor_name,
             'true_positives': 0, 'false_positives': 0, 'false_negatives': 0
         }
 
-    # Identify the notes that have gold standard labels
-    gold_note_ids = set(g['note_id'] for g in gold_standard)
-    num_labeled_notes = len(gold_note_ids)
+    # Compute TP/FP/FN and the per-note / per-diagnosis breakdowns in one vectorized pass
+    metrics = compute_relation_metrics(all_predictions, gold_standard)
+    num_labeled_notes = metrics['num_labeled_notes']
 
     if num_labeled_notes == 0:
         print(f"  No notes with gold standard labels found for {extractor_name} (processed {total_notes_processed} notes). Skipping metric calculation.")
@@ -597,66 +834,88 @@ def calculate_and_report_metrics(all_predictions, gold_standard, extractor_name,
     
     print(f"  Evaluating metrics for {extractor_name} based on {num_labeled_notes} notes with gold standard labels (out of {total_notes_processed} notes processed).")
 
-    # Filter predictions to include only those from labeled notes
-    filtered_predictions = [p for p in all_predictions if p['note_id'] in gold_note_ids]
-    
-    if not filtered_predictions:
+    if metrics['num_predictions'] == 0:
         print(f"  No predictions found for the {num_labeled_notes} labeled notes by {extractor_name}.")
-        # If no predictions for labeled notes, TP and FP are 0. FN is total gold.
-        true_positives = 0
-        false_positives = 0
-        false_negatives = len(gold_standard) # All gold items were missed
-        pred_set = set()  # Empty set for reporting
-        gold_set = set((g['note_id'], g['diagnosis'], g['date']) for g in gold_standard)
-    else:
-        # Convert filtered predictions and gold standard to sets for comparison
-        pred_set = set((p['note_id'], p['diagnosis'], p['date']) for p in filtered_predictions)
-        gold_set = set((g['note_id'], g['diagnosis'], g['date']) for g in gold_standard)
-
-        # Calculate TP, FP, FN based on filtered predictions
-        true_positives = len(pred_set & gold_set)
-        false_positives = len(pred_set - gold_set)
-        false_negatives = len(gold_set - pred_set)
-    
+
+    true_positives = metrics['true_positives']
+    false_positives = metrics['false_positives']
+    false_negatives = metrics['false_negatives']
     true_negatives = 0 # TN is ill-defined/hard to calculate accurately here
+    precision = metrics['precision']
+    recall = metrics['recall']
+    f1 = metrics['f1']
+
+    # Note-level bootstrap confidence intervals from the per-note count matrix
+    intervals = None
+    if bootstrap_resamples and bootstrap_resamples > 0:
+        intervals = bootstrap_confidence_intervals(
+            metrics['per_note'],
+            n_resamples=bootstrap_resamples,
+            confidence=confidence_level,
+            seed=bootstrap_seed,
+            num_workers=bootstrap_workers
+        )
 
-    # Calculate metrics
-    precision = true_positives / (true_positives + false_positives) if (true_positives + false_positives) > 0 else 0
-    recall = true_positives / (true_positives + false_negatives) if (true_positives + false_negatives) > 0 else 0
-    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
+    def format_interval(name):
+        if intervals is None:
+            return ""
+        low, high = intervals[name]
+        return f"  ({confidence_level:.0%} CI {low:.3f}-{high:.3f})"
 
     # --- Reporting ---
     print(f"  Evaluation Results for {extractor_name} (on labeled subset):")
-    print(f"    Total unique predictions for labeled notes: {len(pred_set)}")    # TP + FP for labeled notes
-    print(f"    Total unique gold relationships:           {len(gold_set)}")   # TP + FN for labeled notes
+    print(f"    Total unique predictions for labeled notes: {metrics['num_predictions']}")    # TP + FP for labeled notes
+    print(f"    Total unique gold relationships:           {metrics['num_gold']}")   # TP + FN for labeled notes
     print(f"    True Positives:  {true_positives}")
     print(f"    False Positives: {false_positives}")
     print(f"    False Negatives: {false_negatives}")
-    print(f"    Precision: {precision:.3f}")
-    print(f"    Recall:    {recall:.3f}")
-    print(f"    F1 Score:  {f1:.3f}")
-
-    # --- Plotting ---
-    # Plotting confusion matrix based on these filtered values
-    conf_matrix_values = [true_negatives, false_positives, false_negatives, true_positives]
-    plt.figure(figsize=(6, 5))
-    tn, fp, fn, tp = conf_matrix_values
-    conf_matrix_display_array = np.array([[tn, fp], [fn, tp]])
-    disp = ConfusionMatrixDisplay(confusion_matrix=conf_matrix_display_array, display_labels=['No Relation (in labeled)', 'Has Relation (in labeled)'])
-    disp.plot(cmap=plt.cm.Blues, values_format='d')
-    plt.title(f"Confusion Matrix - {extractor_name} (Labeled Subset)")
-    plt.tight_layout()
+    print(f"    Precision: {precision:.3f}{format_interval('precision')}")
+    print(f"    Recall:    {recall:.3f}{format_interval('recall')}")
+    print(f"    F1 Score:  {f1:.3f}{format_interval('f1')}")
+    if intervals is not None:
+        print(f"    (note-level bootstrap, {intervals['n_resamples']} resamples over {num_labeled_notes} notes)")
 
+    # --- Plot specs ---
+    # Figures are only queued here; they are rendered later by utils.reporting_utils
     os.makedirs(output_dir, exist_ok=True)
     safe_extractor_name = re.sub(r'[^\w.-]+', '_', extractor_name).lower()
     plot_filename = f"{safe_extractor_name}_confusion_matrix_labeled_subset.png"
     plot_save_path = os.path.join(output_dir, plot_filename)
     try:
-        plt.savefig(plot_save_path)
-        print(f"    Confusion matrix (labeled subset) saved to {plot_save_path}")
+        queue_plot('confusion_matrix', {
+            'matrix': [[true_negatives, false_positives], [false_negatives, true_positives]],
+            'labels': ['No Relation (in labeled)', 'Has Relation (in labeled)'],
+            'title': f"Confusion Matrix - {extractor_name} (Labeled Subset)"
+        }, plot_save_path)
+        print(f"    Confusion matrix (labeled subset) queued for {plot_save_path}")
     except Exception as e:
-        print(f"    Error saving confusion matrix: {e}")
-    plt.close()
+        print(f"    Error queuing confusion matrix: {e}")
+
+    # --- Threshold sweep ---
+    curve_result = None
+    if pr_curve:
+        curve_result = compute_precision_recall_curve(all_predictions, gold_standard)
+        curve = curve_result['curve']
+        print(f"    Average Precision: {curve_result['average_precision']:.3f} ({len(curve)} confidence thresholds)")
+        if curve_result['best_threshold'] is not None:
+            print(f"    Best F1 {curve_result['best_f1']:.3f} at confidence >= {curve_result['best_threshold']:.3f} "
+                  f"(P {curve_result['best_precision']:.3f}, R {curve_result['best_recall']:.3f})")
+        if len(curve):
+            pr_plot_path = os.path.join(output_dir, f"{safe_extractor_name}_pr_curve.png")
+            try:
+                queue_plot('pr_curve', {
+                    'recall': curve['recall'].tolist(),
+                    'precision': curve['precision'].tolist(),
+                    'average_precision': curve_result['average_precision'],
+                    'best_threshold': curve_result['best_threshold'],
+                    'best_precision': curve_result['best_precision'],
+                    'best_recall': curve_result['best_recall'],
+                    'best_f1': curve_result['best_f1'],
+                    'title': f"Precision-Recall Curve - {extractor_name} (Labeled Subset)"
+                }, pr_plot_path)
+                print(f"    Precision-recall curve queued for {pr_plot_path}")
+            except Exception as e:
+                print(f"    Error queuing precision-recall curve: {e}")
 
     # Return calculated metrics
     metrics_dict = {
@@ -666,7 +925,17 @@ def calculate_and_report_metrics(all_predictions, gold_standard, extractor_name,
         'true_positives': true_positives,
         'false_positives': false_positives,
         'false_negatives': false_negatives,
+        'per_note': metrics['per_note'],
+        'per_diagnosis': metrics['per_diagnosis']
     }
+    if intervals is not None:
+        for name in ['precision', 'recall', 'f1']:
+            metrics_dict[f'{name}_ci_low'], metrics_dict[f'{name}_ci_high'] = intervals[name]
+    if curve_result is not None:
+        metrics_dict['average_precision'] = curve_result['average_precision']
+        metrics_dict['best_threshold'] = curve_result['best_threshold']
+        metrics_dict['best_threshold_f1'] = curve_result['best_f1']
+        metrics_dict['pr_curve'] = curve_result['curve']
     return metrics_dict
 
 def transform_python_to_json(python_string):
@@ -704,7 +973,7 @@ def transform_python_to_json(python_string):
         print(f"Warning: Failed to parse Python-style string: {e}")
         return "[]"
 
-def extract_relative_dates_llm(text, document_timestamp, config):
+def extract_relative_dates_llm(text, document_timestamp, config, raise_errors=False):
     """
     Extract relative date references from text using an LLM.
     Returns a list of tuples: (parsed_date_str, raw_phrase_str, start_position)
@@ -714,6 +983,8 @@ def extract_relative_dates_llm(text, document_timestamp, config):
         text (str): The clinical note text
         document_timestamp (datetime): The timestamp of the document for reference
         config: Configuration object with LLM settings
+        raise_errors (bool): Raise model errors and malformed responses instead of returning []
+            (so callers can tell a failed call from a note without relative dates)
         
     Returns:
         list: A list of date tuples (parsed_date_str, raw_phrase_str, start_position)
@@ -735,14 +1006,134 @@ def extract_relative_dates_llm(text, document_timestamp, config):
     llm_model = getattr(config, 'RELATIVE_DATE_LLM_MODEL', 'openai')
     
     if llm_model.lower() == 'openai':
-        return extract_relative_dates_openai(text, document_timestamp, config)
+        return extract_relative_dates_openai(text, document_timestamp, config, raise_errors)
     elif llm_model.lower() == 'llama':
-        return extract_relative_dates_llama(text, document_timestamp, config)
+        return extract_relative_dates_llama(text, document_timestamp, config, raise_errors)
     else:
+        if raise_errors:
+            raise ValueError(f"Unknown RELATIVE_DATE_LLM_MODEL: {llm_model}")
         print(f"Warning: Unknown RELATIVE_DATE_LLM_MODEL: {llm_model}")
         return []
 
-def extract_relative_dates_openai(text, document_timestamp, config):
+def build_relative_date_openai_request(text, document_timestamp, model_name):
+    """
+    Chat completion request body for OpenAI relative date extraction.
+    
+    Args:
+        text (str): The clinical note text
+        document_timestamp (datetime): The timestamp of the document for reference
+        model_name (str): OpenAI model name
+        
+    Returns:
+        dict: Keyword arguments for client.chat.completions.create() (or a batch request body)
+    """
+    # Format the timestamp for the prompt
+    timestamp_str = document_timestamp.strftime('%Y-%m-%d %H:%M:%S')
+
+    # Construct the prompt
+    prompt = f"""
+    Given the document creation date: {timestamp_str}
+
+    Analyze the following clinical text and identify phrases that describe dates relative to the document creation date:
+    "{text}"
+
+    I need to extract all relative date references like:
+    - "last year" 
+    - "six months ago" 
+    - "yesterday" 
+    - "next week" 
+    - "in 3 days"
+    - "two years ago"
+    - "last month"
+
+    For each identified phrase:
+    1. Extract the exact phrase text (e.g., "last year", "yesterday")
+    2. Note the start character index of the phrase in the original text
+    3. Calculate the absolute date in YYYY-MM-DD format
+
+    Example 1:
+    Text: "Patient was diagnosed with condition X last year."
+    - Phrase: "last year"
+    - Start index: (position in text)
+    - Calculated date: (one year before document date)
+
+    Example 2:
+    Text: "Follow-up scheduled in two weeks."
+    - Phrase: "in two weeks"
+    - Start index: (position in text)
+    - Calculated date: (two weeks after document date)
+
+    Return a JSON array where each object has these keys:
+    "phrase": the exact relative date phrase,
+    "start_index": integer position in text,
+    "calculated_date": YYYY-MM-DD format
+
+    If no relative dates are found, return an empty JSON array [].
+    """
+
+    return {
+        'model': model_name,
+        'messages': [
+            {"role": "system", "content": "You are a medical AI assistant specialized in extracting temporal expressions from clinical notes."},
+            {"role": "user", "content": prompt}
+        ],
+        'temperature': 0,
+        'max_tokens': 1000
+    }
+
+def parse_relative_dates_openai(response_text, debug_mode=False):
+    """
+    Parse the JSON array of an OpenAI relative date response.
+    
+    Args:
+        response_text (str): The model response
+        debug_mode (bool): Print parsing details
+        
+    Returns:
+        list or None: A list of date tuples (parsed_date_str, raw_phrase_str, start_position),
+            or None if the response is malformed
+    """
+    response_text = response_text.strip()
+    # Find the JSON array in the response
+    start_idx = response_text.find('[')
+    end_idx = response_text.rfind(']') + 1
+
+    if start_idx >= 0 and end_idx > start_idx:
+        json_str = response_text[start_idx:end_idx]
+        if debug_mode:
+            print(f"Found JSON array: {json_str[:100]}...")
+
+        try:
+            dates_data = json.loads(json_str)
+            # Only print the count of dates found to reduce verbosity
+            if dates_data:
+                if debug_mode:
+                    print(f"Successfully parsed JSON with {len(dates_data)} results")
+
+            # Convert to the expected tuple format
+            relative_dates = []
+            for item in dates_data:
+                phrase = item.get('phrase', '')
+                start_index = item.get('start_index', 0)
+                calculated_date = item.get('calculated_date', '')
+
+                # Only add valid entries
+                if phrase and calculated_date:
+                    relative_dates.append((calculated_date, phrase, start_index))
+
+            return relative_dates
+        except (ValueError, AttributeError, TypeError) as e:
+            # Invalid JSON, or items that are not objects
+            print(f"Error parsing OpenAI JSON response: {e}")
+            return None
+    else:
+        if debug_mode:
+            print("No JSON array found in OpenAI response")
+            if len(response_text) < 200:
+                print(f"Full response was: {response_text}")
+        return None
+
+def extract_relative_dates_openai(text, document_timestamp, config, raise_errors=False):
     """
     Extract relative dates using OpenAI API.
     
@@ -750,39 +1141,24 @@ def extract_relative_dates_openai(text, document_timestamp, config):
         text (str): The clinical note text
         document_timestamp (datetime): The timestamp of the document for reference
         config: Configuration object with OpenAI settings
+        raise_errors (bool): Raise API errors and malformed responses instead of returning []
         
     Returns:
         list: A list of date tuples (parsed_date_str, raw_phrase_str, start_position)
     """
     try:
-        # Load environment variables for API key
-        load_dotenv()
-        api_key = os.getenv('OPENAI_API_KEY')
-        
         # Reduce verbosity
         debug_mode = getattr(config, 'DEBUG_MODE', False)
         if debug_mode:
             print("Attempting to use OpenAI API for relative date extraction...")
         
-        if not api_key:
-            print("Error: OPENAI_API_KEY not found in .env file or environment variables.")
-            return []
-        
-        if api_key == "your_actual_api_key_here" or api_key == "your_api_key_here":
-            print("Error: You need to replace the placeholder in .env with your actual OpenAI API key.")
-            return []
-            
-        if debug_mode:
-            print(f"API key found (starts with: {api_key[:4]}{'*' * 20})")
-        
-        # Import OpenAI
+        # Shared client: connections are reused across notes
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=api_key)
-            if debug_mode:
-                print("OpenAI client initialized successfully")
-        except ImportError:
-            print("Error: openai package not installed. Install with 'pip install openai'.")
+            client = get_openai_client(config)
+        except (ImportError, ValueError) as e:
+            if raise_errors:
+                raise
+            print(f"Error: {e}")
             return []
         
         # Get model name from config or use default
@@ -790,67 +1166,19 @@ def extract_relative_dates_openai(text, document_timestamp, config):
         if debug_mode:
             print(f"Using OpenAI model: {model_name}")
         
-        # Format the timestamp for the prompt
-        timestamp_str = document_timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Construct the prompt
-        prompt = f"""
-        Given the document creation date: {timestamp_str}
-
-        Analyze the following clinical text and identify phrases that describe dates relative to the document creation date:
-        "{text}"
-
-        I need to extract all relative date references like:
-        - "last year" 
-        - "six months ago" 
-        - "yesterday" 
-        - "next week" 
-        - "in 3 days"
-        - "two years ago"
-        - "last month"
-
-        For each identified phrase:
-        1. Extract the exact phrase text (e.g., "last year", "yesterday")
-        2. Note the start character index of the phrase in the original text
-        3. Calculate the absolute date in YYYY-MM-DD format
-
-        Example 1:
-        Text: "Patient was diagnosed with condition X last year."
-        - Phrase: "last year"
-        - Start index: (position in text)
-        - Calculated date: (one year before document date)
-
-        Example 2:
-        Text: "Follow-up scheduled in two weeks."
-        - Phrase: "in two weeks"
-        - Start index: (position in text)
-        - Calculated date: (two weeks after document date)
-
-        Return a JSON array where each object has these keys:
-        "phrase": the exact relative date phrase,
-        "start_index": integer position in text,
-        "calculated_date": YYYY-MM-DD format
-
-        If no relative dates are found, return an empty JSON array [].
-        """
+        request = build_relative_date_openai_request(text, document_timestamp, model_name)
         
         if debug_mode:
             print("Sending request to OpenAI API...")
         
         # Call the OpenAI API
         try:
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": "You are a medical AI assistant specialized in extracting temporal expressions from clinical notes."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0,
-                max_tokens=1000
-            )
+            response = create_chat_completion(client, request, 'relative_dates', config)
             if debug_mode:
                 print("Received response from OpenAI API")
         except Exception as api_error:
+            if raise_errors:
+                raise
             print(f"OpenAI API error: {api_error}")
             return []
         
@@ -860,109 +1188,74 @@ def extract_relative_dates_openai(text, document_timestamp, config):
             print(f"Response text length: {len(response_text)} characters")
             print(f"First 100 chars of response: {response_text[:100]}...")
         
-        # Find the JSON array in the response
-        start_idx = response_text.find('[')
-        end_idx = response_text.rfind(']') + 1
-        
-        if start_idx >= 0 and end_idx > start_idx:
-            json_str = response_text[start_idx:end_idx]
-            if debug_mode:
-                print(f"Found JSON array: {json_str[:100]}...")
-            
-            try:
-                dates_data = json.loads(json_str)
-                # Only print the count of dates found to reduce verbosity
-                if dates_data:
-                    if debug_mode:
-                        print(f"Successfully parsed JSON with {len(dates_data)} results")
-                
-                # Convert to the expected tuple format
-                relative_dates = []
-                for item in dates_data:
-                    phrase = item.get('phrase', '')
-                    start_index = item.get('start_index', 0)
-                    calculated_date = item.get('calculated_date', '')
-                    
-                    # Only add valid entries
-                    if phrase and calculated_date:
-                        relative_dates.append((calculated_date, phrase, start_index))
-                
-                return relative_dates
-            except json.JSONDecodeError as e:
-                print(f"Error parsing OpenAI JSON response: {e}")
-                return []
-        else:
-            if debug_mode:
-                print("No JSON array found in OpenAI response")
-                if len(response_text) < 200:
-                    print(f"Full response was: {response_text}")
+        relative_dates = parse_relative_dates_openai(response_text, debug_mode)
+        if relative_dates is None:
+            if raise_errors:
+                raise ValueError("Malformed OpenAI relative date response")
             return []
+        return relative_dates
             
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Error in OpenAI relative date extraction: {e}")
         if getattr(config, 'DEBUG_MODE', False):
             import traceback
             traceback.print_exc()
         return []
 
-def extract_relative_dates_llama(text, document_timestamp, config):
+def extract_relative_dates_openai_batch(items, config):
     """
-    Extract relative dates using Llama model.
+    Extract relative dates for many notes with one offline OpenAI batch job.
+    
+    Uses the same prompt as extract_relative_dates_openai(), but writes all requests to
+    a Batch API JSONL file, submits it through the OPENAI_BATCH_BACKEND backend and waits
+    for the results (see utils/openai_batch_utils.py).
     
     Args:
-        text (str): The clinical note text
-        document_timestamp (datetime): The timestamp of the document for reference
-        config: Configuration object with Llama settings
+        items (list): (text, document_timestamp) tuples
+        config: Configuration object with OpenAI and batch settings
         
     Returns:
-        list: A list of date tuples (parsed_date_str, raw_phrase_str, start_position)
+        list: One list of date tuples (parsed_date_str, raw_phrase_str, start_position) per item,
+              or None for items whose request failed or whose response is malformed
     """
+    debug_mode = getattr(config, 'DEBUG_MODE', False)
+    model_name = getattr(config, 'RELATIVE_DATE_OPENAI_MODEL', 'gpt-3.5-turbo')
     try:
-        # Check if transformers package is installed
-        try:
-            from transformers import pipeline
-            import torch
-        except ImportError:
-            print("Error: transformers package not installed. Install with 'pip install transformers'.")
-            return []
-        
-        # Get model path from config
-        model_path = getattr(config, 'LLAMA_MODEL_PATH', './Llama-3.2-3B-Instruct')
+        client = None
+        if getattr(config, 'OPENAI_BATCH_BACKEND', 'openai') != 'local':
+            client = get_openai_client(config)
+        backend = create_batch_backend(config, client)
         
-        # Initialize the pipeline
-        try:
-            # Create a loading indicator since model loading can take time
-            with tqdm(total=100, desc="Loading Llama model", unit="%") as pbar:
-                print(f"Loading Llama model for relative date extraction from {model_path}...")
-                
-                # Update progress to 25% - started loading
-                pbar.update(25)
-                
-                # Load the model
-                pipe = pipeline(
-                    "text-generation",
-                    model=model_path,
-                    torch_dtype=torch.bfloat16,
-                    device_map="auto",
-                )
-                
-                # Update progress to 100% - done loading
-                pbar.update(75)
-        except Exception as e:
-            print(f"Error loading Llama model: {e}")
-            return []
-        
-        # Format the timestamp for the prompt
-        timestamp_str = document_timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Construct the messages for the model
-        system_prompt = "You are a medical AI assistant specialized in extracting temporal expressions from clinical notes."
-        
-        user_prompt = f"""
-        Given the document creation date: {timestamp_str}
+        requests = [
+            chat_request(f"note-{i}", build_relative_date_openai_request(text, timestamp, model_name))
+            for i, (text, timestamp) in enumerate(items)
+        ]
+        contents = run_batch_job(
+            requests, backend,
+            job_name=f"relative_dates_{model_name}_{len(items)}notes",
+            usage_component='relative_dates',
+            config=config,
+            work_dir=getattr(config, 'OPENAI_BATCH_DIR', 'batch_jobs'),
+            poll_seconds=getattr(config, 'OPENAI_BATCH_POLL_SECONDS', 30),
+            timeout_seconds=getattr(config, 'OPENAI_BATCH_TIMEOUT_HOURS', 24) * 3600
+        )
+    except Exception as e:
+        print(f"Error in OpenAI batch relative date extraction: {e}")
+        return [None for _ in items]
+    
+    return [
+        parse_relative_dates_openai(contents[request['custom_id']], debug_mode) if contents.get(request['custom_id']) else None
+        for request in requests
+    ]
 
-        Analyze the following clinical text and identify phrases that describe dates relative to the document creation date:
-        "{text}"
+# Relative date prompt for the Llama model: fixed instructions first, so their
+# key/value cache can be reused and only the document date and text are prefilled
+RELATIVE_DATE_SYSTEM_PROMPT = "You are a medical AI assistant specialized in extracting temporal expressions from clinical notes."
+
+RELATIVE_DATE_INSTRUCTIONS = """
+        Analyze the clinical text given below and identify phrases that describe dates relative to the document creation date given below.
 
         I need to extract all relative date references like:
         - "last year" 
@@ -996,66 +1289,203 @@ def extract_relative_dates_llama(text, document_timestamp, config):
         "calculated_date": YYYY-MM-DD format
 
         If no relative dates are found, return an empty JSON array [].
+"""
+
+async def _extract_relative_dates_openai_async(items, config, max_concurrency, progress):
+    """Send the relative date requests of all items with at most max_concurrency in flight."""
+    debug_mode = getattr(config, 'DEBUG_MODE', False)
+    model_name = getattr(config, 'RELATIVE_DATE_OPENAI_MODEL', 'gpt-3.5-turbo')
+    client = create_async_openai_client(config, max_connections=max_concurrency)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def extract_one(index, text, document_timestamp):
+        async with semaphore:
+            try:
+                request = build_relative_date_openai_request(text, document_timestamp, model_name)
+                response = await acreate_chat_completion(client, request, 'relative_dates', config)
+                return parse_relative_dates_openai(response.choices[0].message.content or '', debug_mode)
+            except Exception as e:
+                print(f"OpenAI API error for item {index}: {e}")
+                return None
+            finally:
+                progress.update(1)
+    
+    try:
+        # gather() returns the results in item order, whatever order the requests finish in
+        return await asyncio.gather(*(
+            extract_one(index, text, document_timestamp)
+            for index, (text, document_timestamp) in enumerate(items)
+        ))
+    finally:
+        await client.close()
+
+def _run_coroutine(coroutine):
+    """Run a coroutine to completion, in a worker thread if this thread already runs an event loop (e.g. Jupyter)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+def extract_relative_dates_openai_concurrent(items, config, max_concurrency=8):
+    """
+    Extract relative dates for many notes with concurrent OpenAI requests.
+    
+    Args:
+        items (list): (text, document_timestamp) tuples; texts are sent as given (truncate
+            to RELATIVE_DATE_CONTEXT_WINDOW first).
+        config: Configuration object with OpenAI settings.
+        max_concurrency (int): Maximum number of requests in flight.
+        
+    Returns:
+        list: Per item, a list of date tuples (parsed_date_str, raw_phrase_str, start_position),
+              or None if its request failed or its response is malformed.
+    """
+    if not items:
+        return []
+    with tqdm(total=len(items), desc="Extracting relative dates", unit="note") as progress:
+        return _run_coroutine(_extract_relative_dates_openai_async(items, config, max(1, max_concurrency), progress))
+
+def build_relative_date_llama_input(text, document_timestamp):
+    """Note-specific part of a Llama relative date prompt (after the shared system prompt and instructions)."""
+    timestamp_str = document_timestamp.strftime('%Y-%m-%d %H:%M:%S')
+    return f"""
+        Document creation date: {timestamp_str}
+
+        Clinical text:
+        "{text}"
         """
+
+def parse_relative_dates_llama(response_content):
+    """
+    Parse the JSON array of a Llama relative date response.
+    
+    Returns:
+        list or None: A list of date tuples (parsed_date_str, raw_phrase_str, start_position),
+            or None if the response is malformed
+    """
+    response_content = response_content.strip()
+    start_idx = response_content.find('[')
+    end_idx = response_content.rfind(']') + 1
+    
+    if start_idx >= 0 and end_idx > start_idx:
+        json_str = response_content[start_idx:end_idx]
         
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        try:
+            dates_data = json.loads(json_str)
+            
+            # Convert to the expected tuple format
+            relative_dates = []
+            for item in dates_data:
+                phrase = item.get('phrase', '')
+                start_index = item.get('start_index', 0)
+                calculated_date = item.get('calculated_date', '')
+                
+                # Only add valid entries
+                if phrase and calculated_date:
+                    relative_dates.append((calculated_date, phrase, start_index))
+            
+            return relative_dates
+        except (ValueError, AttributeError, TypeError) as e:
+            # Invalid JSON, or items that are not objects
+            print(f"Error parsing Llama JSON response: {e}")
+            return None
+    else:
+        print("No JSON array found in Llama response")
+        return None
+
+def extract_relative_dates_llama_batch(items, config, batch_size=8):
+    """
+    Extract relative dates for many notes with batched Llama generation.
+    
+    Args:
+        items (list): (text, document_timestamp) tuples; texts are sent as given.
+        config: Configuration object with Llama settings.
+        batch_size (int): Notes generated together in one batch.
         
-        # Run inference with the model
-        outputs = pipe(
-            messages,
-            max_new_tokens=1000,
-            do_sample=False,
-            temperature=None,
-        )
+    Returns:
+        list: Per item, a list of date tuples, or None if its batch failed or its response is malformed.
+    """
+    if not items:
+        return []
+    pipe = get_llama_pipeline(getattr(config, 'LLAMA_MODEL_PATH', './Llama-3.2-3B-Instruct'))
+    use_prefix_cache = getattr(config, 'LLAMA_PREFIX_CACHE', True)
+    batch_size = max(1, batch_size)
+    
+    results = []
+    with tqdm(total=len(items), desc="Extracting relative dates", unit="note") as progress:
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            try:
+                responses = generate_chat_batch(
+                    pipe, RELATIVE_DATE_SYSTEM_PROMPT, RELATIVE_DATE_INSTRUCTIONS,
+                    [build_relative_date_llama_input(text, document_timestamp) for text, document_timestamp in batch],
+                    max_new_tokens=1000,
+                    use_prefix_cache=use_prefix_cache
+                )
+                results.extend(parse_relative_dates_llama(response) for response in responses)
+            except Exception as e:
+                print(f"Error in batched Llama relative date extraction (items {start}-{start + len(batch) - 1}): {e}")
+                results.extend([None] * len(batch))
+            progress.update(len(batch))
+    return results
+
+def extract_relative_dates_llama(text, document_timestamp, config, raise_errors=False):
+    """
+    Extract relative dates using Llama model.
+    
+    Args:
+        text (str): The clinical note text
+        document_timestamp (datetime): The timestamp of the document for reference
+        config: Configuration object with Llama settings
+        raise_errors (bool): Raise model errors and malformed responses instead of returning []
         
-        # Extract response content
-        response_content = ""
+    Returns:
+        list: A list of date tuples (parsed_date_str, raw_phrase_str, start_position)
+    """
+    try:
+        # Check if transformers package is installed
         try:
-            # Get the last message from the generated conversation
-            last_message = outputs[0]["generated_text"][-1]
-            
-            # The last message should be a dict with the assistant's response
-            if isinstance(last_message, dict) and "content" in last_message:
-                response_content = last_message["content"].strip()
-            else:
-                # If it's not a dict with content, try to use it directly
-                response_content = str(last_message).strip()
-        except (IndexError, KeyError, AttributeError) as e:
-            print(f"Error extracting response from Llama model output: {e}")
+            import transformers
+        except ImportError:
+            if raise_errors:
+                raise
+            print("Error: transformers package not installed. Install with 'pip install transformers'.")
             return []
         
-        # Extract JSON from the response
-        start_idx = response_content.find('[')
-        end_idx = response_content.rfind(']') + 1
+        # Get model path from config
+        model_path = getattr(config, 'LLAMA_MODEL_PATH', './Llama-3.2-3B-Instruct')
         
-        if start_idx >= 0 and end_idx > start_idx:
-            json_str = response_content[start_idx:end_idx]
-            
-            try:
-                dates_data = json.loads(json_str)
-                
-                # Convert to the expected tuple format
-                relative_dates = []
-                for item in dates_data:
-                    phrase = item.get('phrase', '')
-                    start_index = item.get('start_index', 0)
-                    calculated_date = item.get('calculated_date', '')
-                    
-                    # Only add valid entries
-                    if phrase and calculated_date:
-                        relative_dates.append((calculated_date, phrase, start_index))
-                
-                return relative_dates
-            except json.JSONDecodeError as e:
-                print(f"Error parsing Llama JSON response: {e}")
-                return []
-        else:
-            print("No JSON array found in Llama response")
+        # Get the pipeline (loaded once per process and shared with the Llama extractor)
+        try:
+            pipe = get_llama_pipeline(model_path)
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"Error loading Llama model: {e}")
+            return []
+        
+        # Only the document date and text change between calls; the cached key/value
+        # states of the system prompt and instructions are reused
+        note_input = build_relative_date_llama_input(text, document_timestamp)
+        
+        # Run inference with the model
+        response_content = generate_chat_batch(
+            pipe, RELATIVE_DATE_SYSTEM_PROMPT, RELATIVE_DATE_INSTRUCTIONS, [note_input],
+            max_new_tokens=1000,
+            use_prefix_cache=getattr(config, 'LLAMA_PREFIX_CACHE', True)
+        )[0]
+        
+        relative_dates = parse_relative_dates_llama(response_content)
+        if relative_dates is None:
+            if raise_errors:
+                raise ValueError("Malformed Llama relative date response")
             return []
+        return relative_dates
     
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Error in Llama relative date extraction: {e}")
         return []
\ No newline at end of file
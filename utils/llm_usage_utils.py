@@ -0,0 +1,261 @@
+# utils/llm_usage_utils.py
+"""
+Token usage, latency and cost accounting for OpenAI calls.
+
+Every chat completion made through create_chat_completion() (and every batch job result)
+is recorded in the process-wide UsageTracker with its prompt/completion tokens, latency,
+retries and estimated cost. Records are aggregated per component (extractor name or
+'relative_dates'), model and data source for the run report and the comparison output.
+"""
+import time
+import threading
+
+# USD per million (prompt, completion) tokens. Override or extend with LLM_PRICING in config.py.
+DEFAULT_PRICING = {
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4.1': (2.00, 8.00),
+    'gpt-4.1-mini': (0.40, 1.60),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-3.5-turbo': (0.50, 1.50)
+}
+# The Batch API charges half the synchronous price
+BATCH_PRICE_FACTOR = 0.5
+
+def get_model_price(model, pricing=None):
+    """
+    Per-million-token (prompt, completion) price of a model.
+
+    Dated model snapshots (e.g. 'gpt-4o-2024-08-06') use the price of the longest
+    matching model name.
+
+    Returns:
+        tuple or None: The prices, or None if the model is unknown.
+    """
+    pricing = {**DEFAULT_PRICING, **(pricing or {})}
+    matches = [name for name in pricing if model == name or model.startswith(name + '-')]
+    return tuple(pricing[max(matches, key=len)]) if matches else None
+
+def estimate_cost(model, prompt_tokens, completion_tokens, batch=False, pricing=None):
+    """
+    Estimated cost of a call in USD.
+
+    Returns:
+        float or None: The cost, or None if the model has no known price.
+    """
+    price = get_model_price(model, pricing)
+    if price is None:
+        return None
+    cost = (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+    return cost * BATCH_PRICE_FACTOR if batch else cost
+
+class UsageTracker:
+    """
+    Thread-safe accumulator of LLM call records.
+
+    Calls are aggregated by (component, model, data source); the individual records are
+    not kept, so tracking stays cheap on large runs.
+    """
+
+    def __init__(self, pricing=None):
+        """
+        Args:
+            pricing (dict, optional): Model -> (prompt, completion) USD per million tokens,
+                overriding DEFAULT_PRICING.
+        """
+        self.pricing = dict(pricing or {})
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def record(self, component, model, prompt_tokens=0, completion_tokens=0, latency_s=None,
+               retries=0, batch=False, data_source=None, failed=False):
+        """
+        Record one LLM call.
+
+        Args:
+            component (str): Caller (extractor name or 'relative_dates').
+            model (str): Model name.
+            prompt_tokens (int): Prompt tokens reported by the API.
+            completion_tokens (int): Completion tokens reported by the API.
+            latency_s (float, optional): Wall time of the call (None for batch jobs).
+            retries (int): Retries made by the client before the call succeeded.
+            batch (bool): Whether the call was part of a batch job (discounted price).
+            data_source (str, optional): Data source the notes came from.
+            failed (bool): Whether the call failed.
+        """
+        cost = estimate_cost(model, prompt_tokens, completion_tokens, batch, self.pricing)
+        key = (component, model, data_source)
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                group = {
+                    'component': component, 'model': model, 'data_source': data_source,
+                    'calls': 0, 'batch_calls': 0, 'failed_calls': 0, 'retries': 0,
+                    'prompt_tokens': 0, 'completion_tokens': 0,
+                    'cost_usd': 0.0, 'priced': True,
+                    'latency_total_s': 0.0, 'latency_max_s': 0.0, 'timed_calls': 0
+                }
+                self._groups[key] = group
+            group['calls'] += 1
+            group['batch_calls'] += int(batch)
+            group['failed_calls'] += int(failed)
+            group['retries'] += retries
+            group['prompt_tokens'] += prompt_tokens
+            group['completion_tokens'] += completion_tokens
+            if cost is None:
+                group['priced'] = False
+            else:
+                group['cost_usd'] += cost
+            if latency_s is not None:
+                group['latency_total_s'] += latency_s
+                group['latency_max_s'] = max(group['latency_max_s'], latency_s)
+                group['timed_calls'] += 1
+
+    def get_summary(self, component=None):
+        """
+        Aggregated usage, one entry per (component, model, data source).
+
+        Args:
+            component (str, optional): Only include this component.
+
+        Returns:
+            list: Dicts with call, token, retry, latency and cost totals.
+        """
+        with self._lock:
+            groups = [dict(group) for group in self._groups.values()
+                      if component is None or group['component'] == component]
+        for group in groups:
+            group['total_tokens'] = group['prompt_tokens'] + group['completion_tokens']
+            group['latency_mean_s'] = group['latency_total_s'] / group['timed_calls'] if group['timed_calls'] else None
+            if not group.pop('priced'):
+                group['cost_usd'] = None
+        return groups
+
+    def get_totals(self, component=None):
+        """
+        Usage totals over all models and data sources (optionally for one component).
+
+        Returns:
+            dict: calls, prompt/completion/total tokens, retries, cost_usd (None if any
+                  model is unpriced) and mean latency.
+        """
+        groups = self.get_summary(component)
+        totals = {
+            key: sum(group[key] for group in groups)
+            for key in ('calls', 'failed_calls', 'retries', 'prompt_tokens', 'completion_tokens', 'total_tokens')
+        }
+        costs = [group['cost_usd'] for group in groups]
+        totals['cost_usd'] = sum(costs) if all(cost is not None for cost in costs) else None
+        timed_latency = sum(group['latency_total_s'] for group in groups)
+        timed_calls = sum(group['timed_calls'] for group in groups)
+        totals['latency_mean_s'] = timed_latency / timed_calls if timed_calls else None
+        return totals
+
+    def print_summary(self):
+        """Print a per-component usage table."""
+        groups = self.get_summary()
+        if not groups:
+            return
+        print("\nLLM usage:")
+        print(f"  {'Component':<24} {'Model':<16} {'Source':<10} {'Calls':>6} {'Retries':>7} "
+              f"{'Prompt tok':>11} {'Compl. tok':>10} {'Mean lat (s)':>12} {'Cost (USD)':>11}")
+        for group in groups:
+            latency = f"{group['latency_mean_s']:.2f}" if group['latency_mean_s'] is not None else '-'
+            cost = f"{group['cost_usd']:.4f}" if group['cost_usd'] is not None else 'unknown'
+            print(f"  {group['component']:<24} {group['model']:<16} {str(group['data_source'] or '-'):<10} "
+                  f"{group['calls']:>6} {group['retries']:>7} {group['prompt_tokens']:>11} "
+                  f"{group['completion_tokens']:>10} {latency:>12} {cost:>11}")
+
+    def reset(self):
+        """Forget all records."""
+        with self._lock:
+            self._groups.clear()
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+def get_usage_tracker(config=None):
+    """
+    Return the process-wide UsageTracker (created on first use with LLM_PRICING from config).
+    """
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = UsageTracker(getattr(config, 'LLM_PRICING', None))
+        return _tracker
+
+def record_usage(component, model, usage, config=None, **kwargs):
+    """
+    Record a call from an API usage object or dict ({'prompt_tokens', 'completion_tokens'}).
+
+    Args:
+        component (str): Caller name.
+        model (str): Model name.
+        usage: `response.usage` (object or dict), or None if unavailable.
+        config: Configuration object (for the tracker's pricing and DATA_SOURCE).
+        **kwargs: Further UsageTracker.record() arguments (latency_s, retries, batch, failed).
+    """
+    def field(name):
+        value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+        return value or 0
+
+    get_usage_tracker(config).record(
+        component, model,
+        prompt_tokens=field('prompt_tokens') if usage is not None else 0,
+        completion_tokens=field('completion_tokens') if usage is not None else 0,
+        data_source=getattr(config, 'DATA_SOURCE', None),
+        **kwargs
+    )
+
+def create_chat_completion(client, body, component, config=None):
+    """
+    Call client.chat.completions.create(**body) and record its usage, latency and retries.
+
+    Args:
+        client: OpenAI client.
+        body (dict): Request arguments (model, messages, ...).
+        component (str): Caller name for the usage report.
+        config: Configuration object (for pricing and DATA_SOURCE).
+
+    Returns:
+        The parsed ChatCompletion.
+
+    Raises:
+        Exception: Whatever the API call raises (the failure is recorded first).
+    """
+    start = time.perf_counter()
+    try:
+        raw_response = client.chat.completions.with_raw_response.create(**body)
+        response = raw_response.parse()
+    except Exception:
+        record_usage(component, body.get('model'), None, config,
+                     latency_s=time.perf_counter() - start, failed=True)
+        raise
+    record_usage(component, body.get('model'), response.usage, config,
+                 latency_s=time.perf_counter() - start,
+                 retries=getattr(raw_response, 'retries_taken', 0))
+    return response
+
+async def acreate_chat_completion(client, body, component, config=None):
+    """
+    Async version of create_chat_completion() for an AsyncOpenAI client.
+
+    Returns:
+        The parsed ChatCompletion.
+
+    Raises:
+        Exception: Whatever the API call raises (the failure is recorded first).
+    """
+    start = time.perf_counter()
+    try:
+        raw_response = await client.chat.completions.with_raw_response.create(**body)
+        # The raw response of the async client is parsed synchronously (it is already read)
+        response = raw_response.parse()
+    except Exception:
+        record_usage(component, body.get('model'), None, config,
+                     latency_s=time.perf_counter() - start, failed=True)
+        raise
+    record_usage(component, body.get('model'), response.usage, config,
+                 latency_s=time.perf_counter() - start,
+                 retries=getattr(raw_response, 'retries_taken', 0))
+    return response
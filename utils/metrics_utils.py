@@ -0,0 +1,401 @@
+# utils/metrics_utils.py
+import numpy as np
+import pandas as pd
+
+RELATION_COLUMNS = ['note_id', 'diagnosis', 'date']
+
+def relations_to_frame(relations):
+    """
+    Convert a list of relationship dicts (or a DataFrame) to a DataFrame with
+    'note_id', 'diagnosis' and 'date' columns. Extra keys such as 'confidence'
+    are kept if present.
+
+    Args:
+        relations (list or pd.DataFrame): Relationships with at least RELATION_COLUMNS.
+
+    Returns:
+        pd.DataFrame: The relationships as a DataFrame.
+    """
+    if isinstance(relations, pd.DataFrame):
+        return relations
+    if not relations:
+        return pd.DataFrame({column: pd.Series(dtype=object) for column in RELATION_COLUMNS})
+    # Building the core columns directly is much faster than DataFrame.from_records
+    columns = {column: [relation[column] for relation in relations] for column in RELATION_COLUMNS}
+    if 'confidence' in relations[0]:
+        columns['confidence'] = [relation.get('confidence') for relation in relations]
+    return pd.DataFrame(columns)
+
+def _factorize(values):
+    """
+    pd.factorize, with missing values (None/NaN) coded as one extra category (decoded as
+    None) instead of -1, so they can be packed into keys like any other value.
+    """
+    codes, uniques = pd.factorize(values)
+    uniques = np.asarray(uniques)
+    missing = codes < 0
+    if missing.any():
+        codes = np.where(missing, len(uniques), codes)
+        uniques = np.append(uniques.astype(object), None)
+    return codes, uniques
+
+def encode_relations(predictions, gold_standard):
+    """
+    Integer-encode predictions and gold relationships into a shared key space.
+
+    Note ids, diagnoses and dates are factorized jointly over predictions and gold,
+    and each (note, diagnosis, date) triple is packed into a single int64 key:
+    (note_code * n_diagnoses + diagnosis_code) * n_dates + date_code. A missing value
+    (None or NaN, e.g. a gold relationship with a null date) gets a code of its own, so
+    such rows are counted as in the set-based comparison rather than corrupting the keys.
+
+    Args:
+        predictions (pd.DataFrame): Predicted relationships.
+        gold_standard (pd.DataFrame): Gold standard relationships.
+
+    Returns:
+        dict: {
+            'pred_keys', 'gold_keys': int64 key arrays (unsorted, may contain duplicates),
+            'note_ids', 'diagnoses', 'dates': the decoded category values,
+            'n_diagnoses', 'n_dates': sizes of the diagnosis and date code spaces
+        }
+    """
+    n_pred = len(predictions)
+    note_codes, note_ids = _factorize(
+        pd.concat([predictions['note_id'], gold_standard['note_id']], ignore_index=True)
+    )
+    diag_codes, diagnoses = _factorize(
+        pd.concat([predictions['diagnosis'], gold_standard['diagnosis']], ignore_index=True)
+    )
+    date_codes, dates = _factorize(
+        pd.concat([predictions['date'], gold_standard['date']], ignore_index=True)
+    )
+    n_diagnoses = max(len(diagnoses), 1)
+    n_dates = max(len(dates), 1)
+    keys = (note_codes.astype(np.int64) * n_diagnoses + diag_codes) * n_dates + date_codes
+    return {
+        'pred_keys': keys[:n_pred],
+        'gold_keys': keys[n_pred:],
+        'note_ids': note_ids,
+        'diagnoses': diagnoses,
+        'dates': dates,
+        'n_diagnoses': n_diagnoses,
+        'n_dates': n_dates
+    }
+
+def _sorted_unique(keys):
+    """Sorted unique values of an int64 key array (sort + adjacent-difference mask)."""
+    keys = np.sort(keys)
+    if len(keys) == 0:
+        return keys
+    keep = np.empty(len(keys), dtype=bool)
+    keep[0] = True
+    np.not_equal(keys[1:], keys[:-1], out=keep[1:])
+    return keys[keep]
+
+def _safe_ratio(numerator, denominator):
+    """Element-wise numerator / denominator with 0 where the denominator is 0."""
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+def _add_prf_columns(frame):
+    """Add precision, recall and F1 columns computed from TP/FP/FN columns."""
+    tp = frame['true_positives'].to_numpy()
+    fp = frame['false_positives'].to_numpy()
+    fn = frame['false_negatives'].to_numpy()
+    precision = _safe_ratio(tp, tp + fp)
+    recall = _safe_ratio(tp, tp + fn)
+    frame['precision'] = precision
+    frame['recall'] = recall
+    frame['f1'] = _safe_ratio(2 * precision * recall, precision + recall)
+    return frame
+
+def compute_relation_metrics(predictions, gold_standard):
+    """
+    Compute precision/recall/F1 of predicted relationships against the gold standard,
+    with per-note and per-diagnosis breakdowns, in a single vectorized pass.
+
+    As in calculate_and_report_metrics, only notes that have gold standard labels are
+    evaluated, and duplicate (note_id, diagnosis, date) triples count once.
+    True positives are found by a sorted merge (searchsorted) of the unique prediction
+    keys against the sorted unique gold keys.
+
+    Args:
+        predictions (list or pd.DataFrame): Predicted relationships ('note_id', 'diagnosis', 'date').
+        gold_standard (list or pd.DataFrame): Gold standard relationships ('note_id', 'diagnosis', 'date').
+
+    Returns:
+        dict: {
+            'precision', 'recall', 'f1', 'true_positives', 'false_positives', 'false_negatives',
+            'num_labeled_notes': number of notes with gold labels,
+            'num_predictions': unique predictions on labeled notes,
+            'num_gold': unique gold relationships,
+            'per_note': DataFrame indexed by note_id with TP/FP/FN and P/R/F1 per labeled note,
+            'per_diagnosis': DataFrame indexed by diagnosis with TP/FP/FN and P/R/F1
+        }
+    """
+    pred_df = relations_to_frame(predictions)
+    gold_df = relations_to_frame(gold_standard)
+    encoded = encode_relations(pred_df, gold_df)
+    n_diagnoses, n_dates = encoded['n_diagnoses'], encoded['n_dates']
+    notes_stride = n_diagnoses * n_dates
+
+    gold_keys = _sorted_unique(encoded['gold_keys'])
+    labeled_note_codes = _sorted_unique(gold_keys // notes_stride)
+
+    # Keep only predictions for labeled notes, then deduplicate
+    pred_keys = encoded['pred_keys']
+    pred_note_codes = pred_keys // notes_stride
+    pos = np.searchsorted(labeled_note_codes, pred_note_codes)
+    pos = np.minimum(pos, max(len(labeled_note_codes) - 1, 0))
+    on_labeled_note = (labeled_note_codes[pos] == pred_note_codes) if len(labeled_note_codes) else np.zeros(len(pred_keys), dtype=bool)
+    pred_keys = _sorted_unique(pred_keys[on_labeled_note])
+
+    # Sorted merge: a prediction is a true positive if its key appears in the gold keys
+    if len(gold_keys):
+        pos = np.minimum(np.searchsorted(gold_keys, pred_keys), len(gold_keys) - 1)
+        is_tp = gold_keys[pos] == pred_keys
+    else:
+        is_tp = np.zeros(len(pred_keys), dtype=bool)
+
+    true_positives = int(is_tp.sum())
+    false_positives = int(len(pred_keys) - true_positives)
+    false_negatives = int(len(gold_keys) - true_positives)
+    precision = true_positives / (true_positives + false_positives) if (true_positives + false_positives) > 0 else 0
+    recall = true_positives / (true_positives + false_negatives) if (true_positives + false_negatives) > 0 else 0
+    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
+
+    # Per-note breakdown over labeled notes
+    n_notes = len(encoded['note_ids'])
+    pred_notes = pred_keys // notes_stride
+    gold_notes = gold_keys // notes_stride
+    note_tp = np.bincount(pred_notes, weights=is_tp, minlength=n_notes)
+    note_pred = np.bincount(pred_notes, minlength=n_notes)
+    note_gold = np.bincount(gold_notes, minlength=n_notes)
+    per_note = pd.DataFrame({
+        'note_id': encoded['note_ids'][labeled_note_codes],
+        'true_positives': note_tp[labeled_note_codes].astype(np.int64),
+        'false_positives': (note_pred - note_tp)[labeled_note_codes].astype(np.int64),
+        'false_negatives': (note_gold - note_tp)[labeled_note_codes].astype(np.int64)
+    }).set_index('note_id').sort_index()
+    _add_prf_columns(per_note)
+
+    # Per-diagnosis breakdown
+    pred_diags = (pred_keys // n_dates) % n_diagnoses
+    gold_diags = (gold_keys // n_dates) % n_diagnoses
+    diag_tp = np.bincount(pred_diags, weights=is_tp, minlength=n_diagnoses)
+    diag_pred = np.bincount(pred_diags, minlength=n_diagnoses)
+    diag_gold = np.bincount(gold_diags, minlength=n_diagnoses)
+    present = (diag_pred + diag_gold) > 0
+    per_diagnosis = pd.DataFrame({
+        'diagnosis': encoded['diagnoses'][present] if len(encoded['diagnoses']) else np.array([], dtype=object),
+        'true_positives': diag_tp[present].astype(np.int64),
+        'false_positives': (diag_pred - diag_tp)[present].astype(np.int64),
+        'false_negatives': (diag_gold - diag_tp)[present].astype(np.int64)
+    }).set_index('diagnosis').sort_index()
+    _add_prf_columns(per_diagnosis)
+
+    return {
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'true_positives': true_positives,
+        'false_positives': false_positives,
+        'false_negatives': false_negatives,
+        'num_labeled_notes': int(len(labeled_note_codes)),
+        'num_predictions': int(len(pred_keys)),
+        'num_gold': int(len(gold_keys)),
+        'per_note': per_note,
+        'per_diagnosis': per_diagnosis
+    }
+
+def _bootstrap_chunk(counts, seeds):
+    """
+    Draw one note-level bootstrap resample per seed and return their P/R/F1.
+
+    Each resample draws len(counts) notes with replacement from its own random
+    generator. Instead of materialising the resampled notes, the draws are turned
+    into a (resamples x notes) weight matrix of how often each note was drawn, and
+    the resampled TP/FP/FN totals are a single matrix product with the per-note
+    count matrix.
+
+    Args:
+        counts (np.ndarray): (n_notes, 3) float array of per-note TP, FP, FN.
+        seeds (list): One SeedSequence per resample.
+
+    Returns:
+        np.ndarray: (len(seeds), 3) array of precision, recall, F1.
+    """
+    n_resamples = len(seeds)
+    n_notes = len(counts)
+    draws = np.stack([np.random.default_rng(seed).integers(0, n_notes, size=n_notes) for seed in seeds])
+    draws += (np.arange(n_resamples) * n_notes)[:, None]
+    weights = np.bincount(draws.ravel(), minlength=n_resamples * n_notes).reshape(n_resamples, n_notes)
+    totals = weights @ counts
+    tp, fp, fn = totals[:, 0], totals[:, 1], totals[:, 2]
+    precision = _safe_ratio(tp, tp + fp)
+    recall = _safe_ratio(tp, tp + fn)
+    f1 = _safe_ratio(2 * precision * recall, precision + recall)
+    return np.column_stack([precision, recall, f1])
+
+def bootstrap_confidence_intervals(per_note, n_resamples=1000, confidence=0.95, seed=42,
+                                   num_workers=1, chunk_size=None):
+    """
+    Note-level bootstrap confidence intervals for micro precision, recall and F1.
+
+    Notes (not individual relationships) are resampled with replacement, so the
+    intervals account for relationships within a note being correlated. Every
+    resample is seeded from its own child SeedSequence and resamples are only
+    grouped into chunks for evaluation, so the result is identical for any number
+    of workers and any chunk size.
+
+    Args:
+        per_note (pd.DataFrame): Per-note breakdown from compute_relation_metrics.
+        n_resamples (int): Number of bootstrap resamples.
+        confidence (float): Confidence level of the percentile intervals (e.g. 0.95).
+        seed (int): Seed for reproducible resampling.
+        num_workers (int): Number of worker processes (1 runs in-process).
+        chunk_size (int, optional): Resamples per chunk. Defaults to a size that keeps
+            each chunk's weight matrix around 10^7 entries.
+
+    Returns:
+        dict: {'precision': (low, high), 'recall': (low, high), 'f1': (low, high),
+               'n_resamples': int, 'confidence': float}, or None if there are no notes.
+    """
+    counts = per_note[['true_positives', 'false_positives', 'false_negatives']].to_numpy(dtype=float)
+    if len(counts) == 0 or n_resamples <= 0:
+        return None
+
+    if chunk_size is None:
+        chunk_size = max(1, min(n_resamples, 10_000_000 // len(counts)))
+    seeds = np.random.SeedSequence(seed).spawn(n_resamples)
+    chunks = [seeds[start:start + chunk_size] for start in range(0, n_resamples, chunk_size)]
+
+    if num_workers and num_workers > 1 and len(chunks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            results = list(executor.map(_bootstrap_chunk, [counts] * len(chunks), chunks))
+    else:
+        results = [_bootstrap_chunk(counts, chunk) for chunk in chunks]
+    samples = np.vstack(results)
+
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(samples, [alpha, 1 - alpha], axis=0)
+    return {
+        'precision': (float(low[0]), float(high[0])),
+        'recall': (float(low[1]), float(high[1])),
+        'f1': (float(low[2]), float(high[2])),
+        'n_resamples': int(n_resamples),
+        'confidence': float(confidence)
+    }
+
+def compute_precision_recall_curve(predictions, gold_standard):
+    """
+    Compute the precision-recall curve over confidence thresholds in a single pass.
+
+    Predictions on labeled notes are deduplicated (keeping the highest confidence per
+    (note_id, diagnosis, date) triple), sorted by confidence once, and TP/FP counts at
+    every distinct threshold come from cumulative sums. A prediction is kept at
+    threshold t if its confidence is >= t, so each point matches re-running the
+    evaluation with that confidence cut-off.
+
+    Args:
+        predictions (list or pd.DataFrame): Predicted relationships with a 'confidence'
+            value (missing confidences count as 1.0).
+        gold_standard (list or pd.DataFrame): Gold standard relationships.
+
+    Returns:
+        dict: {
+            'curve': DataFrame with 'threshold', 'precision', 'recall', 'f1',
+                     'true_positives', 'false_positives' (highest threshold first),
+            'average_precision': step-wise AP (sum over thresholds of recall gain x precision),
+            'best_threshold', 'best_precision', 'best_recall', 'best_f1': the best-F1 operating point
+        }
+    """
+    pred_df = relations_to_frame(predictions)
+    gold_df = relations_to_frame(gold_standard)
+    encoded = encode_relations(pred_df, gold_df)
+    notes_stride = encoded['n_diagnoses'] * encoded['n_dates']
+
+    gold_keys = _sorted_unique(encoded['gold_keys'])
+    labeled_note_codes = _sorted_unique(gold_keys // notes_stride)
+    num_gold = len(gold_keys)
+
+    pred_keys = encoded['pred_keys']
+    if 'confidence' in pred_df.columns:
+        confidence = pd.to_numeric(pred_df['confidence'], errors='coerce').fillna(1.0).to_numpy(dtype=float)
+    else:
+        confidence = np.ones(len(pred_keys))
+
+    # Keep only predictions for labeled notes
+    if len(labeled_note_codes):
+        pred_note_codes = pred_keys // notes_stride
+        pos = np.minimum(np.searchsorted(labeled_note_codes, pred_note_codes), len(labeled_note_codes) - 1)
+        on_labeled_note = labeled_note_codes[pos] == pred_note_codes
+    else:
+        on_labeled_note = np.zeros(len(pred_keys), dtype=bool)
+    pred_keys = pred_keys[on_labeled_note]
+    confidence = confidence[on_labeled_note]
+
+    # Deduplicate keys, keeping the highest confidence for each triple
+    order = np.lexsort((-confidence, pred_keys))
+    pred_keys, confidence = pred_keys[order], confidence[order]
+    first = np.ones(len(pred_keys), dtype=bool)
+    first[1:] = pred_keys[1:] != pred_keys[:-1]
+    pred_keys, confidence = pred_keys[first], confidence[first]
+
+    if num_gold:
+        pos = np.minimum(np.searchsorted(gold_keys, pred_keys), num_gold - 1)
+        is_tp = gold_keys[pos] == pred_keys
+    else:
+        is_tp = np.zeros(len(pred_keys), dtype=bool)
+
+    # Sort by confidence (highest first) and accumulate TP/FP
+    order = np.argsort(-confidence, kind='stable')
+    confidence, is_tp = confidence[order], is_tp[order]
+    cum_tp = np.cumsum(is_tp)
+    cum_fp = np.cumsum(~is_tp)
+
+    # One point per distinct threshold: the last prediction of each tied group
+    if len(confidence):
+        last_of_group = np.ones(len(confidence), dtype=bool)
+        last_of_group[:-1] = confidence[1:] != confidence[:-1]
+    else:
+        last_of_group = np.zeros(0, dtype=bool)
+    thresholds = confidence[last_of_group]
+    tp = cum_tp[last_of_group]
+    fp = cum_fp[last_of_group]
+
+    precision = _safe_ratio(tp, tp + fp)
+    recall = _safe_ratio(tp, np.full(len(tp), num_gold))
+    f1 = _safe_ratio(2 * precision * recall, precision + recall)
+    recall_gain = np.diff(np.concatenate([[0.0], recall]))
+    average_precision = float(np.sum(recall_gain * precision))
+
+    curve = pd.DataFrame({
+        'threshold': thresholds,
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'true_positives': tp.astype(np.int64),
+        'false_positives': fp.astype(np.int64)
+    })
+
+    result = {
+        'curve': curve,
+        'average_precision': average_precision,
+        'best_threshold': None,
+        'best_precision': 0.0,
+        'best_recall': 0.0,
+        'best_f1': 0.0
+    }
+    if len(curve):
+        best = int(np.argmax(f1))
+        result.update({
+            'best_threshold': float(thresholds[best]),
+            'best_precision': float(precision[best]),
+            'best_recall': float(recall[best]),
+            'best_f1': float(f1[best])
+        })
+    return result
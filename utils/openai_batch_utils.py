@@ -0,0 +1,337 @@
+# utils/openai_batch_utils.py
+"""
+Offline batch jobs for OpenAI chat completions.
+
+Requests are written to a JSONL file in the OpenAI Batch API format:
+    {"custom_id": "...", "method": "POST", "url": "/v1/chat/completions", "body": {...}}
+and submitted through a batch backend:
+    - OpenAIBatchBackend: the OpenAI Batch API (files + batches endpoints)
+    - LocalBatchBackend: a file-based stand-in that answers requests locally, for tests
+      and dry runs without an API key
+
+run_batch_job() submits (or resumes) a job, polls it until it finishes and returns the
+response content keyed by custom_id, so results can be fed back into the normal flow.
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+
+from utils.llm_usage_utils import record_usage
+
+CHAT_COMPLETIONS_URL = '/v1/chat/completions'
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+class BatchJobError(RuntimeError):
+    """A batch job timed out or ended without completing, so none of its results are available."""
+
+    def __init__(self, message, batch_id=None, status=None, custom_ids=()):
+        """
+        Args:
+            message (str): Error message.
+            batch_id (str, optional): The batch id.
+            status (str, optional): The job's last status.
+            custom_ids (iterable): custom_ids of the requests without results.
+        """
+        super().__init__(message)
+        self.batch_id = batch_id
+        self.status = status
+        self.custom_ids = list(custom_ids)
+
+def chat_request(custom_id, body):
+    """One Batch API request line for a chat completion body."""
+    return {"custom_id": custom_id, "method": "POST", "url": CHAT_COMPLETIONS_URL, "body": body}
+
+def write_batch_file(requests, path):
+    """Write Batch API request lines to a JSONL file."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for request in requests:
+            f.write(json.dumps(request) + '\n')
+    return path
+
+def read_batch_results(path):
+    """
+    Read a Batch API output (or error) JSONL file.
+
+    Returns:
+        dict: custom_id -> result line ({"custom_id", "response": {"status_code", "body"}, "error"}).
+    """
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                result = json.loads(line)
+                results[result['custom_id']] = result
+    return results
+
+def result_content(result):
+    """
+    Message content of a batch result line.
+
+    Returns:
+        str or None: The assistant message content, or None if the request failed.
+    """
+    if not result or result.get('error'):
+        return None
+    response = result.get('response') or {}
+    if response.get('status_code') != 200:
+        return None
+    try:
+        return response['body']['choices'][0]['message']['content']
+    except (KeyError, IndexError, TypeError):
+        return None
+
+def _empty_instance(schema):
+    """Smallest value matching a (structured output) JSON schema."""
+    schema_type = schema.get('type')
+    if schema_type == 'object':
+        return {name: _empty_instance(schema['properties'][name]) for name in schema.get('required', [])}
+    if schema_type == 'array':
+        return []
+    if 'enum' in schema:
+        return schema['enum'][0]
+    return {'string': '', 'number': 0, 'integer': 0, 'boolean': False}.get(schema_type)
+
+def empty_response_content(body):
+    """
+    Default LocalBatchBackend responder: an empty but well-formed answer.
+
+    Returns the smallest instance of the request's json_schema response_format, or an
+    empty JSON array for free-text requests.
+    """
+    response_format = body.get('response_format') or {}
+    if response_format.get('type') == 'json_schema':
+        return json.dumps(_empty_instance(response_format['json_schema']['schema']))
+    return '[]'
+
+class OpenAIBatchBackend:
+    """Batch backend using the OpenAI Batch API."""
+
+    name = 'openai'
+
+    def __init__(self, client, completion_window='24h'):
+        """
+        Args:
+            client: An openai.OpenAI client.
+            completion_window (str): Batch completion window.
+        """
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, input_path):
+        """Upload the request file and create the batch; returns the batch id."""
+        with open(input_path, 'rb') as f:
+            batch_file = self.client.files.create(file=f, purpose='batch')
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=CHAT_COMPLETIONS_URL,
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        """Current batch status: {'status', 'completed', 'failed', 'total'}."""
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            'status': batch.status,
+            'completed': getattr(counts, 'completed', 0) if counts else 0,
+            'failed': getattr(counts, 'failed', 0) if counts else 0,
+            'total': getattr(counts, 'total', 0) if counts else 0
+        }
+
+    def download(self, batch_id, output_path):
+        """Write the batch's output and error lines to output_path."""
+        batch = self.client.batches.retrieve(batch_id)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    f.write(self.client.files.content(file_id).text)
+        return output_path
+
+class LocalBatchBackend:
+    """
+    File-based stand-in for the Batch API.
+
+    Jobs live under `work_dir/<batch id>/`; each request is answered by `responder`
+    (body -> message content) when the job is submitted.
+    """
+
+    name = 'local'
+
+    def __init__(self, work_dir, responder=empty_response_content):
+        """
+        Args:
+            work_dir (str): Directory for local job files.
+            responder (callable): Maps a chat completion request body to response content.
+        """
+        self.work_dir = work_dir
+        self.responder = responder
+
+    def _job_dir(self, batch_id):
+        return os.path.join(self.work_dir, batch_id)
+
+    def submit(self, input_path):
+        batch_id = f"local_batch_{uuid.uuid4().hex[:12]}"
+        job_dir = self._job_dir(batch_id)
+        os.makedirs(job_dir, exist_ok=True)
+
+        results = []
+        with open(input_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                try:
+                    content = self.responder(request['body'])
+                    results.append({
+                        'id': f"batch_req_{uuid.uuid4().hex[:12]}",
+                        'custom_id': request['custom_id'],
+                        'response': {
+                            'status_code': 200,
+                            'body': {
+                                'object': 'chat.completion',
+                                'model': request['body'].get('model'),
+                                'choices': [{
+                                    'index': 0,
+                                    'message': {'role': 'assistant', 'content': content},
+                                    'finish_reason': 'stop'
+                                }]
+                            }
+                        },
+                        'error': None
+                    })
+                except Exception as e:
+                    results.append({
+                        'custom_id': request['custom_id'],
+                        'response': None,
+                        'error': {'code': 'local_error', 'message': str(e)}
+                    })
+
+        write_batch_file(results, os.path.join(job_dir, 'output.jsonl'))
+        failed = sum(1 for result in results if result['error'])
+        with open(os.path.join(job_dir, 'status.json'), 'w') as f:
+            json.dump({'status': 'completed', 'completed': len(results) - failed, 'failed': failed, 'total': len(results)}, f)
+        return batch_id
+
+    def status(self, batch_id):
+        with open(os.path.join(self._job_dir(batch_id), 'status.json')) as f:
+            return json.load(f)
+
+    def download(self, batch_id, output_path):
+        with open(os.path.join(self._job_dir(batch_id), 'output.jsonl'), 'r', encoding='utf-8') as src, \
+             open(output_path, 'w', encoding='utf-8') as dst:
+            dst.write(src.read())
+        return output_path
+
+def create_batch_backend(config, client=None):
+    """
+    Create the batch backend selected by OPENAI_BATCH_BACKEND ('openai' or 'local').
+
+    Args:
+        config: Configuration object.
+        client: OpenAI client (required for the 'openai' backend).
+
+    Returns:
+        The backend.
+
+    Raises:
+        ValueError: For an unknown backend or a missing client.
+    """
+    backend = getattr(config, 'OPENAI_BATCH_BACKEND', 'openai').lower()
+    if backend == 'local':
+        return LocalBatchBackend(os.path.join(getattr(config, 'OPENAI_BATCH_DIR', 'batch_jobs'), 'local'))
+    if backend == 'openai':
+        if client is None:
+            raise ValueError("The 'openai' batch backend needs an OpenAI client")
+        return OpenAIBatchBackend(client)
+    raise ValueError(f"Unknown OPENAI_BATCH_BACKEND: {backend}")
+
+def run_batch_job(requests, backend, job_name, work_dir='batch_jobs', poll_seconds=30, timeout_seconds=24 * 3600,
+                  usage_component=None, config=None):
+    """
+    Submit a batch job (or resume an unfinished one) and wait for its results.
+
+    The job's files are kept in `work_dir/<job_name>/`. If a job with identical requests
+    was already submitted there, it is polled again instead of being resubmitted, so an
+    interrupted backfill can simply be rerun.
+
+    Args:
+        requests (list): Batch API request lines (see chat_request()).
+        backend: Batch backend (OpenAIBatchBackend or LocalBatchBackend).
+        job_name (str): Name of the job directory.
+        work_dir (str): Directory holding job directories.
+        poll_seconds (float): Interval between status checks.
+        timeout_seconds (float): Give up waiting after this long.
+        usage_component (str, optional): If set, each request's token usage is recorded
+            under this name in the LLM usage report (at batch prices).
+        config: Configuration object (for pricing and DATA_SOURCE in the usage report).
+
+    Returns:
+        dict: custom_id -> response content (None for failed requests).
+
+    Raises:
+        BatchJobError: If the job is still running after timeout_seconds (rerun to
+            resume it) or ended with a status other than 'completed'.
+    """
+    if not requests:
+        return {}
+    job_dir = os.path.join(work_dir, job_name)
+    input_path = write_batch_file(requests, os.path.join(job_dir, 'input.jsonl'))
+    with open(input_path, 'rb') as f:
+        input_sha = hashlib.sha256(f.read()).hexdigest()
+
+    state_path = os.path.join(job_dir, 'job.json')
+    state = None
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        if state.get('input_sha') != input_sha or state.get('backend') != backend.name or state.get('status') in ('failed', 'expired', 'cancelled'):
+            state = None
+        else:
+            print(f"Resuming batch job {state['batch_id']} ({job_name})")
+
+    if state is None:
+        batch_id = backend.submit(input_path)
+        state = {'batch_id': batch_id, 'backend': backend.name, 'input_sha': input_sha, 'status': 'submitted'}
+        print(f"Submitted batch job {batch_id} with {len(requests)} requests ({backend.name} backend)")
+
+    started = time.time()
+    while True:
+        status = backend.status(state['batch_id'])
+        state['status'] = status['status']
+        with open(state_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        if status['status'] in TERMINAL_STATUSES:
+            break
+        if time.time() - started > timeout_seconds:
+            raise BatchJobError(
+                f"Batch job {state['batch_id']} ({job_name}) still '{status['status']}' after {timeout_seconds}s; "
+                "rerun to resume",
+                state['batch_id'], status['status'], (request['custom_id'] for request in requests)
+            )
+        print(f"Batch job {state['batch_id']}: {status['status']} "
+              f"({status.get('completed', 0)}/{status.get('total', 0)} done)")
+        time.sleep(poll_seconds)
+
+    if status['status'] != 'completed':
+        raise BatchJobError(
+            f"Batch job {state['batch_id']} ({job_name}) ended with status '{status['status']}'; rerun to resubmit",
+            state['batch_id'], status['status'], (request['custom_id'] for request in requests)
+        )
+
+    output_path = backend.download(state['batch_id'], os.path.join(job_dir, 'output.jsonl'))
+    results = read_batch_results(output_path)
+    contents = {request['custom_id']: result_content(results.get(request['custom_id'])) for request in requests}
+    if usage_component:
+        for request in requests:
+            response = (results.get(request['custom_id']) or {}).get('response') or {}
+            record_usage(usage_component, request['body'].get('model'), (response.get('body') or {}).get('usage'),
+                         config, batch=True, failed=contents[request['custom_id']] is None)
+    failed = sum(1 for content in contents.values() if content is None)
+    print(f"Batch job {state['batch_id']} completed: {len(contents) - failed} succeeded, {failed} failed")
+    return contents
@@ -0,0 +1,159 @@
+# utils/openai_client.py
+"""
+Process-wide OpenAI client with a shared, keep-alive connection pool.
+
+All OpenAI call sites (the LLM extractor, relative date extraction and batch jobs) get
+their client from get_openai_client(), so TLS connections are reused across notes instead
+of being set up again for every request. The pool size, timeouts and HTTP/2 use are read
+from the OPENAI_HTTP_* settings in config.py. create_async_openai_client() builds an
+AsyncOpenAI client with the same settings for concurrent requests.
+"""
+import os
+import atexit
+import threading
+
+from dotenv import load_dotenv
+
+# Placeholder values from the README / .env templates
+PLACEHOLDER_API_KEYS = {'', 'your_actual_api_key_here', 'your_api_key_here'}
+
+_clients = {}
+_lock = threading.Lock()
+_dotenv_loaded = False
+
+def get_api_key():
+    """
+    Read OPENAI_API_KEY (loading the .env file once per process).
+
+    Returns:
+        str or None: The API key, or None if it is not set.
+    """
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        load_dotenv()
+        _dotenv_loaded = True
+    return os.getenv('OPENAI_API_KEY')
+
+def _http2_available():
+    """HTTP/2 needs the optional h2 package (pip install 'httpx[http2]')."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _client_settings(config):
+    return (
+        getattr(config, 'OPENAI_HTTP_MAX_CONNECTIONS', 20),
+        getattr(config, 'OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS', 10),
+        getattr(config, 'OPENAI_HTTP_KEEPALIVE_EXPIRY_SECONDS', 30.0),
+        getattr(config, 'OPENAI_HTTP_TIMEOUT_SECONDS', 60.0),
+        getattr(config, 'OPENAI_HTTP_CONNECT_TIMEOUT_SECONDS', 10.0),
+        getattr(config, 'OPENAI_HTTP2', True) and _http2_available(),
+        getattr(config, 'OPENAI_MAX_RETRIES', 2)
+    )
+
+def get_openai_client(config):
+    """
+    Return the shared OpenAI client, creating it on first use.
+
+    One client is kept per API key and connection settings, so every caller with the
+    same configuration shares its connection pool.
+
+    Args:
+        config: Configuration object with the OPENAI_HTTP_* settings.
+
+    Returns:
+        openai.OpenAI: The client.
+
+    Raises:
+        ImportError: If the openai package is not installed.
+        ValueError: If OPENAI_API_KEY is missing or still a placeholder.
+    """
+    api_key = get_api_key()
+    if not api_key or api_key in PLACEHOLDER_API_KEYS:
+        raise ValueError("OPENAI_API_KEY not found in .env file or environment variables "
+                         "(or still set to the placeholder value).")
+    settings = _client_settings(config)
+    key = (api_key,) + settings
+
+    with _lock:
+        if key in _clients:
+            return _clients[key]
+
+        try:
+            import httpx
+            from openai import OpenAI
+        except ImportError:
+            raise ImportError("openai or httpx package not installed. Install with 'pip install openai httpx'.")
+
+        max_connections, max_keepalive, keepalive_expiry, timeout, connect_timeout, http2, max_retries = settings
+        http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            http2=http2,
+            follow_redirects=True
+        )
+        client = OpenAI(api_key=api_key, http_client=http_client, max_retries=max_retries)
+        print(f"OpenAI client created (pool of {max_connections} connections, "
+              f"{'HTTP/2' if http2 else 'HTTP/1.1'}, timeout {timeout}s)")
+        _clients[key] = client
+        return client
+
+def create_async_openai_client(config, max_connections=None):
+    """
+    Create an AsyncOpenAI client with the OPENAI_HTTP_* connection settings.
+
+    Async clients are bound to the event loop they are used in, so they are not shared:
+    the caller creates one per event loop and closes it (`await client.close()`).
+
+    Args:
+        config: Configuration object with the OPENAI_HTTP_* settings.
+        max_connections (int, optional): Pool size (default: OPENAI_HTTP_MAX_CONNECTIONS).
+
+    Returns:
+        openai.AsyncOpenAI: The client.
+
+    Raises:
+        ImportError: If the openai package is not installed.
+        ValueError: If OPENAI_API_KEY is missing or still a placeholder.
+    """
+    api_key = get_api_key()
+    if not api_key or api_key in PLACEHOLDER_API_KEYS:
+        raise ValueError("OPENAI_API_KEY not found in .env file or environment variables "
+                         "(or still set to the placeholder value).")
+    try:
+        import httpx
+        from openai import AsyncOpenAI
+    except ImportError:
+        raise ImportError("openai or httpx package not installed. Install with 'pip install openai httpx'.")
+
+    default_connections, max_keepalive, keepalive_expiry, timeout, connect_timeout, http2, max_retries = _client_settings(config)
+    max_connections = max_connections or default_connections
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(max_keepalive, max_connections),
+            keepalive_expiry=keepalive_expiry
+        ),
+        timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        http2=http2,
+        follow_redirects=True
+    )
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=max_retries)
+
+def close_openai_clients():
+    """Close the shared clients and their connection pools."""
+    with _lock:
+        for client in _clients.values():
+            try:
+                client.close()
+            except Exception:
+                pass
+        _clients.clear()
+
+atexit.register(close_openai_clients)
@@ -0,0 +1,213 @@
+# utils/profiling_utils.py
+import os
+import sys
+import json
+import time
+import platform
+from contextlib import contextmanager
+from datetime import datetime
+
+# resource is only available on Unix-like systems
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Standard stage names used across the evaluation pipeline
+STAGE_DATA_LOAD = 'data_load'
+STAGE_ANNOTATION_PARSING = 'annotation_parsing'
+STAGE_ENTITY_EXTRACTION = 'entity_extraction'
+STAGE_RELATIVE_DATE_EXTRACTION = 'relative_date_extraction'
+STAGE_EXTRACTOR_LOAD = 'extractor_load'
+STAGE_MODEL_INFERENCE = 'model_inference'
+STAGE_METRICS = 'metrics'
+STAGE_CSV_WRITE = 'csv_write'
+STAGE_REPORTING = 'reporting'
+
+def get_peak_rss_mb():
+    """
+    Get the peak resident set size of the current process in megabytes.
+
+    Returns:
+        float: Peak RSS in MB, or None if it cannot be determined on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+class StageTiming:
+    """
+    Handle yielded by StageProfiler.stage() so callers can report how many
+    notes a stage processed once that number is known.
+    """
+    def __init__(self):
+        self.notes = None
+
+class StageProfiler:
+    """
+    Lightweight profiler that records wall time, CPU time, notes/sec and peak RSS
+    for named pipeline stages, optionally per extractor.
+
+    Repeated calls to the same (stage, extractor) pair are accumulated, so a stage
+    can be wrapped around the body of a loop. Nested stages are supported; the
+    parent stage's self time excludes the time spent in its children.
+    """
+
+    def __init__(self, enabled=True, run_info=None):
+        """
+        Initialize the profiler.
+
+        Args:
+            enabled (bool): If False, stage() is a no-op and no report is written.
+            run_info (dict, optional): Extra run metadata to include in the report
+                (e.g. run mode, data source).
+        """
+        self.enabled = enabled
+        self.run_info = dict(run_info or {})
+        self.started_at = datetime.now()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._stages = {}
+        self._stack = []
+        self._sections = {}
+
+    @contextmanager
+    def stage(self, name, extractor=None, notes=None):
+        """
+        Time a block of code as a named stage.
+
+        Args:
+            name (str): Stage name (see the STAGE_* constants).
+            extractor (str, optional): Name of the extractor the stage belongs to.
+            notes (int, optional): Number of notes processed by the block. Can also
+                be set later through the yielded StageTiming's `notes` attribute.
+
+        Yields:
+            StageTiming: Handle for reporting the number of notes processed.
+        """
+        timing = StageTiming()
+        timing.notes = notes
+        if not self.enabled:
+            yield timing
+            return
+
+        frame = {'child_wall': 0.0, 'child_cpu': 0.0}
+        self._stack.append(frame)
+        rss_before = get_peak_rss_mb()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield timing
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            rss_after = get_peak_rss_mb()
+            self._stack.pop()
+            # Attribute this stage's time to the parent's children total
+            if self._stack:
+                self._stack[-1]['child_wall'] += wall
+                self._stack[-1]['child_cpu'] += cpu
+
+            key = (name, extractor)
+            entry = self._stages.get(key)
+            if entry is None:
+                entry = {
+                    'stage': name,
+                    'extractor': extractor,
+                    'calls': 0,
+                    'wall_time_s': 0.0,
+                    'cpu_time_s': 0.0,
+                    'self_wall_time_s': 0.0,
+                    'self_cpu_time_s': 0.0,
+                    'notes': None,
+                    'peak_rss_mb': None,
+                    'rss_growth_mb': 0.0
+                }
+                self._stages[key] = entry
+
+            entry['calls'] += 1
+            entry['wall_time_s'] += wall
+            entry['cpu_time_s'] += cpu
+            entry['self_wall_time_s'] += wall - frame['child_wall']
+            entry['self_cpu_time_s'] += cpu - frame['child_cpu']
+            if timing.notes is not None:
+                entry['notes'] = (entry['notes'] or 0) + timing.notes
+            if rss_after is not None:
+                entry['peak_rss_mb'] = max(entry['peak_rss_mb'] or 0.0, rss_after)
+                entry['rss_growth_mb'] += rss_after - rss_before
+
+    def add_section(self, name, data):
+        """
+        Add extra JSON-serializable data (e.g. LLM usage) to the report under `name`.
+        """
+        self._sections[name] = data
+
+    def get_report(self):
+        """
+        Build the profiling report as a JSON-serializable dict.
+
+        Returns:
+            dict: {'run': {...}, 'stages': [...]} with one entry per (stage, extractor),
+                  plus any sections added with add_section().
+        """
+        stages = []
+        for entry in self._stages.values():
+            entry = dict(entry)
+            if entry['notes'] and entry['self_wall_time_s'] > 0:
+                entry['notes_per_sec'] = entry['notes'] / entry['self_wall_time_s']
+            else:
+                entry['notes_per_sec'] = None
+            stages.append(entry)
+
+        run = dict(self.run_info)
+        run.update({
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'total_wall_time_s': time.perf_counter() - self._start_wall,
+            'total_cpu_time_s': time.process_time() - self._start_cpu,
+            'peak_rss_mb': get_peak_rss_mb(),
+            'python_version': platform.python_version(),
+            'platform': platform.platform()
+        })
+        report = {'run': run, 'stages': stages}
+        report.update(self._sections)
+        return report
+
+    def print_summary(self):
+        """Print a compact per-stage summary table."""
+        if not self.enabled or not self._stages:
+            return
+        print("\nStage timings:")
+        print(f"  {'Stage':<26} {'Extractor':<22} {'Wall (s)':>9} {'CPU (s)':>9} {'Notes/s':>9} {'Peak RSS (MB)':>14}")
+        for entry in self.get_report()['stages']:
+            notes_per_sec = f"{entry['notes_per_sec']:.1f}" if entry['notes_per_sec'] else '-'
+            peak_rss = f"{entry['peak_rss_mb']:.1f}" if entry['peak_rss_mb'] is not None else '-'
+            print(f"  {entry['stage']:<26} {str(entry['extractor'] or '-'):<22} "
+                  f"{entry['self_wall_time_s']:>9.3f} {entry['self_cpu_time_s']:>9.3f} "
+                  f"{notes_per_sec:>9} {peak_rss:>14}")
+
+    def write_report(self, output_dir, filename):
+        """
+        Write the profiling report as JSON.
+
+        Args:
+            output_dir (str): Directory to write the report to.
+            filename (str): Name of the JSON file.
+
+        Returns:
+            str: Path of the written report, or None if profiling is disabled.
+        """
+        if not self.enabled:
+            return None
+        os.makedirs(output_dir, exist_ok=True)
+        report_path = os.path.join(output_dir, filename)
+        with open(report_path, 'w') as f:
+            json.dump(self.get_report(), f, indent=2)
+        print(f"Profiling report saved to {report_path}")
+        return report_path
+
+# Shared disabled profiler so callers can skip None checks
+NULL_PROFILER = StageProfiler(enabled=False)
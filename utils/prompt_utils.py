@@ -0,0 +1,244 @@
+# utils/prompt_utils.py
+"""
+Compact, entity-anchored prompts for the LLM extractors.
+
+Instead of the whole note plus Python-repr'd entity lists, the compact prompt contains
+only the text windows around entity mentions (overlapping windows merged), with short
+inline IDs marking each mention: [D1] before a diagnosis, [T1] before a date. The model
+answers with IDs, which map_compact_relationships() turns back into diagnosis names and
+raw date strings.
+"""
+import re
+import threading
+
+# Fallback when tiktoken is not installed: roughly four characters per token for English text
+CHARS_PER_TOKEN = 4
+
+_encodings = {}
+
+def count_tokens(text, model_name=None):
+    """
+    Count the tokens of a prompt.
+
+    Uses tiktoken when it is installed, otherwise estimates from the character count.
+
+    Args:
+        text (str): The prompt text.
+        model_name (str, optional): OpenAI model name used to pick the tiktoken encoding.
+
+    Returns:
+        tuple: (token_count, exact) where exact is False for the character-based estimate.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return max(1, round(len(text) / CHARS_PER_TOKEN)), False
+
+    if model_name not in _encodings:
+        try:
+            _encodings[model_name] = tiktoken.encoding_for_model(model_name)
+        except (KeyError, ValueError, TypeError):
+            _encodings[model_name] = tiktoken.get_encoding('cl100k_base')
+    return len(_encodings[model_name].encode(text)), True
+
+def merge_windows(spans):
+    """Merge overlapping or touching (start, end) spans; returns them sorted."""
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(span) for span in merged]
+
+def _snap_to_words(text, start, end):
+    """Widen a span to whole words so excerpts don't start or end mid-word."""
+    while start > 0 and not text[start - 1].isspace():
+        start -= 1
+    while end < len(text) and not text[end].isspace():
+        end += 1
+    return start, end
+
+def _anchor_mention(text, pos, surface):
+    """
+    Character offset of an entity mention, checked against the text.
+
+    Annotation offsets are not always exact, so if `surface` is not found at `pos` the
+    nearest occurrence is used instead. Offsets are moved to the start of their word so
+    markers never split a word.
+
+    Returns:
+        int or None: The offset, or None if it is out of range and the mention is not found.
+    """
+    lowered = text.lower()
+    candidates = {surface.lower(), surface.lower().replace('_', ' ')} if surface else set()
+    if not any(lowered.startswith(candidate, pos) for candidate in candidates if 0 <= pos < len(text)):
+        occurrences = [match.start() for candidate in candidates if candidate
+                       for match in re.finditer(re.escape(candidate), lowered)]
+        if occurrences:
+            pos = min(occurrences, key=lambda start: abs(start - pos))
+        elif not 0 <= pos <= len(text):
+            return None
+    while 0 < pos < len(text) and not text[pos - 1].isspace() and text[pos - 1].isalnum():
+        pos -= 1
+    return pos
+
+def build_compact_note_input(text, diagnoses, dates, window_chars=150, sections=None):
+    """
+    Build the note-specific part of a compact prompt.
+
+    Args:
+        text (str): The clinical note text.
+        diagnoses (list): (diagnosis, position) tuples.
+        dates (list): (parsed_date, raw_date, position) tuples.
+        window_chars (int): Characters of context kept on each side of a mention.
+        sections (list, optional): (start, end) note sections (see utils/segmentation_utils.py);
+            each mention's window is cut off at the bounds of its section.
+
+    Returns:
+        dict: {
+            'note_input': str,      # Diagnosis legend plus marked-up excerpts
+            'diagnosis_ids': dict,  # 'D1' -> diagnosis name
+            'date_ids': dict        # 'T1' -> raw date string
+        }
+    """
+    # One ID per distinct diagnosis name / raw date string (the output is keyed by these)
+    diagnosis_ids = {}
+    for name, _ in diagnoses:
+        diagnosis_ids.setdefault(name, f"D{len(diagnosis_ids) + 1}")
+    date_ids = {}
+    for _, raw_date, _ in dates:
+        date_ids.setdefault(raw_date, f"T{len(date_ids) + 1}")
+
+    # Mentions anchored in the text: (position, mention length, marker)
+    mentions = []
+    for name, pos in diagnoses:
+        pos = _anchor_mention(text, pos, str(name))
+        if pos is not None:
+            mentions.append((pos, len(str(name)), diagnosis_ids[name]))
+    for _, raw_date, pos in dates:
+        pos = _anchor_mention(text, pos, str(raw_date))
+        if pos is not None:
+            mentions.append((pos, len(str(raw_date)), date_ids[raw_date]))
+    mentions = sorted(set(mentions))
+
+    spans = []
+    for pos, length, _ in mentions:
+        lower, upper = 0, len(text)
+        if sections:
+            lower, upper = next(((start, end) for start, end in sections if start <= pos < end), (lower, upper))
+        start, end = _snap_to_words(text, max(lower, pos - window_chars), min(upper, pos + length + window_chars))
+        spans.append((max(lower, start), min(max(upper, pos + length), end)))
+
+    excerpts = []
+    for start, end in merge_windows(spans):
+        # Insert markers from the end so earlier offsets stay valid
+        excerpt = text[start:end]
+        for pos, _, marker in sorted((m for m in mentions if start <= m[0] <= end), reverse=True):
+            offset = pos - start
+            excerpt = f"{excerpt[:offset]}[{marker}] {excerpt[offset:]}"
+        excerpts.append(re.sub(r'\s+', ' ', excerpt).strip())
+
+    legend = ', '.join(f"{marker}={name}" for name, marker in diagnosis_ids.items())
+    note_input = f"Diagnoses: {legend}\nExcerpts:\n" + "\n...\n".join(excerpts)
+    return {
+        'note_input': note_input,
+        'diagnosis_ids': {marker: name for name, marker in diagnosis_ids.items()},
+        'date_ids': {marker: raw_date for raw_date, marker in date_ids.items()}
+    }
+
+def map_compact_relationships(relationships, compact):
+    """
+    Map ID-based relationships from the model back to diagnosis names and raw dates.
+
+    Args:
+        relationships (list): Dicts with 'diagnosis' (e.g. 'D1') and 'date' (e.g. 'T2') IDs.
+        compact (dict): The result of build_compact_note_input() for the note.
+
+    Returns:
+        list: Relationship dicts with diagnosis names and raw date strings; entries with
+              unknown IDs are dropped.
+    """
+    mapped = []
+    for rel in relationships:
+        diagnosis = compact['diagnosis_ids'].get(str(rel.get('diagnosis', '')).strip().strip('[]'))
+        date = compact['date_ids'].get(str(rel.get('date', '')).strip().strip('[]'))
+        if diagnosis is None or date is None:
+            continue
+        mapped.append({**rel, 'diagnosis': diagnosis, 'date': date})
+    return mapped
+
+class PromptSavings:
+    """
+    Thread-safe running totals of full vs. compact prompt sizes.
+
+    Only the totals are kept, not per-note records, so a long-running service
+    can keep counting without its memory growing.
+    """
+
+    def __init__(self):
+        self.notes = 0
+        self._full_tokens = 0
+        self._compact_tokens = 0
+        self._saving_sum = 0.0
+        self._saving_notes = 0
+        self._exact = True
+        self._lock = threading.Lock()
+
+    def add(self, full_tokens, compact_tokens, exact=False):
+        """Count one note's full and compact prompt token counts."""
+        with self._lock:
+            self.notes += 1
+            self._full_tokens += full_tokens
+            self._compact_tokens += compact_tokens
+            if full_tokens:
+                self._saving_sum += 1 - compact_tokens / full_tokens
+                self._saving_notes += 1
+            self._exact = self._exact and exact
+
+    def summary(self):
+        """
+        Returns:
+            dict: Note count, token totals, saved tokens and the mean per-note saving (%).
+        """
+        with self._lock:
+            return {
+                'notes': self.notes,
+                'full_tokens': self._full_tokens,
+                'compact_tokens': self._compact_tokens,
+                'saved_tokens': self._full_tokens - self._compact_tokens,
+                'mean_saving_pct': 100 * self._saving_sum / self._saving_notes if self._saving_notes else 0.0,
+                'exact': self._exact
+            }
+
+def summarize_prompt_savings(records):
+    """
+    Summarize per-note prompt sizes of the full and compact prompts.
+
+    Args:
+        records (list): Dicts with 'full_tokens' and 'compact_tokens' per note.
+
+    Returns:
+        dict: Note count, token totals, saved tokens and the mean per-note saving (%).
+    """
+    savings = PromptSavings()
+    for record in records:
+        savings.add(record['full_tokens'], record['compact_tokens'], record.get('exact', False))
+    return savings.summary()
+
+def format_prompt_savings(summary):
+    """
+    One-line summary of prompt statistics for console output.
+
+    Args:
+        summary (dict): summarize_prompt_savings() output, optionally with 'requests' and
+            'packed_requests' counts added by the extractor.
+    """
+    parts = []
+    if 'requests' in summary:
+        parts.append(f"{summary['requests']} API requests ({summary.get('packed_requests', 0)} packed)")
+    if 'full_tokens' in summary:
+        estimate = '' if summary['exact'] else ' (estimated, install tiktoken for exact counts)'
+        parts.append(f"{summary['notes']} notes, prompt tokens {summary['full_tokens']} -> {summary['compact_tokens']} "
+                     f"(saved {summary['saved_tokens']}, mean {summary['mean_saving_pct']:.1f}% per note){estimate}")
+    return '; '.join(parts)
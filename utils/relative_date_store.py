@@ -0,0 +1,163 @@
+# utils/relative_date_store.py
+"""
+Persisted results of the relative date extraction stage.
+
+Relative dates found by an LLM are stored in a columnar file (Parquet, or CSV if no
+Parquet engine is installed) keyed by the note text hash, the document timestamp and
+the model that produced them. The stage only sends notes without a stored result to
+the LLM, and load_real_data merges stored results into the note entities, so repeated
+evaluate/compare runs do not call an LLM for dates.
+"""
+import os
+import json
+import hashlib
+from datetime import datetime
+
+import pandas as pd
+
+STORE_COLUMNS = ['text_hash', 'document_timestamp', 'model', 'relative_dates', 'extracted_at']
+
+# Document timestamp formats found in the source CSVs
+TIMESTAMP_FORMATS = [
+    '%Y-%m-%d',              # 2023-10-26
+    '%Y-%m-%d %H:%M:%S',     # 2023-10-26 15:30:45
+    '%m/%d/%Y',              # 10/26/2023
+    '%m/%d/%Y %H:%M:%S',     # 10/26/2023 15:30:45
+    '%d-%b-%Y',              # 26-Oct-2023
+    '%d %b %Y',              # 26 Oct 2023
+    '%d/%m/%Y',              # 14/05/2025
+]
+
+def parse_document_timestamp(value):
+    """
+    Parse a document timestamp cell.
+
+    Returns:
+        datetime or None: The timestamp, or None if it is empty or in an unknown format.
+    """
+    if value is None or (isinstance(value, float) and pd.isna(value)) or not str(value).strip():
+        return None
+    for format_str in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), format_str)
+        except ValueError:
+            continue
+    return None
+
+def text_hash(text):
+    """SHA-256 hex digest of a note text."""
+    return hashlib.sha256(str(text).encode('utf-8')).hexdigest()
+
+def relative_date_model_id(config):
+    """
+    Identify the model and settings that produce relative dates, e.g. 'openai:gpt-3.5-turbo:1000'.
+
+    The context window is included because notes are truncated to it before extraction.
+    """
+    llm_model = getattr(config, 'RELATIVE_DATE_LLM_MODEL', 'openai').lower()
+    if llm_model == 'openai':
+        model_name = getattr(config, 'RELATIVE_DATE_OPENAI_MODEL', 'gpt-3.5-turbo')
+    else:
+        model_name = os.path.basename(os.path.normpath(getattr(config, 'LLAMA_MODEL_PATH', 'llama')))
+    return f"{llm_model}:{model_name}:{getattr(config, 'RELATIVE_DATE_CONTEXT_WINDOW', 1000)}"
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+def _parquet_available():
+    for engine in ('pyarrow', 'fastparquet'):
+        try:
+            __import__(engine)
+            return True
+        except ImportError:
+            continue
+    return False
+
+_fallback_warned = False
+
+class RelativeDateStore:
+    """
+    Relative dates keyed by (text hash, document timestamp, model id).
+
+    The whole store is loaded on first use; put_many() rewrites the file atomically.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Store file. A '.parquet' path falls back to a '.csv' file next to it
+                if neither pyarrow nor fastparquet is installed.
+        """
+        global _fallback_warned
+        if path.endswith('.parquet') and not _parquet_available():
+            fallback = os.path.splitext(path)[0] + '.csv'
+            if not _fallback_warned:
+                _fallback_warned = True
+                print(f"Warning: No Parquet engine installed (pip install pyarrow); storing relative dates in {fallback}")
+            path = fallback
+        self.path = path
+        self._results = None
+
+    @staticmethod
+    def _key(text_hash_value, document_timestamp, model):
+        return (text_hash_value, document_timestamp.isoformat(), model)
+
+    def _load(self):
+        if self._results is not None:
+            return self._results
+        self._results = {}
+        if os.path.exists(self.path):
+            frame = pd.read_parquet(self.path) if self.path.endswith('.parquet') else pd.read_csv(self.path, dtype=str)
+            for row in frame.itertuples(index=False):
+                dates = [tuple(item) for item in json.loads(row.relative_dates)]
+                self._results[(row.text_hash, row.document_timestamp, row.model)] = (dates, row.extracted_at)
+        return self._results
+
+    def __len__(self):
+        return len(self._load())
+
+    def get(self, text, document_timestamp, model):
+        """
+        Stored relative dates for a note.
+
+        Returns:
+            list or None: (parsed_date_str, raw_phrase_str, start_position) tuples, or None
+                          if the note has not been processed with this model.
+        """
+        result = self._load().get(self._key(text_hash(text), document_timestamp, model))
+        return list(result[0]) if result is not None else None
+
+    def put_many(self, records, model):
+        """
+        Store the relative dates of several notes and write the store.
+
+        Args:
+            records (list): (text, document_timestamp, relative_dates) tuples.
+            model (str): Model id the dates were produced with.
+        """
+        if not records:
+            return
+        results = self._load()
+        extracted_at = datetime.now().isoformat(timespec='seconds')
+        for text, document_timestamp, relative_dates in records:
+            dates = [(str(date), str(phrase), _to_int(start)) for date, phrase, start in relative_dates]
+            results[self._key(text_hash(text), document_timestamp, model)] = (dates, extracted_at)
+        self._write()
+
+    def _write(self):
+        frame = pd.DataFrame(
+            [(key[0], key[1], key[2], json.dumps(dates), extracted_at)
+             for key, (dates, extracted_at) in self._results.items()],
+            columns=STORE_COLUMNS
+        )
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Write to a temporary file first so an interrupted write keeps the old store
+        tmp_path = self.path + '.tmp'
+        if self.path.endswith('.parquet'):
+            frame.to_parquet(tmp_path, index=False)
+        else:
+            frame.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,267 @@
+# utils/reporting_utils.py
+"""
+Deferred plot rendering.
+
+Pipeline code does not draw figures itself. Instead it writes a small JSON plot
+spec (the data plus the target image path) with queue_plot(), and the figures are
+rendered later - in a background process, inline, or on demand from the command line:
+
+    python -m utils.reporting_utils experiment_outputs
+
+matplotlib is only imported by the renderers, so runs that never render plots
+never pay its import cost.
+"""
+import os
+import sys
+import json
+import subprocess
+from datetime import datetime
+
+# Pending plot specs are written to this subdirectory of the plot's output directory
+PLOT_SPEC_DIR = 'pending_plots'
+
+# Valid PLOT_MODE values
+PLOT_MODE_BACKGROUND = 'background'  # Render in a detached background process
+PLOT_MODE_INLINE = 'inline'          # Render in-process before returning
+PLOT_MODE_DEFERRED = 'deferred'      # Only write specs; render later via the CLI
+PLOT_MODES = [PLOT_MODE_BACKGROUND, PLOT_MODE_INLINE, PLOT_MODE_DEFERRED]
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _json_default(value):
+    """Convert NumPy scalars/arrays to plain Python values for JSON."""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def queue_plot(kind, data, save_path):
+    """
+    Write a plot spec to be rendered later.
+
+    Args:
+        kind (str): Renderer name (a key of RENDERERS).
+        data (dict): JSON-serializable data needed by the renderer.
+        save_path (str): Path of the image the renderer will write.
+
+    Returns:
+        str: Path of the written spec.
+    """
+    if kind not in RENDERERS:
+        raise ValueError(f"Unknown plot kind: {kind}. Valid options are: {sorted(RENDERERS)}")
+    output_dir = os.path.dirname(os.path.abspath(save_path))
+    spec_dir = os.path.join(output_dir, PLOT_SPEC_DIR)
+    os.makedirs(spec_dir, exist_ok=True)
+    spec_path = os.path.join(spec_dir, os.path.splitext(os.path.basename(save_path))[0] + '.json')
+    spec = {
+        'kind': kind,
+        'save_path': os.path.abspath(save_path),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'data': data
+    }
+    tmp_path = spec_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(spec, f, default=_json_default)
+    os.replace(tmp_path, spec_path)
+    return spec_path
+
+def pending_plot_specs(output_dir):
+    """List the pending plot specs in an output directory."""
+    spec_dir = os.path.join(output_dir, PLOT_SPEC_DIR)
+    if not os.path.isdir(spec_dir):
+        return []
+    return sorted(os.path.join(spec_dir, name) for name in os.listdir(spec_dir) if name.endswith('.json'))
+
+def render_plot_spec(spec_path):
+    """
+    Render a single plot spec and remove it once the image is written.
+
+    Returns:
+        str: Path of the rendered image, or None if rendering failed.
+    """
+    try:
+        with open(spec_path, 'r') as f:
+            spec = json.load(f)
+        save_path = spec['save_path']
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        RENDERERS[spec['kind']](spec['data'], save_path)
+        os.remove(spec_path)
+        return save_path
+    except Exception as e:
+        print(f"Error rendering plot spec {spec_path}: {e}")
+        return None
+
+def render_pending_plots(output_dir):
+    """
+    Render every pending plot spec in an output directory.
+
+    Returns:
+        list: Paths of the rendered images.
+    """
+    rendered = []
+    for spec_path in pending_plot_specs(output_dir):
+        image_path = render_plot_spec(spec_path)
+        if image_path:
+            print(f"Plot saved to {image_path}")
+            rendered.append(image_path)
+    return rendered
+
+def start_background_render(output_dir):
+    """
+    Render the pending plots of an output directory in a detached background process.
+
+    Returns:
+        subprocess.Popen: The renderer process.
+    """
+    log_path = os.path.join(output_dir, PLOT_SPEC_DIR, 'render.log')
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    with open(log_path, 'a') as log_file:
+        return subprocess.Popen(
+            [sys.executable, '-m', 'utils.reporting_utils', os.path.abspath(output_dir)],
+            cwd=PROJECT_ROOT,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            start_new_session=True
+        )
+
+def finish_plots(output_dir, plot_mode=PLOT_MODE_BACKGROUND):
+    """
+    Render the pending plots of an output directory according to the plot mode.
+
+    Args:
+        output_dir (str): Directory whose pending plot specs should be rendered.
+        plot_mode (str): 'background', 'inline' or 'deferred' (see PLOT_MODES).
+    """
+    pending = pending_plot_specs(output_dir)
+    if not pending:
+        return
+    plot_mode = (plot_mode or PLOT_MODE_BACKGROUND).lower()
+    if plot_mode == PLOT_MODE_INLINE:
+        render_pending_plots(output_dir)
+    elif plot_mode == PLOT_MODE_DEFERRED:
+        print(f"{len(pending)} plot(s) queued in {os.path.join(output_dir, PLOT_SPEC_DIR)}. "
+              f"Render them with: python -m utils.reporting_utils {output_dir}")
+    elif plot_mode == PLOT_MODE_BACKGROUND:
+        start_background_render(output_dir)
+        print(f"Rendering {len(pending)} plot(s) in the background to {output_dir}")
+    else:
+        print(f"Warning: Unknown PLOT_MODE '{plot_mode}'. Valid options are: {PLOT_MODES}. Plots left queued.")
+
+# --- Renderers --- #
+
+def _get_pyplot():
+    """Import pyplot with the non-interactive Agg backend."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+def render_confusion_matrix(data, save_path):
+    """Render a 2x2 confusion matrix (same layout as sklearn's ConfusionMatrixDisplay)."""
+    plt = _get_pyplot()
+    import numpy as np
+    matrix = np.array(data['matrix'])
+    labels = data['labels']
+    fig, ax = plt.subplots(figsize=(6, 5))
+    image = ax.imshow(matrix, interpolation='nearest', cmap=plt.cm.Blues)
+    fig.colorbar(image, ax=ax)
+    threshold = (matrix.max() + matrix.min()) / 2.0
+    cmap_min, cmap_max = image.cmap(0), image.cmap(1.0)
+    for i in range(matrix.shape[0]):
+        for j in range(matrix.shape[1]):
+            color = cmap_max if matrix[i, j] < threshold else cmap_min
+            ax.text(j, i, format(int(matrix[i, j]), 'd'), ha='center', va='center', color=color)
+    ax.set(xticks=range(len(labels)), yticks=range(len(labels)),
+           xticklabels=labels, yticklabels=labels,
+           xlabel='Predicted label', ylabel='True label')
+    ax.set_ylim(len(labels) - 0.5, -0.5)
+    ax.set_title(data['title'])
+    fig.tight_layout()
+    fig.savefig(save_path)
+    plt.close(fig)
+
+def render_pr_curve(data, save_path):
+    """Render a step-wise precision-recall curve with the best-F1 point marked."""
+    plt = _get_pyplot()
+    fig, ax = plt.subplots(figsize=(6, 5))
+    ax.step(data['recall'], data['precision'], where='post', label=f"AP = {data['average_precision']:.3f}")
+    if data.get('best_threshold') is not None:
+        ax.scatter([data['best_recall']], [data['best_precision']], color='red', zorder=3,
+                   label=f"Best F1 {data['best_f1']:.3f} @ {data['best_threshold']:.3f}")
+    ax.set_xlabel('Recall')
+    ax.set_ylabel('Precision')
+    ax.set_xlim(0, 1.05)
+    ax.set_ylim(0, 1.05)
+    ax.set_title(data['title'])
+    ax.legend(loc='lower left')
+    ax.grid(linestyle='--', alpha=0.7)
+    fig.tight_layout()
+    fig.savefig(save_path)
+    plt.close(fig)
+
+def render_comparison(data, save_path):
+    """Render the grouped bar chart comparing P/R/F1 across extraction methods."""
+    plt = _get_pyplot()
+    import numpy as np
+    methods = data['methods']
+    metrics = data['metrics']
+    values = data['values']            # {metric: [value per method]}
+    errors = data.get('errors')        # {metric: [[below per method], [above per method]]}
+    costs = data.get('costs')          # Estimated LLM cost (USD) per method, None for non-LLM methods
+    fig, ax = plt.subplots(figsize=(10, 6))
+    x = np.arange(len(methods))
+    width = 0.8 / max(len(metrics), 1)
+    for i, metric in enumerate(metrics):
+        offset = (i - (len(metrics) - 1) / 2) * width
+        yerr = np.array(errors[metric]) if errors else None
+        ax.bar(x + offset, values[metric], width, label=metric, yerr=yerr, capsize=3)
+    ax.set_xticks(x)
+    if costs:
+        methods = [f"{method}\n${cost:.4f}" if cost is not None else method for method, cost in zip(methods, costs)]
+    ax.set_xticklabels(methods)
+    ax.set_title(data['title'])
+    ax.set_ylabel('Score')
+    ax.set_xlabel('Method')
+    ax.set_ylim(0, 1.05)
+    ax.grid(axis='y', linestyle='--', alpha=0.7)
+    ax.legend(title='Metric')
+    fig.tight_layout()
+    fig.savefig(save_path)
+    plt.close(fig)
+
+def render_training_curves(data, save_path):
+    """Render training/validation loss and validation accuracy per epoch."""
+    plt = _get_pyplot()
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 5))
+    epochs = range(1, len(data['train_losses']) + 1)
+    ax1.plot(epochs, data['train_losses'], 'b-', label='Training Loss')
+    ax1.plot(epochs, data['val_losses'], 'r-', label='Validation Loss')
+    ax1.set_title('Training and Validation Loss')
+    ax1.set_xlabel('Epochs')
+    ax1.set_ylabel('Loss')
+    ax1.legend()
+    ax2.plot(epochs, data['val_accs'], 'g-')
+    ax2.set_title('Validation Accuracy')
+    ax2.set_xlabel('Epochs')
+    ax2.set_ylabel('Accuracy (%)')
+    fig.tight_layout()
+    fig.savefig(save_path)
+    plt.close(fig)
+
+RENDERERS = {
+    'confusion_matrix': render_confusion_matrix,
+    'pr_curve': render_pr_curve,
+    'comparison': render_comparison,
+    'training_curves': render_training_curves
+}
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Render pending plot specs written by the evaluation and training runs.")
+    parser.add_argument('output_dirs', nargs='*', default=[os.path.join(PROJECT_ROOT, 'experiment_outputs')],
+                        help="Output directories containing a pending_plots/ folder (default: experiment_outputs).")
+    args = parser.parse_args()
+    for directory in args.output_dirs:
+        render_pending_plots(directory)
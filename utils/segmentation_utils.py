@@ -0,0 +1,111 @@
+# utils/segmentation_utils.py
+"""
+Split clinical notes into sections and restrict diagnosis-date candidate pairs to them.
+
+Notes (including the synthetic ones built from SECTION_TEMPLATES) are sequences of dated
+entries such as "F/U (12/03/24): ..." or "MRI (2024-01-05): ...", usually separated by
+blank lines. A new section starts after a blank line and at every line that opens with a
+header cue (a short title followed by a date, or an all-caps title with a colon). Entities
+get the index of the section they fall in, and extractors can then only pair a diagnosis
+with dates from the same section, or from the same or adjacent sections.
+"""
+import re
+from bisect import bisect_right
+
+# Blank lines always end a section
+BLANK_LINE_PATTERN = re.compile(r'\n[ \t]*\n\s*')
+
+# Header cues at the start of a line
+HEADER_PATTERNS = [
+    re.compile(r'^[ \t]*[A-Za-z][A-Za-z/&\- ]{0,40}?[ \t]*\(+[ \t]*\d', re.M),  # Title (date...
+    re.compile(r'^[ \t]*[A-Za-z][A-Za-z/&\- ]{0,40}?:[ \t]*\d', re.M),          # Title: date...
+    re.compile(r'^[ \t]*[A-Z][A-Z/&\- ]{2,40}:', re.M)                          # ALL CAPS TITLE:
+]
+
+# SECTION_RESTRICTION values -> how many sections apart a diagnosis and date may be
+SECTION_WINDOWS = {'off': None, 'same': 0, 'adjacent': 1}
+
+def get_section_window(config):
+    """
+    Section window from the SECTION_RESTRICTION setting.
+
+    Returns:
+        int or None: 0 (same section), 1 (same or adjacent sections) or None (no restriction).
+    """
+    restriction = str(getattr(config, 'SECTION_RESTRICTION', 'off') or 'off').lower()
+    if restriction not in SECTION_WINDOWS:
+        print(f"Warning: Unknown SECTION_RESTRICTION '{restriction}' (options: {', '.join(SECTION_WINDOWS)}); "
+              "not restricting candidate pairs")
+        return None
+    return SECTION_WINDOWS[restriction]
+
+def split_sections(text):
+    """
+    Split a note into sections at blank lines and header cues.
+
+    Args:
+        text (str): The clinical note text.
+
+    Returns:
+        list: (start, end) character spans covering the whole text, in order.
+    """
+    if not text:
+        return [(0, 0)]
+    starts = {0}
+    starts.update(match.end() for match in BLANK_LINE_PATTERN.finditer(text))
+    for pattern in HEADER_PATTERNS:
+        for match in pattern.finditer(text):
+            # Start the section at the header text, not at the line's indentation
+            starts.add(match.start() + len(match.group(0)) - len(match.group(0).lstrip()))
+    starts = sorted(start for start in starts if start < len(text))
+    return list(zip(starts, starts[1:] + [len(text)]))
+
+def section_of(sections, pos):
+    """Index of the section containing a character position (positions past the end map to the last one)."""
+    return max(0, bisect_right([start for start, _ in sections], pos) - 1)
+
+def get_entity_sections(text, entities, sections=None):
+    """
+    Section indices of a note's entities.
+
+    Args:
+        text (str): The clinical note text.
+        entities (tuple): (diagnoses, dates) as (name, position) and (parsed_date, raw_date, position) tuples.
+        sections (list, optional): split_sections() output, if already computed.
+
+    Returns:
+        tuple: (diagnosis_sections, date_sections) lists, parallel to the entity lists.
+    """
+    diagnoses, dates = entities
+    sections = sections if sections is not None else split_sections(text)
+    return (
+        [section_of(sections, pos) for _, pos in diagnoses],
+        [section_of(sections, pos) for _, _, pos in dates]
+    )
+
+def in_section_window(diagnosis_section, date_section, section_window):
+    """Whether a diagnosis and date may be paired (always True without a section window)."""
+    return section_window is None or abs(diagnosis_section - date_section) <= section_window
+
+def restrict_entities_to_sections(text, diagnoses, dates, section_window, sections=None):
+    """
+    Drop the entities that have no candidate partner within the section window.
+
+    Used for prompts, where all of a note's dates are offered to every diagnosis: dates that
+    no diagnosis may be paired with, and diagnoses without any such date, are left out.
+
+    Returns:
+        tuple: (diagnoses, dates) with the unpairable entities removed.
+    """
+    if section_window is None or not diagnoses or not dates:
+        return diagnoses, dates
+    diagnosis_sections, date_sections = get_entity_sections(text, (diagnoses, dates), sections)
+    kept_diagnoses = [
+        diagnosis for diagnosis, diagnosis_section in zip(diagnoses, diagnosis_sections)
+        if any(in_section_window(diagnosis_section, date_section, section_window) for date_section in date_sections)
+    ]
+    kept_dates = [
+        date for date, date_section in zip(dates, date_sections)
+        if any(in_section_window(diagnosis_section, date_section, section_window) for diagnosis_section in diagnosis_sections)
+    ]
+    return kept_diagnoses, kept_dates
@@ -0,0 +1,153 @@
+# utils/settings.py
+"""
+Immutable run settings layered over config.py.
+
+Values are resolved in order of increasing precedence:
+    1. config.py defaults (all upper-case names)
+    2. environment variables named PITUITARY_<NAME>, e.g. PITUITARY_DATA_SOURCE=imaging
+    3. explicit overrides, e.g. from main.py command-line flags
+
+A Settings object exposes the same attribute names as the config module, so it can be
+passed anywhere `config` was passed before (extractors, get_data_path, load_and_prepare_data).
+"""
+import os
+import ast
+from types import MappingProxyType
+
+import config
+
+ENV_PREFIX = 'PITUITARY_'
+
+_TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+_FALSE_VALUES = {'0', 'false', 'no', 'off'}
+
+def parse_setting_value(raw, default=None):
+    """
+    Convert a string (from an environment variable or `--set NAME=VALUE`) to the type
+    of the setting's default value.
+
+    Args:
+        raw (str): The raw string value.
+        default: The current value of the setting, used to pick the target type.
+
+    Returns:
+        The parsed value.
+
+    Raises:
+        ValueError: If the string cannot be converted to the default's type.
+    """
+    if isinstance(default, bool):
+        value = raw.strip().lower()
+        if value in _TRUE_VALUES:
+            return True
+        if value in _FALSE_VALUES:
+            return False
+        raise ValueError(f"Expected a boolean value, got '{raw}'")
+    if isinstance(default, int):
+        return int(raw)
+    if isinstance(default, float):
+        return float(raw)
+    if isinstance(default, str):
+        return raw
+    if isinstance(default, (list, tuple, dict)) or default is None:
+        # Python literals, falling back to a comma-separated list for list settings
+        try:
+            return ast.literal_eval(raw)
+        except (ValueError, SyntaxError):
+            if isinstance(default, (list, tuple)):
+                return [item.strip() for item in raw.split(',') if item.strip()]
+            return raw
+    # Other types (e.g. torch.device) are constructed from the string
+    return type(default)(raw)
+
+class Settings:
+    """
+    Read-only, attribute-style view of the resolved run settings.
+
+    Use replace() to derive a new Settings object with some values changed.
+    """
+
+    def __init__(self, values):
+        object.__setattr__(self, '_values', MappingProxyType(dict(values)))
+
+    def __getattr__(self, name):
+        # Private names are never settings (also keeps pickling/copying well-behaved)
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(f"Setting '{name}' is not defined") from None
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Settings are immutable; use replace() to derive new settings")
+
+    def __delattr__(self, name):
+        raise AttributeError("Settings are immutable; use replace() to derive new settings")
+
+    def __getstate__(self):
+        return dict(self._values)
+
+    def __setstate__(self, state):
+        object.__setattr__(self, '_values', MappingProxyType(dict(state)))
+
+    def __contains__(self, name):
+        return name in self._values
+
+    def __repr__(self):
+        return f"Settings({len(self._values)} values)"
+
+    def replace(self, **overrides):
+        """Return a copy of these settings with the given values overridden."""
+        values = dict(self._values)
+        values.update(overrides)
+        return Settings(values)
+
+    def as_dict(self):
+        """Return the settings as a plain dict."""
+        return dict(self._values)
+
+def config_defaults(config_module=config):
+    """Collect the upper-case settings defined in a config module."""
+    return {name: getattr(config_module, name) for name in dir(config_module) if name.isupper()}
+
+def env_overrides(defaults, environ=None):
+    """
+    Collect PITUITARY_<NAME> environment variables for known settings.
+
+    Args:
+        defaults (dict): Current setting values, used to parse each variable.
+        environ (dict, optional): Environment to read (defaults to os.environ).
+
+    Returns:
+        dict: Parsed overrides keyed by setting name.
+    """
+    environ = os.environ if environ is None else environ
+    overrides = {}
+    for key, raw in environ.items():
+        if not key.startswith(ENV_PREFIX):
+            continue
+        name = key[len(ENV_PREFIX):]
+        if name not in defaults:
+            print(f"Warning: Ignoring environment variable {key}: '{name}' is not a setting in config.py")
+            continue
+        overrides[name] = parse_setting_value(raw, defaults[name])
+    return overrides
+
+def load_settings(overrides=None, environ=None, config_module=config):
+    """
+    Resolve the run settings: config.py defaults < environment variables < overrides.
+
+    Args:
+        overrides (dict, optional): Explicit values (e.g. from CLI flags). None values are ignored.
+        environ (dict, optional): Environment to read (defaults to os.environ).
+        config_module: Module providing the defaults (defaults to config.py).
+
+    Returns:
+        Settings: The resolved, immutable settings.
+    """
+    values = config_defaults(config_module)
+    values.update(env_overrides(values, environ))
+    if overrides:
+        values.update({name: value for name, value in overrides.items() if value is not None})
+    return Settings(values)
@@ -0,0 +1,348 @@
+# utils/structured_output_utils.py
+"""
+Structured (schema-constrained) output for the LLM-based extractors.
+
+Both extractors ask for one JSON object per related diagnosis:
+    {"diagnosis": <one of the note's diagnoses>, "date": <one of the note's raw dates>, "confidence": <0-1>}
+
+- OpenAI: relationship_response_format() builds a strict `json_schema` response_format
+  whose enums are the note's diagnoses and raw dates.
+- Local Llama: RelationshipArrayConstraint drives `prefix_allowed_tokens_fn`, so the
+  model can only emit a JSON array of such objects (each diagnosis at most once) and
+  must stop once the array is closed.
+"""
+import json
+
+# Confidence values the constrained Llama decoder may emit
+CONFIDENCE_LEVELS = ['0.1', '0.2', '0.3', '0.4', '0.5', '0.6', '0.7', '0.8', '0.9', '1.0']
+
+def _unique(values):
+    """Unique values in first-seen order."""
+    return list(dict.fromkeys(values))
+
+def relationship_array_schema(diagnosis_names, raw_dates):
+    """
+    JSON schema of one note's relationship array.
+
+    Args:
+        diagnosis_names (list): Diagnosis labels (or IDs) the model may choose from.
+        raw_dates (list): Raw date strings (or IDs) the model may choose from.
+
+    Returns:
+        dict: The JSON schema.
+    """
+    return {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "diagnosis": {"type": "string", "enum": _unique(diagnosis_names)},
+                "date": {"type": "string", "enum": _unique(raw_dates)},
+                "confidence": {"type": "number"}
+            },
+            "required": ["diagnosis", "date", "confidence"],
+            "additionalProperties": False
+        }
+    }
+
+def relationship_schema(diagnosis_names, raw_dates):
+    """
+    JSON schema of the relationship output for one note.
+
+    OpenAI structured outputs need an object at the top level, so the array is
+    wrapped as {"relationships": [...]}.
+
+    Args:
+        diagnosis_names (list): Diagnosis labels the model may choose from.
+        raw_dates (list): Raw date strings the model may choose from.
+
+    Returns:
+        dict: The JSON schema.
+    """
+    return {
+        "type": "object",
+        "properties": {"relationships": relationship_array_schema(diagnosis_names, raw_dates)},
+        "required": ["relationships"],
+        "additionalProperties": False
+    }
+
+def relationship_response_format(diagnosis_names, raw_dates):
+    """OpenAI `response_format` enforcing relationship_schema() (strict mode)."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "diagnosis_date_relationships",
+            "strict": True,
+            "schema": relationship_schema(diagnosis_names, raw_dates)
+        }
+    }
+
+def packed_relationship_response_format(choices_by_note):
+    """
+    OpenAI `response_format` for several notes in one request.
+
+    Args:
+        choices_by_note (dict): Note key (e.g. "1") -> (diagnosis_names, raw_dates) for that note.
+
+    Returns:
+        dict: Strict json_schema response_format for {"<note key>": [relationships], ...}.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "diagnosis_date_relationships_by_note",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    key: relationship_array_schema(diagnosis_names, raw_dates)
+                    for key, (diagnosis_names, raw_dates) in choices_by_note.items()
+                },
+                "required": list(choices_by_note),
+                "additionalProperties": False
+            }
+        }
+    }
+
+def combined_response_format(diagnosis_names):
+    """
+    OpenAI `response_format` for combined relative date and relationship extraction.
+
+    Relationship dates are free strings, since they can be date IDs or relative date
+    phrases found in the same response.
+
+    Args:
+        diagnosis_names (list): Diagnosis labels (or IDs) the model may choose from.
+
+    Returns:
+        dict: Strict json_schema response_format for
+              {"relative_dates": [{"phrase", "start_index", "calculated_date"}], "relationships": [...]}.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "relative_dates_and_relationships",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "relative_dates": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "phrase": {"type": "string"},
+                                "start_index": {"type": "integer"},
+                                "calculated_date": {"type": "string"}
+                            },
+                            "required": ["phrase", "start_index", "calculated_date"],
+                            "additionalProperties": False
+                        }
+                    },
+                    "relationships": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "diagnosis": {"type": "string", "enum": _unique(diagnosis_names)},
+                                "date": {"type": "string"},
+                                "confidence": {"type": "number"}
+                            },
+                            "required": ["diagnosis", "date", "confidence"],
+                            "additionalProperties": False
+                        }
+                    }
+                },
+                "required": ["relative_dates", "relationships"],
+                "additionalProperties": False
+            }
+        }
+    }
+
+def normalize_relationships(relationships, default_confidence=1.0):
+    """
+    Keep well-formed relationship dicts and convert their confidences to float.
+
+    Args:
+        relationships (list): Parsed relationship objects.
+        default_confidence (float): Confidence for objects without a usable value.
+
+    Returns:
+        list: The cleaned relationship dicts ([] if `relationships` is not a list).
+    """
+    if not isinstance(relationships, list):
+        return []
+    parsed = []
+    for rel in relationships:
+        if not isinstance(rel, dict) or 'diagnosis' not in rel or 'date' not in rel:
+            continue
+        try:
+            rel['confidence'] = float(rel.get('confidence', default_confidence))
+        except (ValueError, TypeError):
+            rel['confidence'] = default_confidence
+        parsed.append(rel)
+    return parsed
+
+def parse_relationships_json(response_text, default_confidence=1.0):
+    """
+    Parse relationships from structured output.
+
+    Accepts {"relationships": [...]} or a bare array. A bare array cut off by the
+    token budget is repaired by keeping its complete objects.
+
+    Args:
+        response_text (str): The model output.
+        default_confidence (float): Confidence for objects without a usable value.
+
+    Returns:
+        list: Relationship dicts with float confidences ([] if nothing could be parsed).
+    """
+    text = response_text.strip()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        last_object = text.rfind('}')
+        if not text.startswith('[') or last_object < 0:
+            print(f"Error: Could not parse structured output: {text[:100]}...")
+            return []
+        try:
+            data = json.loads(text[:last_object + 1] + ']')
+        except json.JSONDecodeError as e:
+            print(f"Error parsing structured output: {e}")
+            return []
+
+    relationships = data.get('relationships', []) if isinstance(data, dict) else data
+    return normalize_relationships(relationships, default_confidence)
+
+class _TrieNode:
+    """Token trie node; `values` are the alternatives reachable through it."""
+    __slots__ = ('children', 'value', 'values')
+
+    def __init__(self):
+        self.children = {}
+        self.value = _TrieNode  # Sentinel: no alternative ends here
+        self.values = set()
+
+def _build_trie(alternatives):
+    """Build a token trie from (token_ids, value) pairs."""
+    root = _TrieNode()
+    for token_ids, value in alternatives:
+        node = root
+        node.values.add(value)
+        for token_id in token_ids:
+            node = node.children.setdefault(token_id, _TrieNode())
+            node.values.add(value)
+        node.value = value
+    return root
+
+# Decoder states
+_START, _DATE, _CONFIDENCE, _AFTER_ITEM, _DONE = range(5)
+
+class RelationshipArrayConstraint:
+    """
+    Token-level grammar for one note's relationship array, for `prefix_allowed_tokens_fn`.
+
+    The output is forced into
+        [{"diagnosis": "<diagnosis>", "date": "<raw date>", "confidence": <level>}, ...]
+    with every diagnosis used at most once, followed by the end-of-sequence token.
+    Each alternative ends with the delimiter that follows it, so no alternative is a
+    prefix of another and the trie walk is unambiguous.
+    """
+
+    def __init__(self, tokenizer, diagnosis_names, raw_dates, confidence_levels=CONFIDENCE_LEVELS):
+        """
+        Args:
+            tokenizer: The model's tokenizer.
+            diagnosis_names (list): Diagnosis labels the model may choose from.
+            raw_dates (list): Raw date strings the model may choose from.
+            confidence_levels (list): Confidence strings the model may choose from.
+        """
+        def encode(text):
+            return tuple(tokenizer(text, add_special_tokens=False)['input_ids'])
+
+        diagnosis_names = _unique(diagnosis_names)
+        self.num_diagnoses = len(diagnosis_names)
+
+        # Opening an item includes the diagnosis; None marks closing the array
+        def item_alternatives(opening, closing):
+            alternatives = [(encode(f'{opening}{{"diagnosis": {json.dumps(name)}, "date": '), name) for name in diagnosis_names]
+            alternatives.append((encode(closing), None))
+            return alternatives
+
+        self._tries = {
+            _START: _build_trie(item_alternatives('[', '[]')),
+            _DATE: _build_trie([(encode(f'{json.dumps(date)}, "confidence": '), date) for date in _unique(raw_dates)]),
+            _CONFIDENCE: _build_trie([(encode(f'{level}}}'), level) for level in confidence_levels]),
+            _AFTER_ITEM: _build_trie(item_alternatives(', ', ']'))
+        }
+        self._max_lengths = {state: self._max_depth(trie) for state, trie in self._tries.items()}
+
+        eos = tokenizer.eos_token_id
+        eos_ids = list(eos) if isinstance(eos, (list, tuple)) else [eos]
+        pad = tokenizer.pad_token_id
+        self._done_tokens = _unique(eos_ids + ([pad] if pad is not None else []))
+
+        self._prompt_length = None
+        self._consumed = 0
+        self._state = _START
+        self._node = self._tries[_START]
+        self._used = set()
+
+    @staticmethod
+    def _max_depth(node):
+        return max((1 + RelationshipArrayConstraint._max_depth(child) for child in node.children.values()), default=0)
+
+    def max_new_tokens(self):
+        """Upper bound on generated tokens for a complete array (plus end-of-sequence)."""
+        per_item = max(self._max_lengths[_START], self._max_lengths[_AFTER_ITEM]) + \
+            self._max_lengths[_DATE] + self._max_lengths[_CONFIDENCE]
+        return self.num_diagnoses * per_item + self._max_lengths[_AFTER_ITEM] + 1
+
+    def _advance(self, token_id):
+        node = self._node.children.get(token_id)
+        if node is None:
+            self._state = _DONE
+            return
+        if node.value is _TrieNode:
+            self._node = node
+            return
+        value = node.value
+        if self._state in (_START, _AFTER_ITEM):
+            if value is None:
+                self._state = _DONE
+                return
+            self._used.add(value)
+            self._state = _DATE
+        elif self._state == _DATE:
+            self._state = _CONFIDENCE
+        else:
+            self._state = _AFTER_ITEM
+        self._node = self._tries[self._state]
+
+    def allowed_tokens(self, input_ids):
+        """
+        Token ids allowed after `input_ids` (prompt + tokens generated so far).
+
+        The first call's length is taken as the prompt length; later calls consume
+        the newly generated tokens.
+        """
+        input_ids = input_ids.tolist() if hasattr(input_ids, 'tolist') else list(input_ids)
+        if self._prompt_length is None:
+            self._prompt_length = len(input_ids)
+        for token_id in input_ids[self._prompt_length + self._consumed:]:
+            if self._state != _DONE:
+                self._advance(token_id)
+            self._consumed += 1
+
+        if self._state == _DONE:
+            return self._done_tokens
+        if self._state in (_START, _AFTER_ITEM):
+            # Only continue towards diagnoses that have not been used yet (or closing the array)
+            return [token_id for token_id, child in self._node.children.items() if child.values - self._used]
+        return list(self._node.children)
+
+def batch_prefix_allowed_tokens_fn(constraints):
+    """Combine per-note constraints (in batch row order) into a `prefix_allowed_tokens_fn`."""
+    def prefix_allowed_tokens_fn(batch_id, input_ids):
+        return constraints[batch_id].allowed_tokens(input_ids)
+    return prefix_allowed_tokens_fn
@@ -2,13 +2,17 @@ import json
 import sys
 import os
 import re
+import random
 import torch
 import numpy as np
-import matplotlib.pyplot as plt
+from torch.utils.data import DataLoader, RandomSampler
 import config # Import the config module
 
 # Add parent directory to path to allow importing from models
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data.JsonlNoteDataset import JsonlNoteDataset, is_jsonl_path
+from utils.reporting_utils import queue_plot, finish_plots
+from utils.segmentation_utils import get_entity_sections, in_section_window
 
 # Clean and preprocess text for model input
 def preprocess_text(text):
@@ -26,7 +30,8 @@ def load_and_prepare_data(file_or_dataset, MAX_DISTANCE, VocabClass=None):
     Loads and prepares data for model training.
     
     Args:
-        file_or_dataset: Either a file path to a JSON dataset or the dataset itself
+        file_or_dataset: Either a file path to a JSON / JSON Lines dataset or the dataset
+            itself (any iterable of entries, e.g. a JsonlNoteDataset view)
         MAX_DISTANCE: Maximum distance (in characters) between diagnosis and date to include
         VocabClass: Optional vocabulary class to build vocabulary
         
@@ -34,7 +39,10 @@ def load_and_prepare_data(file_or_dataset, MAX_DISTANCE, VocabClass=None):
         tuple: (features, labels, vocab) - processed data and vocabulary instance
     """
     # VocabClass is optional, only used if we need to build the vocab here
-    if isinstance(file_or_dataset, str):
+    if isinstance(file_or_dataset, str) and is_jsonl_path(file_or_dataset):
+        # It's a JSON Lines file path - stream the entries instead of loading the whole file
+        dataset = JsonlNoteDataset(file_or_dataset)
+    elif isinstance(file_or_dataset, str):
         # It's a file path
         with open(file_or_dataset, 'r') as f:
             dataset = json.load(f)
@@ -129,34 +137,203 @@ def load_and_prepare_data(file_or_dataset, MAX_DISTANCE, VocabClass=None):
     # Return vocab instance only if it was created
     return all_features, all_labels, vocab if VocabClass else None
 
+def seed_everything(seed):
+    """Seed Python, NumPy and PyTorch (CPU and CUDA) random number generators."""
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    if torch.cuda.is_available():
+        torch.cuda.manual_seed_all(seed)
+
+def get_rng_state(generator=None):
+    """
+    Capture the random number generator states (for checkpoints).
+
+    Args:
+        generator (torch.Generator, optional): DataLoader shuffling generator.
+
+    Returns:
+        dict: Python, NumPy, PyTorch CPU/CUDA and generator states.
+    """
+    return {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+        'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+        'generator': generator.get_state() if generator is not None else None
+    }
+
+def set_rng_state(state, generator=None):
+    """Restore random number generator states captured by get_rng_state()."""
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if state.get('cuda') is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+    if generator is not None and state.get('generator') is not None:
+        generator.set_state(state['generator'])
+
+def create_data_loaders(train_dataset, val_dataset, batch_size, device, num_workers=0, seed=42):
+    """
+    Create the training and validation DataLoaders.
+
+    Batches are prepared by num_workers worker processes (kept alive across epochs) and
+    copied from pinned memory when training on CUDA. Shuffling uses its own seeded
+    generator, so a resumed run sees the same batch order as an uninterrupted one.
+
+    Args:
+        train_dataset (Dataset): Training examples (shuffled).
+        val_dataset (Dataset): Validation examples.
+        batch_size (int): Examples per batch.
+        device: Training device.
+        num_workers (int): DataLoader worker processes (0 loads batches in the main process).
+        seed (int): Seed of the shuffling generator.
+
+    Returns:
+        tuple: (train_loader, val_loader, generator)
+    """
+    # The shuffling generator is only drawn from once per epoch; worker seeds come from a
+    # separate generator, since the loader draws them whenever workers are (re)started
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    worker_generator = torch.Generator()
+    worker_generator.manual_seed(seed)
+    loader_kwargs = {
+        'batch_size': batch_size,
+        'num_workers': num_workers,
+        'pin_memory': torch.device(device).type == 'cuda',
+        'persistent_workers': num_workers > 0,
+        'generator': worker_generator
+    }
+    train_loader = DataLoader(train_dataset, sampler=RandomSampler(train_dataset, generator=generator), **loader_kwargs)
+    val_loader = DataLoader(val_dataset, **loader_kwargs)
+    return train_loader, val_loader, generator
+
+def save_checkpoint(path, checkpoint):
+    """Save a training checkpoint (written to a temporary file first so an interrupted save keeps the old one)."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    torch.save(checkpoint, tmp_path)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path, model, optimizer, device, generator=None, num_train_examples=None, training_params=None):
+    """
+    Restore model, optimizer, RNG states and training progress from a checkpoint.
+
+    Checkpoints of finished runs (all epochs done or stopped early) and checkpoints made
+    with a different training set size or different training_params are not resumed.
+
+    Returns:
+        dict or None: The checkpoint (epoch, history, early stopping state), or None if
+                      there is no usable checkpoint and training should start from scratch.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        checkpoint = torch.load(path, map_location=device, weights_only=False)
+        if checkpoint.get('completed'):
+            print(f"Checkpoint {path} is from a finished training run; starting from scratch")
+            return None
+        if num_train_examples is not None and checkpoint.get('num_train_examples') != num_train_examples:
+            print(f"Warning: Checkpoint {path} was made with a different training set; starting from scratch")
+            return None
+        if training_params is not None and checkpoint.get('training_params') != training_params:
+            stored = checkpoint.get('training_params') or {}
+            changed = sorted(name for name in set(stored) | set(training_params) if stored.get(name) != training_params.get(name))
+            print(f"Warning: Checkpoint {path} was made with different training parameters "
+                  f"({', '.join(changed)}); starting from scratch")
+            return None
+        model.load_state_dict(checkpoint['model'])
+        optimizer.load_state_dict(checkpoint['optimizer'])
+        set_rng_state(checkpoint['rng'], generator)
+    except Exception as e:
+        print(f"Warning: Could not resume from checkpoint {path}: {e}; starting from scratch")
+        return None
+    print(f"Resuming training from {path} after epoch {checkpoint['epoch'] + 1}")
+    return checkpoint
+
+def _move_batch(batch, device, non_blocking=False):
+    return (
+        batch['context'].to(device, non_blocking=non_blocking),
+        batch['distance'].to(device, non_blocking=non_blocking),
+        batch['diag_before'].to(device, non_blocking=non_blocking),
+        batch['label'].to(device, non_blocking=non_blocking)
+    )
+
 # Training function
-def train_model(model, train_loader, val_loader, optimizer, criterion, epochs, device, model_save_path):
+def train_model(model, train_loader, val_loader, optimizer, criterion, epochs, device, model_save_path,
+                accumulation_steps=1, bf16_autocast=False, early_stopping_patience=0, early_stopping_min_delta=0.0,
+                checkpoint_path=None, resume=False, generator=None, training_params=None):
+    """
+    Train the relation model, keeping the weights with the best validation accuracy.
+
+    Args:
+        model (nn.Module): The model (already on device).
+        train_loader (DataLoader): Training batches.
+        val_loader (DataLoader): Validation batches.
+        optimizer: Optimizer over the model parameters.
+        criterion: Loss function on the model's probabilities (e.g. nn.BCELoss).
+        epochs (int): Maximum number of epochs.
+        device: Training device.
+        model_save_path (str): Where the best weights (state dict) are saved.
+        accumulation_steps (int): Batches whose gradients are summed per optimizer step.
+        bf16_autocast (bool): Run the forward pass under bfloat16 autocast (the loss is
+            computed in float32).
+        early_stopping_patience (int): Stop after this many epochs without a validation loss
+            improvement of more than early_stopping_min_delta (0 disables early stopping).
+        early_stopping_min_delta (float): Minimum validation loss decrease counted as improvement.
+        checkpoint_path (str, optional): Where a full checkpoint (model, optimizer, epoch, RNG
+            states, history) is saved after every epoch.
+        resume (bool): Continue from checkpoint_path if it holds an unfinished run.
+        generator (torch.Generator, optional): The train loader's shuffling generator, saved
+            and restored with the checkpoint.
+        training_params (dict, optional): Hyperparameters saved with the checkpoint; a
+            checkpoint made with different values is not resumed.
+
+    Returns:
+        tuple: (train_losses, val_losses, val_accs) per epoch.
+    """
     # model_save_path should be the full path from config
+    device_type = torch.device(device).type
+    non_blocking = device_type == 'cuda'
+    accumulation_steps = max(1, accumulation_steps)
     train_losses = []
     val_losses = []
     val_accs = []
     best_val_acc = 0
+    best_val_loss = float('inf')
+    epochs_without_improvement = 0
+    start_epoch = 0
     
-    for epoch in range(epochs):
+    checkpoint = load_checkpoint(checkpoint_path, model, optimizer, device, generator,
+                                 len(train_loader.dataset), training_params) if resume else None
+    if checkpoint is not None:
+        start_epoch = checkpoint['epoch'] + 1
+        train_losses, val_losses, val_accs = checkpoint['train_losses'], checkpoint['val_losses'], checkpoint['val_accs']
+        best_val_acc = checkpoint['best_val_acc']
+        best_val_loss = checkpoint['best_val_loss']
+        epochs_without_improvement = checkpoint['epochs_without_improvement']
+    
+    for epoch in range(start_epoch, epochs):
         # Training
         model.train()
         train_loss = 0
+        optimizer.zero_grad()
         
-        for batch in train_loader:
+        for step, batch in enumerate(train_loader):
             # Move tensors to device
-            context = batch['context'].to(device)
-            distance = batch['distance'].to(device)
-            diag_before = batch['diag_before'].to(device)
-            labels = batch['label'].to(device)
+            context, distance, diag_before, labels = _move_batch(batch, device, non_blocking)
             
             # Forward pass
-            optimizer.zero_grad()
-            outputs = model(context, distance, diag_before)
-            loss = criterion(outputs, labels)
+            with torch.autocast(device_type=device_type, dtype=torch.bfloat16, enabled=bf16_autocast):
+                outputs = model(context, distance, diag_before)
+            loss = criterion(outputs.float(), labels)
             
-            # Backward pass and optimize
-            loss.backward()
-            optimizer.step()
+            # Backward pass; step once per accumulation_steps batches (and at the end of the epoch)
+            (loss / accumulation_steps).backward()
+            if (step + 1) % accumulation_steps == 0 or step + 1 == len(train_loader):
+                optimizer.step()
+                optimizer.zero_grad()
             
             train_loss += loss.item()
         
@@ -172,13 +349,12 @@ def train_model(model, train_loader, val_loader, optimizer, criterion, epochs, d
         with torch.no_grad():
             for batch in val_loader:
                 # Move tensors to device
-                context = batch['context'].to(device)
-                distance = batch['distance'].to(device)
-                diag_before = batch['diag_before'].to(device)
-                labels = batch['label'].to(device)
+                context, distance, diag_before, labels = _move_batch(batch, device, non_blocking)
                 
                 # Forward pass
-                outputs = model(context, distance, diag_before)
+                with torch.autocast(device_type=device_type, dtype=torch.bfloat16, enabled=bf16_autocast):
+                    outputs = model(context, distance, diag_before)
+                outputs = outputs.float()
                 loss = criterion(outputs, labels)
                 
                 val_loss += loss.item()
@@ -202,56 +378,99 @@ def train_model(model, train_loader, val_loader, optimizer, criterion, epochs, d
             torch.save(model.state_dict(), model_save_path)
         
         print(f'Epoch {epoch+1}/{epochs}, Train Loss: {train_loss:.4f}, Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.2f}%')
+        
+        # Early stopping on validation loss
+        if val_loss < best_val_loss - early_stopping_min_delta:
+            best_val_loss = val_loss
+            epochs_without_improvement = 0
+        else:
+            epochs_without_improvement += 1
+        stopped_early = early_stopping_patience > 0 and epochs_without_improvement >= early_stopping_patience
+        
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, {
+                'epoch': epoch,
+                'model': model.state_dict(),
+                'optimizer': optimizer.state_dict(),
+                'rng': get_rng_state(generator),
+                'train_losses': train_losses,
+                'val_losses': val_losses,
+                'val_accs': val_accs,
+                'best_val_acc': best_val_acc,
+                'best_val_loss': best_val_loss,
+                'epochs_without_improvement': epochs_without_improvement,
+                'stopped_early': stopped_early,
+                # A finished run is not resumed; the next run starts from scratch
+                'completed': stopped_early or epoch + 1 == epochs,
+                'num_train_examples': len(train_loader.dataset),
+                'training_params': training_params
+            })
+        
+        if stopped_early:
+            print(f"Early stopping: validation loss has not improved for {epochs_without_improvement} epochs")
+            break
     
     return train_losses, val_losses, val_accs
 
 # Plot training progress
-def plot_training_curves(train_losses, val_losses, val_accs, save_path):
+def plot_training_curves(train_losses, val_losses, val_accs, save_path, plot_mode=None):
+    """
+    Queue the training/validation curves plot and render it according to the plot mode.
+
+    Args:
+        train_losses (list): Training loss per epoch.
+        val_losses (list): Validation loss per epoch.
+        val_accs (list): Validation accuracy (%) per epoch.
+        save_path (str): Model path; the plot is saved next to it as <name>_training_curves.png.
+        plot_mode (str, optional): 'background', 'inline' or 'deferred' (defaults to config.PLOT_MODE).
+    """
     # Get the directory path and create a proper image path
     dir_path = os.path.dirname(save_path)
     base_name = os.path.splitext(os.path.basename(save_path))[0]
     plot_path = os.path.join(dir_path, f"{base_name}_training_curves.png")
-    
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 5))
-    
-    # Plot losses
-    epochs = range(1, len(train_losses) + 1)
-    ax1.plot(epochs, train_losses, 'b-', label='Training Loss')
-    ax1.plot(epochs, val_losses, 'r-', label='Validation Loss')
-    ax1.set_title('Training and Validation Loss')
-    ax1.set_xlabel('Epochs')
-    ax1.set_ylabel('Loss')
-    ax1.legend()
-    
-    # Plot accuracy
-    ax2.plot(epochs, val_accs, 'g-')
-    ax2.set_title('Validation Accuracy')
-    ax2.set_xlabel('Epochs')
-    ax2.set_ylabel('Accuracy (%)')
-    
-    plt.tight_layout()
-    # Ensure directory exists before saving plot
-    os.makedirs(dir_path, exist_ok=True)
-    plt.savefig(plot_path)
-    plt.show()
-    
-    print(f"Training curves saved to {plot_path}")
 
-def preprocess_note_for_prediction(note, MAX_DISTANCE=500):
-    """Extract and preprocess features from a clinical note for prediction"""
-    # Import locally to avoid circular imports
-    from utils.extraction_utils import extract_entities
+    queue_plot('training_curves', {
+        'train_losses': [float(loss) for loss in train_losses],
+        'val_losses': [float(loss) for loss in val_losses],
+        'val_accs': [float(acc) for acc in val_accs]
+    }, plot_path)
+    print(f"Training curves queued for {plot_path}")
+    finish_plots(dir_path or '.', plot_mode or getattr(config, 'PLOT_MODE', 'background'))
+
+def preprocess_note_for_prediction(note, MAX_DISTANCE=500, entities=None, section_window=None):
+    """
+    Extract and preprocess features from a clinical note for prediction.
+
+    Args:
+        note (str): The clinical note text.
+        MAX_DISTANCE (int): Maximum character distance between a diagnosis and a date.
+        entities (tuple, optional): (diagnoses, dates) if already extracted; otherwise
+            they are extracted from the note text.
+        section_window (int, optional): Only pair entities at most this many note sections
+            apart (0 = same section); None considers all pairs within MAX_DISTANCE.
+
+    Returns:
+        list: One feature dict per candidate diagnosis-date pair.
+    """
+    if entities is None:
+        # Import locally to avoid circular imports
+        from utils.extraction_utils import extract_entities
+        diagnoses, dates = extract_entities(note)
+    else:
+        diagnoses, dates = entities
     
-    # Extract entities
-    diagnoses, dates = extract_entities(note)
+    if section_window is not None:
+        diagnosis_sections, date_sections = get_entity_sections(note, (diagnoses, dates))
+    else:
+        diagnosis_sections, date_sections = [0] * len(diagnoses), [0] * len(dates)
     
     # Build features for each diagnosis-date pair
     features = []
-    for diagnosis, diag_pos in diagnoses:
+    for (diagnosis, diag_pos), diagnosis_section in zip(diagnoses, diagnosis_sections):
         # Correctly unpack the 3-element tuple from the dates list
-        for parsed_date, date_str, date_pos in dates:
+        for (parsed_date, date_str, date_pos), date_section in zip(dates, date_sections):
             distance = abs(diag_pos - date_pos)
-            if distance > MAX_DISTANCE:
+            if distance > MAX_DISTANCE or not in_section_window(diagnosis_section, date_section, section_window):
                 continue
                 
             start_pos = max(0, min(diag_pos, date_pos) - 50)
@@ -272,6 +491,36 @@ def preprocess_note_for_prediction(note, MAX_DISTANCE=500):
     
     return features
 
+def encode_context(context, vocab, max_context_len):
+    """Convert a preprocessed context string to a padded/truncated list of word indices."""
+    unk_idx = vocab.word2idx['<unk>']
+    context_indices = [vocab.word2idx.get(word, unk_idx) for word in context.split()[:max_context_len]]
+    context_indices.extend([0] * (max_context_len - len(context_indices)))
+    return context_indices
+
+def create_prediction_batch(features, vocab, device, max_distance, max_context_len):
+    """
+    Convert preprocessed features into stacked model-ready tensors for one batched forward pass.
+
+    Args:
+        features (list): Feature dicts from preprocess_note_for_prediction.
+        vocab: Vocabulary with a word2idx mapping.
+        device: Torch device for the tensors.
+        max_distance (int): Distance used to normalise the distance feature.
+        max_context_len (int): Context length to pad/truncate to.
+
+    Returns:
+        dict: {'context': [N, max_context_len] long, 'distance': [N] float, 'diag_before': [N] float}
+    """
+    context = torch.tensor([encode_context(f['context'], vocab, max_context_len) for f in features], dtype=torch.long)
+    distance = torch.tensor([min(f['distance'] / max_distance, 1.0) for f in features], dtype=torch.float)
+    diag_before = torch.tensor([f['diag_before_date'] for f in features], dtype=torch.float)
+    return {
+        'context': context.to(device),
+        'distance': distance.to(device),
+        'diag_before': diag_before.to(device)
+    }
+
 def create_prediction_dataset(features, vocab, device, max_distance, max_context_len):
     """Convert preprocessed features into model-ready tensors"""
     test_data = []